@@ -3,28 +3,78 @@ import argparse
 import datetime
 import logging
 import os
+import signal
 import sys
 import threading
-from cli import CLI
+from cli import CLI, log_backup, log_maintenance
 from helpers import datetime_to_string
+from journal import Journal
 from log import Log
-from session import Session
+from server import serve
+from session import LogindIdleSource, Session, TerminalIdleSource
 
 # NOTE: The builtin logging module is not to be confused with the custom Log
 # class in the log module of this package, which provides functionality for
 # interfacing with a Krono Tracker event log sqlite file.
 
+def compact_journal(log, filepath):
+    """Fold the pending journal of the log at filepath, if any, into it."""
+
+    journal = Journal(Journal.journal_filepath(filepath))
+    try:
+        num_added = journal.compact(log)
+        if num_added:
+            logging.info("Added {} journaled sessions.".format(num_added))
+    except Exception as e:
+        logging.error(e)
+
 def main():
     default_file = "krono.sqlite"
 
     ap = argparse.ArgumentParser()
     ap.add_argument("-a", "--autosave", default=60, type=int)
+    ap.add_argument("--max-autosave", metavar="SECONDS", type=int,
+                    help="Longest interval between autosaves, which the "
+                    "autosave interval backs off to (default: 10x --autosave)")
+    ap.add_argument("--backup", metavar="BACKUP_FILE",
+                    help="Back up the log and its archives while it may be "
+                    "in use, skipping files unchanged since the last backup")
+    ap.add_argument("--gzip", action="store_true",
+                    help="With --backup, compress the backup files")
+    ap.add_argument("-b", "--batch", metavar="COMMAND_FILE",
+                    help="Run CLI commands from a file (\"-\" for stdin)")
     ap.add_argument("-f", "--file", default=default_file)
     ap.add_argument("-i", "--interactive", action="store_true")
+    ap.add_argument("-j", "--journal", action="store_true",
+                    help="Record the session in a journal file instead of "
+                    "the log; journals are folded into the log when it is "
+                    "next opened to track or view sessions")
     ap.add_argument("-p", "--project", default="")
+    ap.add_argument("-q", "--query",
+                    help="With --view, show only the entries matching a "
+                    "filter query, e.g., \"project:krono -tag:review "
+                    "date:this-week dur>1h\"")
+    ap.add_argument("-r", "--read-only", action="store_true",
+                    help="With --view, open the log read-only and show the "
+                    "first entries while the rest are loaded")
     ap.add_argument("-n", "--notes", default="")
     ap.add_argument("-t", "--tags", default="")
     ap.add_argument("-v", "--view", action="store_true")
+    ap.add_argument("--idle", metavar="MINUTES", type=float,
+                    help="Split the session after this many minutes without "
+                    "activity: the login session's idle time if logind "
+                    "reports it, else the time since a key was last pressed "
+                    "in this terminal")
+    ap.add_argument("--maintain", nargs="?", const="quick",
+                    choices=("quick", "full"),
+                    help="Reclaim free space, update query statistics and "
+                    "check the integrity (\"full\" for a full check) of "
+                    "the log and its archives")
+    ap.add_argument("--serve", metavar="PORT", type=int,
+                    help="Serve the log read-only over HTTP on a local port")
+    ap.add_argument("--cache", action="store_true",
+                    help="Cache filter results in a \"-cache\" file next to "
+                    "the log")
     ap.add_argument("--debug", action="store_true")
     args = vars(ap.parse_args())
 
@@ -36,72 +86,158 @@ def main():
 
     filepath = os.path.abspath(args["file"])
 
-    if args["interactive"]:
+    if args["batch"]:
+        # Run CLI commands non-interactively, reusing a single loaded log
+        # (the --file log, if it exists) across all of them.
+        if args["batch"] == "-":
+            command_file = sys.stdin
+        else:
+            command_file = open(args["batch"])
+
+        cli = CLI(use_cache=args["cache"], stdin=command_file, batch=True)
+        if os.path.isfile(filepath):
+            cli.do_load(filepath)
+        try:
+            cli.cmdloop()
+        finally:
+            if command_file is not sys.stdin:
+                command_file.close()
+        if cli.num_failed:
+            logging.error("{} command(s) failed.".format(cli.num_failed))
+            sys.exit(1)
+    elif args["interactive"]:
         # If interactive mode chosen, enter curses-based command line
         # interface via CLI class.
-        CLI().cmdloop()
+        CLI(use_cache=args["cache"]).cmdloop()
+    elif args["backup"]:
+        try:
+            log = Log()
+            log.load_db(filepath, read_only=True)
+            try:
+                log_backup(log.backup(os.path.abspath(args["backup"]),
+                                      compress=args["gzip"]))
+            finally:
+                log.unload_db()
+        except Exception as e:
+            logging.error(e)
+    elif args["maintain"]:
+        try:
+            log = Log()
+            log.load_db(filepath)
+            try:
+                log_maintenance(
+                        log.maintain(full_check=args["maintain"] == "full"))
+            finally:
+                log.unload_db()
+        except Exception as e:
+            logging.error(e)
+    elif args["serve"] is not None:
+        try:
+            serve(filepath, port=args["serve"])
+        except Exception as e:
+            logging.error(e)
     elif args["view"]:
         # If view chosen, view using Log.view() curses interface.
         try:
             log = Log()
-            log.load_db(filepath)
-            log.select_all()
-            log.view()
+            if args["read_only"]:
+                log.load_db(filepath, read_only=True)
+            else:
+                log.load_db(filepath)
+                compact_journal(log, filepath)
+                if args["cache"]:
+                    try:
+                        log.enable_cache()
+                    except Exception as e:
+                        logging.warning("Result cache disabled: {}".format(e))
+            if args["query"]:
+                log.set_query(args["query"])
+            log.view(stream=args["read_only"])
             log.unload_db()
         except Exception as e:
             logging.error(e)
     else:
-        # Instantiate Log object. Create DB if necessary, else load existing.
-        log = Log()
-        if not os.path.isfile(filepath):
-            logging.info("Creating database file {}".format(filepath))
-            try:
-                log.create_db(filepath)
-            except Exception as e:
-                logging.error(e)
+        if args["journal"]:
+            # Fast path: append to the journal without opening the DB.
+            log = Journal(Journal.journal_filepath(filepath))
         else:
-            try:
-                log.load_db(filepath)
-                logging.info("Loaded database file {}".format(filepath))
-            except Exception as e:
-                logging.error(e)
+            # Instantiate Log object. Create DB if necessary, else load
+            # existing.
+            log = Log()
+            if not os.path.isfile(filepath):
+                logging.info("Creating database file {}".format(filepath))
+                try:
+                    log.create_db(filepath)
+                except Exception as e:
+                    logging.error(e)
+            else:
+                try:
+                    log.load_db(filepath)
+                    logging.info("Loaded database file {}".format(filepath))
+                except Exception as e:
+                    logging.error(e)
+                compact_journal(log, filepath)
 
-        # Add new row to end of DB with current datetime as start time.
-        start_time = datetime.datetime.now()
-        log.add_row({
-                "start": datetime_to_string(start_time),
+        # Add new row to end of DB with current datetime as start time. Its
+        # id is used to periodically update DB with new end time in Session
+        # thread, which also writes the final end time when stopped.
+        row_params = {
                 "project": args["project"],
                 "tags": args["tags"],
-                "notes": args["notes"]})
-
-        # Get id of last row added. This will be used to periodically update
-        # DB with new end time in Session thread, as well as at the end of
-        # this function (__main__.main()).
-        last_row_id = log.get_last_row_id()
+                "notes": args["notes"]}
+        start_time = datetime.datetime.now()
+        last_row_id = log.add_row(dict(
+            row_params, start=datetime_to_string(start_time)))
 
         # Use lock to manage access to DB between this and Session threads.
         db_lock = threading.Lock()
+        terminal = None
+        if args["idle"]:
+            # Prefer the login session's idle state, which reflects activity
+            # anywhere in the session; otherwise, watch for keypresses in
+            # this terminal, which is then read in non-canonical mode.
+            idle_source = LogindIdleSource.detect()
+            if idle_source is None:
+                terminal = idle_source = TerminalIdleSource()
+                terminal.start()
+            idle_options = {
+                    "idle_source": idle_source,
+                    "idle_threshold": args["idle"] * 60,
+                    "row_params": row_params}
+        else:
+            idle_options = {}
         sess = Session(log, last_row_id,
-                       autosave_interval=int(args["autosave"]), lock=db_lock)
+                       autosave_interval=int(args["autosave"]), lock=db_lock,
+                       max_autosave_interval=args["max_autosave"],
+                       **idle_options)
         sess.start()
 
-        logging.info("New session started. Press Enter to stop.")
-        if sys.version_info.major < 3:
-            raw_input()
-        else:
-            input()
+        # Write the end time on SIGTERM/SIGHUP as well as on Enter.
+        def handle_signal(signum, frame):
+            raise SystemExit(0)
+        for signal_name in ("SIGTERM", "SIGHUP"):
+            if hasattr(signal, signal_name):
+                signal.signal(getattr(signal, signal_name), handle_signal)
 
-        # Write current datetime as end time before exiting.
-        current_datetime = datetime_to_string(datetime.datetime.now())
-        
+        logging.info("New session started. Press Enter to stop.")
         try:
-            db_lock.acquire()
-            log.update_row(last_row_id, {"end": current_datetime})
-        except Exception as e:
-            logging.error(e)
+            if terminal is not None:
+                terminal.wait_for_enter()
+            elif sys.version_info.major < 3:
+                raw_input()
+            else:
+                input()
         finally:
-            db_lock.release()
-            log.unload_db()
+            if terminal is not None:
+                terminal.restore()
+
+            # Write current datetime as end time before exiting.
+            try:
+                sess.stop()
+            except Exception as e:
+                logging.error(e)
+            finally:
+                log.unload_db()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,160 @@
+import glob
+import heapq
+import multiprocessing
+import os
+import queue
+import re
+from concurrent.futures import ProcessPoolExecutor
+from log import Log
+
+def find_logs(paths):
+    """
+    @brief Expand a list of log files and/or directories into a sorted list
+        of log files.
+
+    Directories are searched (non-recursively) for "*.sqlite" and "*.db"
+    files; per-year archive files (see Log.archive()) are skipped, since
+    they are queried along with the log they belong to.
+    """
+
+    archive_pattern = re.compile(r"\.\d{4}\.(sqlite|db)$")
+    filepaths = set()
+    for path in paths:
+        if os.path.isdir(path):
+            for ext in ("*.sqlite", "*.db"):
+                for filepath in glob.glob(os.path.join(path, ext)):
+                    if not archive_pattern.search(filepath):
+                        filepaths.add(os.path.abspath(filepath))
+        else:
+            filepaths.add(os.path.abspath(path))
+    return sorted(filepaths)
+
+def query_log(filepath, filters=None, filter_mode="contain"):
+    """
+    Return the rows of a log (opened read-only) matching the given filter
+    criteria, sorted by start time.
+    """
+
+    return [row for batch in iter_log(filepath, filters, filter_mode)
+            for row in batch]
+
+def iter_log(filepath, filters=None, filter_mode="contain", batch_size=1000):
+    """
+    Yield the rows of a log (opened read-only) matching the given filter
+    criteria, sorted by start time, in lists of up to batch_size rows.
+    """
+
+    log = Log()
+    log.load_db(filepath, read_only=True)
+    try:
+        if filters is not None:
+            log.filters = dict(filters)
+        log.filter_mode = filter_mode
+        for batch in log.iter_filtered(batch_size=batch_size):
+            yield batch
+    finally:
+        log.unload_db()
+
+def _send_log(filepath, filters, filter_mode, batch_size, rows_queue):
+    """
+    Worker: put the batches of iter_log() on a queue as they are fetched,
+    followed by None, or by the exception raised.
+    """
+
+    try:
+        for batch in iter_log(filepath, filters, filter_mode, batch_size):
+            rows_queue.put(batch)
+    except Exception as e:
+        rows_queue.put(e)
+        return
+    rows_queue.put(None)
+
+def _receive_log(rows_queue, future, poll_interval=1):
+    """
+    Yield the rows a worker (see _send_log()) puts on a queue until it is
+    done, re-raising its exception, if any.
+    """
+
+    while True:
+        try:
+            batch = rows_queue.get(timeout=poll_interval)
+        except queue.Empty:
+            # The worker process may have died without putting anything.
+            if future.done():
+                future.result()
+                raise RuntimeError("Worker stopped before sending all rows.")
+            continue
+
+        if batch is None:
+            return
+        if isinstance(batch, Exception):
+            raise batch
+        for row in batch:
+            yield row
+
+def aggregate(paths, filters=None, filter_mode="contain", processes=None,
+              batch_size=1000):
+    """
+    @brief Query many logs in parallel and merge the results by start time.
+
+    Each log is queried in a separate worker process, which sends its
+    sorted rows over a queue of its own in batches as they are fetched;
+    the queues are combined with a k-way merge, so rows are yielded as soon
+    as every log has sent its first batch rather than once all logs have
+    been read.
+
+    @param paths List of log files and/or directories (see find_logs()).
+    @param filters Filter criteria (see Log.filters) applied to every log.
+    @param filter_mode "contain" or "overlap" (see Log.filter_mode).
+    @param processes Maximum number of worker processes (default: the
+        number of CPUs).
+    @param batch_size Number of rows sent by a worker at a time.
+    @return A generator of (filepath, row) tuples in order of start time.
+    """
+
+    filepaths = find_logs(paths)
+    if not filepaths:
+        return
+
+    if len(filepaths) == 1 or processes == 1:
+        tagged = [_merge_keys(filepath, (
+                      row for batch in iter_log(
+                          filepath, filters, filter_mode, batch_size)
+                      for row in batch))
+                  for filepath in filepaths]
+        for _, filepath, row in heapq.merge(*tagged):
+            yield filepath, row
+        return
+
+    # The queues are unbounded, so workers never wait on the merge and logs
+    # beyond the number of processes are queried as workers free up.
+    with multiprocessing.Manager() as manager:
+        executor = ProcessPoolExecutor(max_workers=processes)
+        futures = []
+        try:
+            tagged = []
+            for filepath in filepaths:
+                rows_queue = manager.Queue()
+                futures.append(executor.submit(
+                    _send_log, filepath, filters, filter_mode, batch_size,
+                    rows_queue))
+                tagged.append(_merge_keys(
+                    filepath, _receive_log(rows_queue, futures[-1])))
+            for _, filepath, row in heapq.merge(*tagged):
+                yield filepath, row
+        finally:
+            # If the merge was stopped early, skip the logs not yet queried.
+            for future in futures:
+                future.cancel()
+            executor.shutdown()
+
+def _merge_keys(filepath, rows):
+    """
+    Yield (start, filepath, row) tuples for heapq.merge(). Ties on start
+    time are broken by filepath; rows from the same file with the same
+    start time are then compared, which is well defined as they start with
+    their (unique) IDs.
+    """
+
+    for row in rows:
+        yield row[1] or "", filepath, row
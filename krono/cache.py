@@ -0,0 +1,113 @@
+import json
+import sqlite3
+import time
+import zlib
+
+class ResultCache:
+    """
+    Persistent, size-capped LRU cache of query results, stored in its own
+    SQLite file. Each entry is keyed by a string (e.g., a normalized filter)
+    and tagged with the version of the DB it was computed from; an entry
+    whose version no longer matches is treated as a miss and discarded.
+    """
+
+    def __init__(self, filepath, max_size=32*1024*1024):
+        """
+        @param filepath Path to the cache file (created if necessary).
+        @param max_size Maximum total size, in bytes, of the (compressed)
+            cached results. Least recently used entries are evicted first.
+        """
+
+        self.filepath = filepath
+        self.max_size = max_size
+        self.conn = sqlite3.connect(filepath, check_same_thread=False)
+        self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY,"
+                "version,"
+                "data BLOB,"
+                "size INTEGER,"
+                "last_used REAL)")
+        self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS results_last_used "
+                "ON results (last_used)")
+        self.conn.commit()
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+        self.conn = None
+
+    def get(self, key, version):
+        """
+        Return the cached rows (a list of tuples) for the given key and DB
+        version, or None if there is no valid entry.
+        """
+
+        row = self.conn.execute(
+                "SELECT version, data FROM results WHERE key = ?",
+                (key,)).fetchone()
+        if row is None:
+            return None
+
+        if row[0] != version:
+            self.conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            self.conn.commit()
+            return None
+
+        self.conn.execute("UPDATE results SET last_used = ? WHERE key = ?",
+                          (time.time(), key))
+        self.conn.commit()
+        return [tuple(r) for r in json.loads(zlib.decompress(row[1]).decode())]
+
+    def put(self, key, version, rows):
+        """Store rows for the given key and DB version, evicting as needed."""
+
+        data = zlib.compress(json.dumps(rows).encode())
+        if len(data) > self.max_size:
+            return
+
+        self.conn.execute(
+                "INSERT OR REPLACE INTO results "
+                "(key, version, data, size, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, version, sqlite3.Binary(data), len(data), time.time()))
+        self._evict()
+        self.conn.commit()
+
+    def _evict(self):
+        """Delete least recently used entries until under the size cap."""
+
+        total_size = self.conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total_size <= self.max_size:
+            return
+
+        cursor = self.conn.execute(
+                "SELECT key, size FROM results ORDER BY last_used")
+        to_delete = []
+        for key, size in cursor:
+            if total_size <= self.max_size:
+                break
+            to_delete.append((key,))
+            total_size -= size
+        cursor.close()
+        self.conn.executemany("DELETE FROM results WHERE key = ?", to_delete)
+
+    @staticmethod
+    def normalize_key(table, filters, mode="contain", order_by=None):
+        """
+        Return a canonical cache key for a filter dict, filter mode and sort
+        order, so that equivalent filters (e.g., differing only in irrelevant
+        keys or key order) share a cache entry. A filters value of None
+        denotes "select all".
+        """
+
+        if filters is None:
+            return json.dumps([table, "*", order_by])
+
+        normalized = {}
+        for column in ("start", "end", "project", "tags", "notes", "query"):
+            value = filters.get(column)
+            if value or column in ("start", "end"):
+                normalized[column] = value
+        return json.dumps([table, mode, normalized, order_by], sort_keys=True)
@@ -1,36 +1,247 @@
 from __future__ import print_function
 import cmd
+import itertools
+import json
 import logging
 import os
+import shlex
 import subprocess
-from helpers import clear
+try:
+    from shlex import quote
+except ImportError:
+    from pipes import quote
+from aggregate import aggregate
+from helpers import clear, sample_column_widths
+from journal import Journal
 from log import Log
 
-class CLI(cmd.Cmd):
+def log_backup(written):
+    """Log the list of files written by Log.backup()."""
+
+    if written:
+        for filepath in written:
+            logging.info("Backed up to {}.".format(filepath))
+    else:
+        logging.info("Backup is up to date.")
+
+def log_maintenance(reports):
+    """Log the reports returned by Log.maintain()."""
+
+    for report in reports:
+        logging.info("{}: reclaimed {} bytes ({} free pages), {}.".format(
+            report["schema"], report["bytes_reclaimed"], report["free_pages"],
+            "statistics updated" if report["analyzed"] else
+            "statistics up to date"))
+        if report["integrity"]:
+            for problem in report["integrity"]:
+                logging.error("{}: {}".format(report["schema"], problem))
+        else:
+            logging.info("{}: integrity check ok.".format(report["schema"]))
+
+class ErrorCounter(logging.Handler):
+    """Logging handler that counts the errors logged while it is attached."""
+
     def __init__(self):
-        self.intro = "Krono Tracker.\nType help or ? to list commands.\n"
-        self.prompt = "(krono) "
+        logging.Handler.__init__(self, level=logging.ERROR)
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+class CLI(cmd.Cmd):
+    def __init__(self, use_cache=False, stdin=None, batch=False):
+        """
+        @param use_cache Whether to enable the result cache (see
+            Log.enable_cache()) for loaded logs.
+        @param stdin File object to read commands from (default sys.stdin).
+        @param batch If True, run non-interactively: no prompt, intro or
+            screen clearing, and commands never open curses windows (e.g.,
+            view prints entries instead).
+        """
+
+        self.batch = batch
+        self.intro = None if batch else \
+            "Krono Tracker.\nType help or ? to list commands.\n"
         self.path = os.getcwd()
         self.log = None
-        cmd.Cmd.__init__(self)
+        self.use_cache = use_cache
+
+        # Number of commands that failed, i.e., logged an error (see
+        # onecmd()), so batch runs can report failure in their exit status.
+        self.num_failed = 0
+
+        cmd.Cmd.__init__(self, stdin=stdin)
+        if batch:
+            self.use_rawinput = False
+        self._update_prompt()
 
     @property
     def log_loaded(self):
         return bool(self.log)
 
+    def _discard_batch(self):
+        """Roll back any uncommitted batch of edits, with a warning."""
+
+        if self.log_loaded and getattr(self.log, "in_batch", False):
+            logging.warning("Discarding uncommitted batch of edits.")
+            self.log.rollback()
+            self._update_prompt()
+
+    @staticmethod
+    def _parse_params(tokens):
+        """
+        Parse "column=value" tokens into a dict, raising ValueError if a
+        token is malformed or names an invalid column.
+        """
+
+        params = {}
+        for token in tokens:
+            column, sep, value = token.partition("=")
+            if not sep or not Log.get_valid_columns({column: None}):
+                raise ValueError("Invalid parameter {}.".format(token))
+            params[column] = value
+        return params
+
+    def _update_prompt(self):
+        if self.batch:
+            self.prompt = ""
+        elif self.log_loaded and getattr(self.log, "in_batch", False):
+            self.prompt = "(krono*) "
+        else:
+            self.prompt = "(krono) "
+
+    def default(self, line):
+        logging.error("Unknown command: {}".format(line))
+
     def emptyline(self):
         pass
 
+    def onecmd(self, line):
+        """Run a command, counting it as failed if it logs an error."""
+
+        counter = ErrorCounter()
+        logging.getLogger().addHandler(counter)
+        try:
+            return cmd.Cmd.onecmd(self, line)
+        finally:
+            logging.getLogger().removeHandler(counter)
+            if counter.count:
+                self.num_failed += 1
+
     def postcmd(self, stop, line):
         if stop:
-            clear()
+            if not self.batch:
+                clear()
             return True
 
-        print()
+        if not self.batch:
+            print()
         return False
 
     def preloop(self):
-        clear()
+        if not self.batch:
+            clear()
+
+    def do_aggregate(self, arg):
+        """
+        Print the entries of several log files (or directories containing
+        log files) merged in order of start time, using the filter criteria
+        of the currently loaded log, if any. Logs are queried in parallel
+        and are not modified.
+
+        USAGE: aggregate PATH [PATH ...]
+        """
+
+        try:
+            paths = [os.path.join(self.path, path) for path in shlex.split(arg)]
+        except ValueError as e:
+            logging.error(e)
+            return
+
+        if not paths:
+            logging.error("No paths entered.")
+            return
+
+        filters, filter_mode = None, "contain"
+        if self.log_loaded and isinstance(self.log, Log):
+            filters, filter_mode = self.log.filters, self.log.filter_mode
+
+        # Rows are printed as they are merged; column widths are estimated
+        # from the first ones.
+        try:
+            results = aggregate(paths, filters, filter_mode)
+            head = list(itertools.islice(results, 200))
+            widths = sample_column_widths([row for _, row in head])
+            for filepath, row in itertools.chain(head, results):
+                line = Log.format_rows([row], widths=widths)[0]
+                print("{} | {} | {}".format(
+                    os.path.basename(filepath), row[0], line.rstrip()))
+        except Exception as e:
+            logging.error(e)
+
+    def do_archive(self, arg):
+        """
+        Move entries that started before a cutoff date into per-year archive
+        files alongside the currently loaded log. Archived entries can still
+        be viewed and filtered.
+
+        USAGE: archive YYYY-MM-DD [HH:MM:SS]
+        """
+
+        if arg == "":
+            logging.error("No cutoff date entered.")
+            return
+
+        if self.log_loaded:
+            try:
+                num_moved = self.log.archive(arg.strip())
+                logging.info("Archived {} entries.".format(num_moved))
+            except Exception as e:
+                logging.error(e)
+
+    def do_backup(self, arg):
+        """
+        Back up the loaded log (and its archives) without blocking a session
+        being tracked, skipping files unchanged since their last backup.
+        "gzip" compresses the backup files.
+
+        USAGE: backup [gzip] PATH/TO/BACKUP
+        """
+
+        try:
+            tokens = shlex.split(arg)
+        except ValueError as e:
+            logging.error(e)
+            return
+
+        compress = "gzip" in tokens
+        paths = [token for token in tokens if token != "gzip"]
+        if len(paths) != 1:
+            logging.error("No filename entered." if not paths else
+                          "Too many arguments.")
+            return
+
+        if self.log_loaded:
+            filepath = os.path.normpath(os.path.join(self.path, paths[0]))
+            try:
+                written = self.log.backup(filepath, compress=compress)
+            except Exception as e:
+                logging.error(e)
+                return
+            log_backup(written)
+
+    def do_begin(self, arg):
+        """
+        Begin a batch of edits. Subsequent modify and delete commands are
+        queued in a single transaction until commit or rollback.
+        """
+
+        if self.log_loaded:
+            try:
+                self.log.begin()
+                self._update_prompt()
+            except Exception as e:
+                logging.error(e)
 
     def do_cd(self, arg):
         """
@@ -46,6 +257,32 @@ class CLI(cmd.Cmd):
         else:
             logging.error("The directory {} does not exist.".format(new_path))
 
+    def do_commit(self, arg):
+        """
+        Commit the batch of edits begun with begin.
+        """
+
+        if self.log_loaded:
+            try:
+                self.log.commit()
+                self._update_prompt()
+            except Exception as e:
+                logging.error(e)
+
+    def do_compact(self, arg):
+        """
+        Add the sessions recorded in the journal of the currently loaded log
+        (by "krono --journal") to the log.
+        """
+
+        if self.log_loaded:
+            journal = Journal(Journal.journal_filepath(self.log._db_filepath()))
+            try:
+                num_added = journal.compact(self.log)
+                logging.info("Added {} journaled entries.".format(num_added))
+            except Exception as e:
+                logging.error(e)
+
     def do_create(self, arg):
         """
         Create a new log file. New file is not automatically loaded.
@@ -64,26 +301,106 @@ class CLI(cmd.Cmd):
 
     def do_delete(self, arg):
         """
-        Delete entries from the currently loaded log.
+        Delete entries from the currently loaded log, either chosen from a
+        list or given by ID.
+
+        USAGE: delete [ID ...]
         """
 
-        if self.log_loaded:
+        if not self.log_loaded:
+            return
+
+        if arg.strip():
+            try:
+                self.log.delete([int(row_id) for row_id in arg.split()])
+            except Exception as e:
+                logging.error(e)
+        elif self.batch:
+            logging.error("No IDs entered.")
+        else:
             self.log.delete_entries()
 
+    def do_EOF(self, arg):
+        """
+        Exit Krono Tracker at the end of input.
+        """
+
+        return self.do_exit(arg)
+
     def do_exit(self, arg):
         """
         Exit Krono Tracker.
         """
 
+        self._discard_batch()
         return True
 
     def do_filter(self, arg):
         """
-        Select criteria to filter entries.
+        Select criteria to filter entries, with a form or as arguments.
+        Optionally set how the start/end criteria are applied: "contain"
+        (default) selects entries entirely within the date range, "overlap"
+        selects entries intersecting it. "reset" clears all criteria.
+
+        Any other arguments form a filter query, which replaces the current
+        one: project:VALUE, tag:VALUE and notes:VALUE match entries whose
+        column contains VALUE (a bare word matches any of them), since:DATE,
+        until:DATE and date:DATE bound the dates, dur>1h (or >=, <, <=, =,
+        with d, h, m and s units) bounds the duration, and a leading "-"
+        negates a term. A DATE is YYYY[-MM[-DD[ HH:MM[:SS]]]] or one of
+        today, yesterday, this-week, last-week, this-month, last-month,
+        this-year, last-year and last-Nd (e.g., last-7d).
+
+        USAGE: filter [contain|overlap] [reset] [COLUMN=VALUE ...] [TERM ...]
+        EXAMPLE: filter overlap start="2019-01-01 00:00:00" project=krono
+        EXAMPLE: filter project:krono tag:code -tag:review since:2019-01 dur>1h
+        EXAMPLE: filter date:this-week -tag:review
         """
 
+        try:
+            tokens = shlex.split(arg)
+        except ValueError as e:
+            logging.error(e)
+            return
+
+        mode = None
+        reset = False
+        param_tokens = []
+        query_tokens = []
+        for token in tokens:
+            if token.lower() in ("contain", "overlap"):
+                mode = token.lower()
+            elif token.lower() == "reset":
+                reset = True
+            elif "=" in token and \
+                    Log.get_valid_columns({token.partition("=")[0]: None}):
+                param_tokens.append(token)
+            else:
+                query_tokens.append(token)
+
+        try:
+            params = self._parse_params(param_tokens)
+        except ValueError as e:
+            logging.error(e)
+            return
+
         if self.log_loaded:
-            self.log.modify_filter()
+            if mode:
+                self.log.filter_mode = mode
+            if reset:
+                self.log.filters = dict(self.log.default_params)
+
+            if params or query_tokens or reset or self.batch:
+                self.log.filters.update(params)
+                try:
+                    if query_tokens:
+                        self.log.set_query(
+                                " ".join(quote(token) for token in query_tokens))
+                    self.log.filter_rows()
+                except Exception as e:
+                    logging.error(e)
+            else:
+                self.log.modify_filter()
 
     def do_getdir(self, arg):
         """
@@ -105,14 +422,21 @@ class CLI(cmd.Cmd):
 
         try:
             if self.log_loaded:
+                self._discard_batch()
                 self.log.unload_db()
             else:
                 self.log = Log()
 
             self.log.load_db(filepath)
-            self.log.select_all()
         except Exception as e:
             logging.error(e)
+            return
+
+        if self.use_cache:
+            try:
+                self.log.enable_cache()
+            except Exception as e:
+                logging.warning("Result cache disabled: {}".format(e))
 
     def do_ls(self, arg):
         """
@@ -121,14 +445,134 @@ class CLI(cmd.Cmd):
 
         subprocess.call("ls " + self.path, shell=True)
 
-    def do_modify(self, arg):
+    def do_longest(self, arg):
         """
-        Modify an entry in the currently loaded log file.
+        Print the longest entries matching the current filter criteria,
+        optionally only those lasting at least a number of hours.
+
+        USAGE: longest [NUMBER [MIN_HOURS]]
+        """
+
+        if self.log_loaded:
+            try:
+                args = arg.split()
+                limit = int(args[0]) if args else 10
+                min_duration = float(args[1]) * 3600 if len(args) > 1 else None
+                rows = self.log.longest_sessions(
+                        limit=limit, min_duration=min_duration)
+            except Exception as e:
+                logging.error(e)
+                return
+
+            for row, line in zip(rows, self.log.format_rows(rows)):
+                print("{} | {:>7.2f} h | {}".format(
+                    row[0], row[-1] / 3600, line.rstrip()))
+
+    def do_maintain(self, arg):
+        """
+        Reclaim the space left by deleted entries, update the statistics used
+        to plan queries, add the indexes used for date ranges and durations
+        (files then require SQLite 3.31 or later), and check the integrity of
+        the loaded log and its archives. "full" runs a full (slower) integrity
+        check.
+
+        USAGE: maintain [full]
         """
 
+        if arg.strip() not in ("", "full"):
+            logging.error("Invalid argument {}.".format(arg.strip()))
+            return
+
         if self.log_loaded:
+            try:
+                reports = self.log.maintain(full_check=arg.strip() == "full")
+            except Exception as e:
+                logging.error(e)
+                return
+            log_maintenance(reports)
+
+    def do_merge(self, arg):
+        """
+        Merge the entries of another log file into the currently loaded log,
+        skipping entries that are already present. The other log is not
+        modified.
+
+        USAGE: merge PATH/TO/SOURCE_LOG
+        """
+
+        if arg == "":
+            logging.error("No filename entered.")
+            return
+
+        if self.log_loaded:
+            filepath = os.path.normpath(os.path.join(self.path, arg.strip()))
+            try:
+                num_inserted, num_skipped = self.log.merge(filepath)
+                logging.info("Merged {} entries ({} duplicates skipped).".format(
+                    num_inserted, num_skipped))
+            except Exception as e:
+                logging.error(e)
+
+    def do_modify(self, arg):
+        """
+        Modify an entry in the currently loaded log file, either chosen from
+        a list and edited with a form, or given by ID and new column values.
+
+        USAGE: modify [ID COLUMN=VALUE ...]
+        EXAMPLE: modify 12 project=krono notes="fix tests"
+        """
+
+        if not self.log_loaded:
+            return
+
+        try:
+            tokens = shlex.split(arg)
+        except ValueError as e:
+            logging.error(e)
+            return
+
+        if tokens:
+            try:
+                row_id = int(tokens[0])
+                self.log.update_row(row_id, self._parse_params(tokens[1:]))
+            except Exception as e:
+                logging.error(e)
+        elif self.batch:
+            logging.error("No ID entered.")
+        else:
             self.log.modify_entry()
 
+    def do_overlaps(self, arg):
+        """
+        List pairs of entries, among those matching the current filter
+        criteria, that overlap in time.
+        """
+
+        if self.log_loaded:
+            try:
+                overlaps = self.log.find_overlaps()
+            except Exception as e:
+                logging.error(e)
+                return
+
+            if not overlaps:
+                logging.info("No overlapping entries.")
+            for first, second in overlaps:
+                print("\n".join(self.log.format_rows([first, second])))
+                print()
+
+    def do_rollback(self, arg):
+        """
+        Discard the batch of edits begun with begin.
+        """
+
+        if self.log_loaded:
+            try:
+                self.log.rollback()
+                self._update_prompt()
+            except Exception as e:
+                logging.error(e)
+
     def do_setcwd(self, arg):
         """
         Set the active path to the current working directory
@@ -138,10 +582,52 @@ class CLI(cmd.Cmd):
         self.path = os.getcwd()
         print(self.path)
 
-    def do_view(self, arg):
+    def do_sync(self, arg):
         """
-        View the currently loaded log file.
+        Copy the changes made to the currently loaded log since the last sync
+        to another log file (created if necessary), which mirrors it.
+
+        USAGE: sync PATH/TO/TARGET_LOG
         """
 
+        if arg == "":
+            logging.error("No filename entered.")
+            return
+
         if self.log_loaded:
+            filepath = os.path.normpath(os.path.join(self.path, arg.strip()))
+            try:
+                num_synced = self.log.sync(filepath)
+                logging.info("Synced {} entries.".format(num_synced))
+            except Exception as e:
+                logging.error(e)
+
+    def do_view(self, arg):
+        """
+        View the entries in the currently loaded log file matching the
+        current filter criteria. With an argument (or in batch mode), print
+        them instead, as plain text or as one JSON object per line.
+
+        USAGE: view [plain|json]
+        """
+
+        arg = arg.strip().lower()
+        if arg not in ("", "plain", "json"):
+            logging.error("Invalid output format {}.".format(arg))
+            return
+
+        if not self.log_loaded:
+            return
+
+        if not arg and not self.batch:
             self.log.view()
+            return
+
+        rows = self.log.rows
+        if arg == "json":
+            columns = ["id"] + Log.get_valid_columns(self.log.default_params)
+            for row in rows:
+                print(json.dumps(dict(zip(columns, row))))
+        else:
+            for row, line in zip(rows, self.log.format_rows(rows)):
+                print("{} | {}".format(row[0], line.rstrip()))
@@ -0,0 +1,46 @@
+import bisect
+import os
+
+class PrefixIndex:
+    """
+    Sorted array of distinct strings (e.g., project names) supporting
+    prefix lookups by binary search, for autocompletion.
+    """
+
+    def __init__(self, words=()):
+        self.words = sorted(set(word for word in words if word))
+
+    def __len__(self):
+        return len(self.words)
+
+    def add(self, word):
+        """Insert a word, if it is not already present."""
+
+        if not word:
+            return
+        i = bisect.bisect_left(self.words, word)
+        if i == len(self.words) or self.words[i] != word:
+            self.words.insert(i, word)
+
+    def complete(self, prefix):
+        """Return the words beginning with prefix, in sorted order."""
+
+        lo = bisect.bisect_left(self.words, prefix)
+        hi = bisect.bisect_left(self.words, prefix + chr(0x10ffff), lo)
+        return self.words[lo:hi]
+
+    def longest_completion(self, prefix):
+        """
+        Return the longest string that every word beginning with prefix
+        begins with (prefix itself if there are no such words).
+        """
+
+        words = self.complete(prefix)
+        if not words:
+            return prefix
+        return os.path.commonprefix([words[0], words[-1]])
+
+def split_tags(tags):
+    """Split a tags string (tags separated by commas) into a list of tags."""
+
+    return [tag.strip() for tag in tags.split(",") if tag.strip()]
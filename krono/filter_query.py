@@ -0,0 +1,215 @@
+import datetime
+import re
+import shlex
+
+class FilterQuery:
+    """
+    Filter criteria written in a small query language, compiled to a SQL
+    condition with placeholders and the values to bind to them.
+
+    A query is a list of terms separated by whitespace, all of which must
+    hold for a session to match:
+
+        project:VALUE     Project contains VALUE.
+        tag:VALUE         Tags contain VALUE ("tags:" also works).
+        notes:VALUE       Notes contain VALUE.
+        WORD              Project, tags or notes contain WORD.
+        since:DATE        Session starts at or after (the start of) DATE.
+        until:DATE        Session ends at or before (the end of) DATE.
+        date:DATE         Session lies within DATE.
+        dur>1h            Duration compared with >, >=, <, <= or =, given in
+                          d, h, m and/or s units (e.g., 1h30m, 45m, 90s).
+
+    Values containing spaces are quoted ("project:\"my project\""), and
+    any term except since/until/date is negated with a leading "-".
+
+    A DATE is a period: "YYYY", "YYYY-MM", "YYYY-MM-DD", "YYYY-MM-DD HH:MM"
+    or "YYYY-MM-DD HH:MM:SS", or one relative to the current time: "today",
+    "yesterday", "this-week", "last-week" (weeks start on Monday),
+    "this-month", "last-month", "this-year", "last-year", or "last-Nd" (the
+    last N days, including today).
+
+    The dates are not part of the condition but are resolved by bounds()
+    into a start and end, which are applied like the start/end filter
+    criteria (with the partition, start and interval indexes). As relative
+    dates are only resolved then, a compiled query can be reused across
+    days. "{duration}" in the condition stands for the session duration in
+    seconds, to be replaced by the indexed duration column where there is
+    one.
+    """
+
+    text_columns = {
+            "project": "project",
+            "tag": "tags",
+            "tags": "tags",
+            "note": "notes",
+            "notes": "notes",
+            }
+
+    units = {"d": 86400, "h": 3600, "m": 60, "s": 1}
+
+    date_formats = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d",
+                    "%Y-%m", "%Y")
+
+    last_days = re.compile(r"^last-(\d+)d$")
+
+    duration_term = re.compile(r"^(dur|duration)(>=|<=|>|<|=)(.+)$")
+    duration_value = re.compile(r"^((\d+(\.\d+)?)[dhms])+$|^\d+$")
+
+    def __init__(self, text):
+        """
+        @param text The query; raises ValueError if it is malformed.
+        """
+
+        self.text = text
+        self.values = []
+
+        # (field, date) of the since/until/date terms.
+        self.date_terms = []
+
+        conditions = []
+        for term in shlex.split(text):
+            negate = term.startswith("-") and len(term) > 1
+            if negate:
+                term = term[1:]
+
+            match = self.duration_term.match(term)
+            field, sep, value = term.partition(":")
+            if match is not None:
+                condition = "{{duration}} {} ?".format(match.group(2))
+                self.values.append(self.parse_duration(match.group(3)))
+            elif not sep:
+                condition = "(COALESCE(project, '') LIKE ? OR "\
+                    "COALESCE(tags, '') LIKE ? OR COALESCE(notes, '') LIKE ?)"
+                self.values.extend(["%{}%".format(term)] * 3)
+            elif not value:
+                raise ValueError("No value given for {}.".format(field))
+            elif field in ("since", "until", "date"):
+                if negate:
+                    raise ValueError("{}: cannot be negated.".format(field))
+                # Validate the date now rather than when it is resolved.
+                self.parse_range(value)
+                self.date_terms.append((field, value))
+                continue
+            elif field in self.text_columns:
+                condition = "COALESCE({}, '') LIKE ?".format(
+                        self.text_columns[field])
+                self.values.append("%{}%".format(value))
+            else:
+                raise ValueError("Unknown field {}.".format(field))
+
+            if negate:
+                condition = "NOT {}".format(condition)
+            conditions.append(condition)
+
+        # Only placeholders and fixed SQL go into the condition, so queries
+        # differing only in their values compile to the same SQL.
+        self.condition = " AND ".join(conditions)
+
+    def bounds(self, now=None):
+        """
+        @brief Resolve the date terms into a date range.
+
+        @param now The current time, as a datetime (default: now).
+        @return (start, end) date strings in the DB's datetime format, either
+            of which is None if unbounded by the query.
+        """
+
+        start = end = None
+        for field, value in self.date_terms:
+            first, last = self.parse_range(value, now)
+            if field in ("since", "date") and (start is None or first > start):
+                start = first
+            if field in ("until", "date") and (end is None or last < end):
+                end = last
+        return start, end
+
+    @classmethod
+    def parse_range(cls, value, now=None):
+        """
+        @brief Return the first and last second of a DATE (see FilterQuery),
+            as date strings in the DB's datetime format.
+
+        @param value The date or relative date.
+        @param now The current time, as a datetime (default: now).
+        """
+
+        value = re.sub(r"^(\d{4}-\d{2}-\d{2})t", r"\1 ", value.lower())
+        for date_format in cls.date_formats:
+            try:
+                first = datetime.datetime.strptime(value, date_format)
+            except ValueError:
+                continue
+            return cls._format_range(first, cls._next(first, date_format))
+
+        if now is None:
+            now = datetime.datetime.now()
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        day = datetime.timedelta(days=1)
+        week = today - today.weekday() * day
+        month = today.replace(day=1)
+        year = month.replace(month=1)
+
+        match = cls.last_days.match(value)
+        if match is not None and int(match.group(1)) > 0:
+            first, after = today - (int(match.group(1)) - 1) * day, today + day
+        elif value == "today":
+            first, after = today, today + day
+        elif value == "yesterday":
+            first, after = today - day, today
+        elif value == "this-week":
+            first, after = week, week + 7 * day
+        elif value == "last-week":
+            first, after = week - 7 * day, week
+        elif value == "this-month":
+            first, after = month, cls._next(month, "%Y-%m")
+        elif value == "last-month":
+            first, after = (month - day).replace(day=1), month
+        elif value == "this-year":
+            first, after = year, year.replace(year=year.year + 1)
+        elif value == "last-year":
+            first, after = year.replace(year=year.year - 1), year
+        else:
+            raise ValueError("Invalid date {}.".format(value))
+        return cls._format_range(first, after)
+
+    @staticmethod
+    def _next(date, date_format):
+        """
+        Return the start of the period after the one denoted by a date
+        parsed with the given (possibly partial) format.
+        """
+
+        if date_format == "%Y":
+            return date.replace(year=date.year + 1)
+        elif date_format == "%Y-%m":
+            return (date.replace(day=28) + datetime.timedelta(days=4))\
+                .replace(day=1)
+        elif date_format == "%Y-%m-%d":
+            return date + datetime.timedelta(days=1)
+        elif date_format == "%Y-%m-%d %H:%M":
+            return date + datetime.timedelta(minutes=1)
+        return date + datetime.timedelta(seconds=1)
+
+    @staticmethod
+    def _format_range(first, after):
+        last = after - datetime.timedelta(seconds=1)
+        return (first.strftime("%Y-%m-%d %H:%M:%S"),
+                last.strftime("%Y-%m-%d %H:%M:%S"))
+
+    @classmethod
+    def parse_duration(cls, value):
+        """
+        Return the number of seconds in a duration such as "1h30m" (a bare
+        number is taken as seconds).
+        """
+
+        if not cls.duration_value.match(value):
+            raise ValueError("Invalid duration {}.".format(value))
+        if value.isdigit():
+            return int(value)
+
+        seconds = sum(float(number) * cls.units[unit]
+                      for number, unit in re.findall(r"(\d+(?:\.\d+)?)([dhms])",
+                                                     value))
+        return int(seconds)
@@ -11,3 +11,39 @@ def datetime_to_string(dt):
 
 def string_to_datetime(string):
     return datetime.strptime(string, DATETIME_FORMAT)
+
+def sample_column_widths(rows, sample_size=200, max_width=40):
+    """
+    Estimate the display width of each column of a list of rows (tuples)
+    from an evenly spaced sample of at most sample_size rows, rather than
+    scanning every row. Widths are capped at max_width.
+    """
+
+    if not rows:
+        return []
+
+    step = max(1, len(rows) // sample_size)
+    widths = [0] * len(rows[0])
+    for row in rows[::step]:
+        for i, value in enumerate(row):
+            if value is not None and len(str(value)) > widths[i]:
+                widths[i] = len(str(value))
+    return [min(width, max_width) for width in widths]
+
+def file_change_counter(filepath):
+    """
+    Return the file change counter stored in the header of an SQLite
+    database file, which is incremented by every committed write transaction
+    (in the default rollback journal mode). Return None if the file does not
+    exist or is too short to contain a header.
+    """
+
+    try:
+        with open(filepath, "rb") as f:
+            header = f.read(28)
+    except (IOError, OSError):
+        return None
+
+    if len(header) < 28:
+        return None
+    return int.from_bytes(header[24:28], "big")
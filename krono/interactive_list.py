@@ -1,5 +1,6 @@
 import curses
 import logging
+from screen_buffer import ScreenBuffer
 
 class InteractiveList:
     """
@@ -25,14 +26,16 @@ class InteractiveList:
         self.select_mode = select_mode.lower()
 
         if self.select_mode == "off":
-            self.instructions = "Up [Up/k], Down [Down/j], Done [Enter/q]"
+            self.instructions = "Up [Up/k], Down [Down/j], Search [/]"\
+                ", Done [Enter/q]"
             self.strings = list(strings)
         elif self.select_mode == "single":
-            self.instructions = "Up [Up/k], Down [Down/j], Select [Enter], Quit [q]"
+            self.instructions = "Up [Up/k], Down [Down/j], Search [/]"\
+                ", Select [Enter], Quit [q]"
             self.strings = list(strings)
         else:
-            self.instructions = "Up [Up/k], Down [Down/j], Select [Space]"\
-                ", Done [Enter], Quit [q]"
+            self.instructions = "Up [Up/k], Down [Down/j], Search [/]"\
+                ", Select [Space], Done [Enter], Quit [q]"
             self.strings = ["[ ] " + string for string in strings]
         
         if self.select_mode == "multi":
@@ -44,6 +47,15 @@ class InteractiveList:
         self.height = None
         self.width = None
 
+        # Lowercased copy of each item for case-insensitive search, and the
+        # indices of the items currently shown (all of them unless a search
+        # query narrows them down).
+        self._lower = self._search_index()
+        self.query = None
+        self._matches = None
+        self.visible = None
+        self._set_query(None)
+
     def start(self):
         try:
             self.base = curses.initscr()
@@ -63,112 +75,242 @@ class InteractiveList:
         return self.selected
 
     def _interactive_list(self):
-        base_height, base_width = self.base.getmaxyx()
-        self.base.addstr(base_height - 1, 1, self.instructions)
-        self.base.refresh()
-
-        scr = curses.newwin(base_height - 2, base_width, 0, 0)
-        scr.keypad(True)
-        scr.scrollok(True)
-
-        self.height, self.width = scr.getmaxyx()
-        self._reprint(scr, 0)
-        scr.addstr(0, 0, self.strings[0], curses.A_REVERSE)
+        scr = self._layout()
+        screen = ScreenBuffer(scr)
 
+        # "line" is the index (in self.visible) of the highlighted item and
+        # "top" is the index of the item shown on the first line of the window.
         line = 0
+        top = 0
+        self._render(screen, top, line)
+
         while True:
+            # While items are still being loaded, poll for keys so that more
+            # items can be loaded in between keypresses.
+            scr.timeout(0 if self._loading() else -1)
             key = scr.getch()
-            y, _ = scr.getyx()
-            if (key == curses.KEY_UP or key == ord("k")) and line > 0:
-                if y > 0:
-                    scr.addstr(y, 0, self.strings[line])
-                    line -= 1
-                    scr.move(y-1, 0)
-                    scr.addstr(y-1, 0, self.strings[line], curses.A_REVERSE)
-                else:
-                    line -= 1
-                    self._reprint(scr, line)
-                    scr.addstr(0, 0, self.strings[line], curses.A_REVERSE)
-            elif (key == curses.KEY_DOWN or key == ord("j")) and line < len(self.strings) - 1:
-                if y < self.height - 1:
-                    scr.addstr(y, 0, self.strings[line])
-                    line += 1
-                    scr.move(y+1, 0)
-                    scr.addstr(y+1, 0, self.strings[line], curses.A_REVERSE)
+
+            if key == -1:
+                start = self._num_items()
+                if self._load_more():
+                    self._extend(start)
+            elif key == curses.KEY_RESIZE:
+                # Rebuild the windows for the new terminal size and keep the
+                # highlighted item in view; no items need to be re-read.
+                scr = self._layout()
+                screen = ScreenBuffer(scr)
+                top = max(min(top, line), line - self.height + 1)
+            elif self.query is not None:
+                # Search mode: keystrokes edit the query, which narrows the
+                # visible items, until Enter (keep results) or Esc (cancel).
+                if key == 27:
+                    self._set_query(None)
+                    self._print_instructions(self.instructions)
+                elif key == ord("\n"):
+                    self.query = None
+                    self._print_instructions(self.instructions)
+                    curses.doupdate()
+                    continue
+                elif key in (curses.KEY_BACKSPACE, 127, 8):
+                    self._set_query(self.query[:-1])
+                elif 32 <= key <= 126:
+                    self._set_query(self.query + chr(key))
                 else:
-                    scr.addstr(y, 0, self.strings[line])
-                    scr.addstr("\n")
-                    line += 1
-                    scr.addstr(self.strings[line], curses.A_REVERSE)
-            elif key == ord(" ") and self.select_mode in ("multi", "single_box"):
+                    continue
+
+                if self.query is not None:
+                    self._print_instructions("/" + self.query)
+                line = 0
+                top = 0
+            elif key == ord("/"):
+                self._set_query("")
+                self._print_instructions("/")
+            elif (key == curses.KEY_UP or key == ord("k")) and line > 0:
+                line -= 1
+                if line < top:
+                    screen.scroll(line - top)
+                    top = line
+            elif (key == curses.KEY_DOWN or key == ord("j")) and line < len(self.visible) - 1:
+                line += 1
+                if line >= top + self.height:
+                    screen.scroll(line - self.height + 1 - top)
+                    top = line - self.height + 1
+            elif key == ord(" ") and self.select_mode in ("multi", "single_box") \
+                    and self.visible:
                 # If multiselect enabled, toggle selection and add or remove
                 # entry from self.selected list as necessary. If single_box
                 # select enabled, toggle selection and update selected index.
+                # Selections are indices into the full list of strings.
+                item = self.visible[line]
                 if self.select_mode == "multi":
-                    if line not in self.selected:
-                        self.selected.append(line)
-                        self._toggle_string(line, True)
+                    if item not in self.selected:
+                        self.selected.append(item)
+                        self._toggle_string(item, True)
                     else:
-                        self.selected.remove(line)
-                        self._toggle_string(line, False)
+                        self.selected.remove(item)
+                        self._toggle_string(item, False)
                 else:
                     # If single_box select enabled.
                     if self.selected is None:
-                        self._toggle_string(line, True)
-                        self.selected = line
-                    elif self.selected == line:
-                        self._toggle_string(line, False)
+                        self._toggle_string(item, True)
+                        self.selected = item
+                    elif self.selected == item:
+                        self._toggle_string(item, False)
                         self.selected = None
                     else:
                         self._toggle_string(self.selected, False)
-                        self._toggle_string(line, True)
-
-                        # Determine the distance of the previously selected
-                        # item from the currently selected item (i.e., index
-                        # of previously selected item minus the index of the
-                        # current line). A negative distance means the previous
-                        # item precedes the current line. A positive distance
-                        # means the previously selected item comes later in the
-                        # list than the current line.
-                        distance = self.selected - line
-
-                        # If distance is outside the bounds of the window, do
-                        # nothing. Else, reprint the previously selected item
-                        # to reflect that it is no longer selected.
-                        if 0 <= y + distance < self.height:
-                            scr.addstr(y + distance, 0, self.strings[self.selected])
-
-                        # Update self.selected to reflect new selection.
-                        self.selected = line
-
-                # Reprint the current line with the select-box marked.
-                scr.addstr(y, 0, self.strings[line], curses.A_REVERSE)
+                        self._toggle_string(item, True)
+                        self.selected = item
+            elif self._handle_key(key):
+                line = 0
+                top = 0
             elif key == ord("q"):
                 self.selected = None
                 break
             elif key == ord("\n"):
                 if self.select_mode == "single":
-                    self.selected = line
+                    self.selected = self.visible[line] if self.visible else None
                 break
+            else:
+                continue
+
+            self._render(screen, top, line)
 
         self.base.erase()
         scr.erase()
         del scr
 
-    def _reprint(self, scr, first_line):
+    def _extend(self, start):
+        """
+        Add the items from index start onward, which were just loaded, to
+        the search index and to the visible items matching the query.
+        """
+
+        self._lower.extend(self._search_index(start))
+        lower = self._lower
+        for query, matches in self._matches:
+            needle = query.lower()
+            matches.extend(i for i in range(start, len(lower))
+                           if needle in lower[i])
+
+    def _frame(self, top, line):
+        """
+        Return the contents of the window, with "top" the index (in
+        self.visible) of the first item shown and "line" the index of the
+        highlighted item, as a list of (text, attr) tuples.
+        """
+
+        frame = []
+        for i in range(top, min(top + self.height, len(self.visible))):
+            attr = curses.A_REVERSE if i == line else curses.A_NORMAL
+            frame.append((self._item_text(self.visible[i]), attr))
+        return frame
+
+    def _handle_key(self, key):
+        """
+        Hook for subclasses to handle additional keys. Return True if the key
+        was handled and the list should be shown from the top.
+        """
+
+        return False
+
+    def _item_text(self, index):
+        """Return the text displayed for the item at index in self.strings."""
+
+        return self.strings[index]
+
+    def _layout(self):
+        """
+        Draw the instructions for the current terminal size and return a new
+        window for the list, filling the rest of the screen.
+        """
+
+        base_height, base_width = self.base.getmaxyx()
+        self.base.erase()
+        if self.query is None:
+            self._print_instructions(self.instructions)
+        else:
+            self._print_instructions("/" + self.query)
+
+        scr = curses.newwin(base_height - 2, base_width, 0, 0)
+        scr.keypad(True)
+        scr.idlok(True)
+        self.height, self.width = scr.getmaxyx()
+        return scr
+
+    def _load_more(self):
+        """
+        Hook for subclasses whose items are loaded incrementally. Load more
+        items and return the number of items added.
+        """
+
+        return 0
+
+    def _loading(self):
+        """Return whether more items remain to be loaded."""
+
+        return False
+
+    def _num_items(self):
+        return len(self.strings)
+
+    def _print_instructions(self, text):
+        """Replace the text on the last line of the base window."""
+
+        base_height, base_width = self.base.getmaxyx()
+        self.base.move(base_height - 1, 0)
+        self.base.clrtoeol()
+        self.base.addnstr(base_height - 1, 1, text, base_width - 2)
+        self.base.noutrefresh()
+
+    def _render(self, screen, top, line):
+        """Draw the current frame and send all pending updates at once."""
+
+        screen.draw(self._frame(top, line))
+        screen.noutrefresh()
+        curses.doupdate()
+
+    def _set_query(self, query):
+        """
+        @brief Update the search query and narrow self.visible to the items
+            containing it (case-insensitive).
+
+        Extending the query only rescans the previous matches; shortening it
+        restores the match set saved for the shorter query. A query of None
+        ends the search and shows all items.
+
+        @param query The new query string, or None.
+        """
+
+        if query is None:
+            self.query = None
+            self._matches = [("", list(range(self._num_items())))]
+            self.visible = self._matches[0][1]
+            return
+
+        # Discard saved match sets for queries that are not prefixes of the
+        # new query, then refine the longest remaining one.
+        while len(self._matches) > 1 and not query.startswith(self._matches[-1][0]):
+            self._matches.pop()
+
+        prev_query, prev_matches = self._matches[-1]
+        if query != prev_query:
+            needle = query.lower()
+            lower = self._lower
+            matches = [i for i in prev_matches if needle in lower[i]]
+            self._matches.append((query, matches))
+
+        self.query = query
+        self.visible = self._matches[-1][1]
+
+    def _search_index(self, start=0):
         """
-        Erase and reprint the entire curses window, beginning with "first_line"
-        (the index in "strings" corresponding to the first line of the window).
+        Return the lowercased text of each item (from index start onward),
+        for searching.
         """
 
-        i = first_line
-        y = 0
-        while i < len(self.strings) and y < self.height:
-            scr.clrtoeol()
-            scr.addstr(y, 0, self.strings[i])
-            i += 1
-            y += 1
-        scr.move(0, 0)
+        prefix_len = 4 if self.select_mode in ("multi", "single_box") else 0
+        return [string[prefix_len:].lower() for string in self.strings[start:]]
 
     def _toggle_string(self, line, select):
         """
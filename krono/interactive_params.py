@@ -1,6 +1,7 @@
 from collections import OrderedDict
 import curses
 import logging
+from screen_buffer import ScreenBuffer
 
 class InteractiveParams:
     """
@@ -8,7 +9,14 @@ class InteractiveParams:
     modified by the user and returned to the caller.
     """
 
-    def __init__(self, params, header_text=""):
+    def __init__(self, params, header_text="", completions=None):
+        """
+        @param params Dict of session parameters to show.
+        @param header_text Text shown above the parameters.
+        @param completions Optional dict mapping "project" and/or "tags" to
+            a PrefixIndex of known values, used to complete the text in
+            those fields when Tab is pressed.
+        """
 
         self.params = OrderedDict([
             ("start", list(params.get("start", "0000-01-01 00:00:00"))),
@@ -18,6 +26,10 @@ class InteractiveParams:
             ("notes", list(params.get("notes", "")))
             ])
 
+        # The filter form also edits the filter query (see FilterQuery).
+        if "query" in params:
+            self.params["query"] = list(params["query"] or "")
+
         blank_date = "    -  -     :  :  "
         if not self.params["start"]:
             self.params["start"] = list(blank_date)
@@ -31,6 +43,13 @@ class InteractiveParams:
         self.base = None
         self.scr = None
 
+        self.completions = completions if completions is not None else {}
+
+        # (field, text before the completed word, candidates, index of the
+        # current candidate, resulting field text) of the last completion,
+        # so that repeated Tabs cycle through the candidates.
+        self._cycle = None
+
     def start(self):
         try:
             self.base = curses.initscr()
@@ -49,11 +68,66 @@ class InteractiveParams:
             curses.endwin()
         return self.params
 
+    def complete(self, dict_key):
+        """
+        @brief Complete the word (the whole field for "project", the last
+            comma-separated tag for "tags") in a field.
+
+        The word is extended to the longest prefix shared by all known
+        values beginning with it; if it cannot be extended, each repeated
+        call replaces it with the next of those values.
+
+        @param dict_key The field to complete.
+        @return The list of candidate values, or an empty list if the field
+            cannot be completed any further.
+        """
+
+        index = self.completions.get(dict_key)
+        if index is None:
+            return []
+
+        text = "".join(self.params[dict_key])
+        cycle = self._cycle
+        if cycle is not None and cycle[0] == dict_key and cycle[4] == text \
+                and len(cycle[2]) > 1:
+            _, head, candidates, i, _ = cycle
+            i = (i + 1) % len(candidates)
+            word = candidates[i]
+        else:
+            if dict_key == "tags":
+                head, sep, word = text.rpartition(",")
+                head += sep + word[:len(word) - len(word.lstrip())]
+                word = word.lstrip()
+            else:
+                head, word = "", text
+
+            candidates = index.complete(word)
+            if not candidates:
+                return []
+
+            i = 0
+            completion = index.longest_completion(word)
+            if len(completion) > len(word):
+                word = completion
+                i = -1
+            elif len(candidates) > 1:
+                word = candidates[0]
+            else:
+                return []
+
+        self.params[dict_key] = list(head + word)
+        self._cycle = (dict_key, head, candidates, i, head + word)
+        return candidates
+
     def _interactive_params(self):
         base_height, base_width = self.base.getmaxyx()
         self.base.addstr(0, 1, self.header_text)
         y_offset = 2
         instructions = "Navigation [Up/Down/Left/Right/Tab], Select [Enter], Quit [q]"
+        if self.completions:
+            instructions = "Navigation [Up/Down/Left/Right], Complete/Next "\
+                "[Tab], Select [Enter], Quit [q]"
+        hint_y = self.num_dict_keys + y_offset + 1
         self.base.addstr(self.num_dict_keys + y_offset + 2, 1, instructions)
         self.base.refresh()
 
@@ -61,6 +135,7 @@ class InteractiveParams:
         scr_height, scr_width = scr.getmaxyx()
         scr.refresh()
         scr.keypad(True)
+        screen = ScreenBuffer(scr)
 
         min_x = 10
         date_separator_idx = [min_x + i for i, c in enumerate(self.params["start"])
@@ -68,11 +143,10 @@ class InteractiveParams:
         date_len = len(self.params["start"])
 
         def print_line(line_idx):
+            # Only the changed part of the line is redrawn (see ScreenBuffer).
             dict_key = self.dict_keys[line_idx]
             text = "{:<8}| {}".format(dict_key, "".join(self.params[dict_key]))
-            scr.move(line_idx, 0)
-            scr.clrtoeol()
-            scr.addstr(line_idx, 0, text)
+            screen.set_line(line_idx, text)
             scr.move(line, x)
 
         def date_move_right():
@@ -106,11 +180,34 @@ class InteractiveParams:
         for i in range(self.num_dict_keys):
             print_line(i)
 
+        def print_hint(candidates):
+            # Show the first few completion candidates below the fields.
+            text = "  ".join(candidates[:20])
+            if len(candidates) > 20:
+                text += "  (+{} more)".format(len(candidates) - 20)
+            self.base.move(hint_y, 0)
+            self.base.clrtoeol()
+            self.base.addnstr(hint_y, 1, text, base_width - 2)
+            self.base.refresh()
+
         while True:
             key = scr.getch()
             y, x = scr.getyx()
 
-            if key == curses.KEY_UP and line > 0:
+            candidates = None
+            if key == ord("\t") and self.dict_keys[line] in self.completions:
+                candidates = self.complete(self.dict_keys[line])
+            if candidates or self._cycle is not None:
+                # Show the candidates until the next key that isn't Tab.
+                print_hint(candidates or [])
+                if not candidates:
+                    self._cycle = None
+
+            if candidates:
+                dict_key = self.dict_keys[line]
+                x = min_x + len(self.params[dict_key])
+                print_line(line)
+            elif key == curses.KEY_UP and line > 0:
                 line -= 1
                 scr.move(line, min_x)
             elif key == curses.KEY_DOWN or key == ord("\t"):
@@ -0,0 +1,182 @@
+import contextlib
+import datetime
+import json
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+from helpers import datetime_to_string
+
+class Journal:
+    """
+    Append-only file of session writes, used in place of a Log by short-lived
+    trackers to avoid opening the DB at all. Each add_row()/update_row()
+    call appends one JSON line, which is flushed but not synced to disk (in
+    the spirit of SQLite's "synchronous=OFF"). The journal is later folded
+    into the DB with compact(), in a single transaction.
+
+    Implements the subset of the Log interface used for tracking a session
+    (add_row, update_row, get_last_row_id, unload_db), so it can be used with
+    Session. Row IDs are opaque string keys rather than DB IDs.
+
+    Appends hold a shared lock, and compact() an exclusive one, on a lock
+    file next to the journal (where fcntl is available).
+    """
+
+    def __init__(self, filepath):
+        """@param filepath Path to the journal file (created if needed)."""
+
+        self.filepath = filepath
+        self.last_inserted_row = None
+        self._open_keys = []
+
+    @staticmethod
+    def journal_filepath(db_filepath):
+        """Return the path of the journal belonging to a DB file."""
+
+        return db_filepath + "-pending"
+
+    @contextlib.contextmanager
+    def _locked(self, exclusive=False):
+        """Hold a shared (or exclusive) lock on the journal's lock file."""
+
+        if fcntl is None:
+            yield
+            return
+
+        with open(self.filepath + ".lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _append(self, record, locked=True):
+        record.setdefault("time", time.time())
+        line = json.dumps(record) + "\n"
+        if not locked:
+            with open(self.filepath, "a") as f:
+                f.write(line)
+            return
+
+        with self._locked():
+            with open(self.filepath, "a") as f:
+                f.write(line)
+
+    def add_row(self, new_row_vals):
+        """Record a new session and return its key."""
+
+        key = uuid.uuid4().hex
+        self._append({"key": key, "add": dict(new_row_vals)})
+        self._open_keys.append(key)
+        self.last_inserted_row = key
+        return key
+
+    def update_row(self, row_id, updated_params):
+        """Record new values for some columns of a session."""
+
+        self._append({"key": row_id, "update": dict(updated_params)})
+
+    def get_last_row_id(self):
+        return self.last_inserted_row
+
+    def unload_db(self):
+        """Mark the sessions added through this journal as finished."""
+
+        for key in self._open_keys:
+            self._append({"key": key, "done": True})
+        self._open_keys = []
+
+    def compact(self, log, stale_after=86400, now=None):
+        """
+        @brief Fold the finished sessions in the journal into a loaded Log.
+
+        The journal is first renamed, so trackers append to a fresh file;
+        the writes for each session are collapsed into a single row and all
+        rows are added in one transaction. Sessions that are still being
+        tracked are carried over to the fresh journal as one record each.
+        Trackers are kept from appending until the carried-over records have
+        been written, so that they come before any later writes. Sessions
+        with no writes for stale_after seconds (e.g., from a tracker that
+        was killed) are added as finished, ending at their last write if
+        they have no end time. Incomplete lines (e.g., from a tracker that
+        was killed while writing) are skipped.
+
+        @param log A Log with a DB loaded.
+        @param stale_after Seconds after which an unfinished session is
+            considered abandoned.
+        @param now The current time, in seconds since the epoch (default:
+            now).
+        @return The number of sessions added to the DB.
+        """
+
+        # Avoid creating the lock file for logs that never had a journal.
+        if not os.path.isfile(self.filepath) and \
+                not os.path.isfile(self.filepath + ".compacting"):
+            return 0
+
+        with self._locked(exclusive=True):
+            return self._compact(log, stale_after,
+                                 time.time() if now is None else now)
+
+    def _compact(self, log, stale_after, now):
+        compacting = self.filepath + ".compacting"
+        if not os.path.isfile(compacting):
+            if not os.path.isfile(self.filepath):
+                return 0
+            os.replace(self.filepath, compacting)
+
+        rows = OrderedDict()
+        finished = set()
+        last_write = {}
+        with open(compacting) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logging.warning("Skipped incomplete journal entry.")
+                    continue
+
+                key = record["key"]
+                if "time" in record:
+                    last_write[key] = record["time"]
+                if "add" in record:
+                    rows[key] = record["add"]
+                elif "update" in record and key in rows:
+                    rows[key].update(record["update"])
+                elif record.get("done"):
+                    finished.add(key)
+
+        for key, row in rows.items():
+            # Records written before they were timed are aged from now.
+            last_write.setdefault(key, now)
+            if key not in finished and now - last_write[key] >= stale_after:
+                logging.warning("Finished a session abandoned since {}.".format(
+                    datetime_to_string(datetime.datetime.fromtimestamp(
+                        last_write[key]))))
+                if not row.get("end"):
+                    row["end"] = datetime_to_string(
+                            datetime.datetime.fromtimestamp(last_write[key]))
+                finished.add(key)
+
+        log.begin()
+        try:
+            for key, row in rows.items():
+                if key in finished:
+                    log.add_row(row)
+        except Exception:
+            log.rollback()
+            raise
+        log.commit()
+
+        for key, row in rows.items():
+            if key not in finished:
+                self._append({"key": key, "add": row, "time": last_write[key]},
+                             locked=False)
+        os.remove(compacting)
+        return len(finished.intersection(rows))
@@ -1,8 +1,27 @@
+import glob
+import gzip
+import hashlib
+import heapq
+import itertools
+import json
 import logging
 import os
+import re
+import shutil
 import sqlite3
-from interactive_list import InteractiveList
+import time
+try:
+    from urllib.request import pathname2url
+except ImportError:
+    from urllib import pathname2url
+from cache import ResultCache
+from completion import PrefixIndex, split_tags
+from filter_query import FilterQuery
+from helpers import file_change_counter, sample_column_widths
 from interactive_params import InteractiveParams
+from row_stream import RowStream
+from snapshot import Snapshot
+from table_view import TableView
 
 class Log:
     """Class that interacts with and manipulates a Krono SQLite database."""
@@ -19,10 +38,55 @@ class Log:
              "project TEXT,"\
              "tags TEXT,"\
              "notes TEXT)"
-
-        self.rows = []
+        self.columns = "id, start, end, project, tags, notes"
+
+        # Duration of each session in seconds (NULL until it has an end
+        # time), added to the sessions table of the DB and of each archive
+        # as an indexed virtual generated column by maintain() (see
+        # _add_duration_column()), mapping schema name to whether the column
+        # exists.
+        self.duration_expr = "CAST(strftime('%s', end) AS INTEGER) - "\
+            "CAST(strftime('%s', start) AS INTEGER)"
+        self._duration_columns = {}
+
+        # SQL built for insert/update/delete/filter queries, keyed by what
+        # the SQL depends on (e.g., the subset of columns being written), so
+        # each distinct statement is built once and SQLite's cache of
+        # prepared statements sees the same SQL text on every call.
+        self._statements = {}
+
+        # Maximum number of IDs deleted per statement by delete(), well
+        # within SQLite's limit on bound variables (999 before 3.32).
+        self.delete_chunk_size = 512
+
+        # Rows in the current selection are loaded lazily on first access of
+        # self.rows (see the rows property), by re-running the most recent
+        # kind of selection: "all" (select_all) or "filter" (filter_rows).
+        self._rows = None
+        self._selection = "all"
         self.last_inserted_row = None
 
+        # Columnar snapshot of the current selection; reset on every write.
+        self._snapshot = None
+
+        # Optional persistent cache of query results (see enable_cache()).
+        self.cache = None
+        self._cache_db_path = None
+
+        # Number of writes made through this Log, part of the result cache
+        # version (see _cache_version()).
+        self._write_generation = 0
+
+        # Per-year archive files (see archive()), mapping year to filepath,
+        # and the set of archive years currently attached to the connection.
+        self.archives = {}
+        self._attached = set()
+
+        # Temporary tables holding the union of more archives than can be
+        # attached at once (see _union_chunks()).
+        self._union_tables = []
+        self._union_ids = itertools.count()
+
         self.default_params = {
             "start": "0000-01-01 00:00:00",
             "end": "9999-12-31 23:59:59",
@@ -31,8 +95,31 @@ class Log:
             "notes": ""
             }
 
+        # Besides the default params, filters may hold a "query" written in
+        # the filter query language (see FilterQuery and set_query()).
         self.filters = dict(self.default_params)
 
+        # How the start/end filters are applied: "contain" selects sessions
+        # that lie entirely within the date range, "overlap" selects sessions
+        # that intersect it (see build_interval_index()).
+        self.filter_mode = "contain"
+        self._interval_index = None
+
+        # Whether the loaded DB was opened read-only (see load_db()).
+        self.read_only = False
+
+        # Whether writes are being queued in an explicit transaction (see
+        # begin()), to be committed or rolled back as a batch.
+        self.in_batch = False
+
+        # Optional (column, descending) sort order of selected rows, applied
+        # with an ORDER BY clause (see _order_clause()).
+        self.order_by = None
+
+        # Prefix indexes of the distinct projects and tags, for
+        # autocompletion; built on first use (see completions()).
+        self._completions = None
+
     ### Methods for creating, loading, and unloading SQLite DB. ###
 
     def _verify_db(self):
@@ -74,16 +161,32 @@ class Log:
             raise e
 
         self._verify_db()
-        self.select_all()
+        self._detect_duration_column("main")
+        self._selection = "all"
+        self._invalidate_rows()
 
-    def load_db(self, filepath):
-        """Load an existing SQLite DB."""
+    def load_db(self, filepath, read_only=False, mmap_size=256*1024*1024):
+        """
+        @brief Load an existing SQLite DB.
+
+        @param filepath Path to the DB file.
+        @param read_only If True, open the DB (and any archives) read-only.
+            Indexes that would otherwise be created on demand (for sorting
+            or overlap queries) are then only used if they already exist.
+        @param mmap_size Maximum number of bytes of a DB opened read-only
+            to access by memory-mapped I/O instead of read() calls.
+        """
 
         if not os.path.isfile(filepath):
             raise FileNotFoundError("The database {} was not found.".format(filepath))
 
         try:
-            self.conn = sqlite3.connect(filepath, check_same_thread=False)
+            if read_only:
+                self.conn = sqlite3.connect(
+                        self._read_only_uri(filepath), uri=True,
+                        check_same_thread=False)
+            else:
+                self.conn = sqlite3.connect(filepath, check_same_thread=False)
             self.cursor = self.conn.cursor()
         except sqlite3.DatabaseError as e:
             self.conn.close()
@@ -91,57 +194,844 @@ class Log:
             self.cursor = None
             raise e
 
+        self.read_only = read_only
+        if read_only:
+            self.cursor.execute("PRAGMA query_only = ON")
+            self.cursor.execute("PRAGMA mmap_size = {:d}".format(mmap_size))
         self._verify_db()
-        self.select_all()
+        self._check_interval_index()
+        self._detect_duration_column("main")
+        self.archives = self._find_archives(filepath)
+        self._selection = "all"
+        self._invalidate_rows()
 
     def unload_db(self):
         """Unload the currently loaded DB."""
 
         if self.conn is not None:
             self.conn.close()
+        if self.cache is not None:
+            self.cache.close()
         self.conn = None
         self.cursor = None
-        self.rows = []
+        self._rows = None
         self.last_inserted_row = None
+        self._snapshot = None
+        self.cache = None
+        self._cache_db_path = None
+        self.archives = {}
+        self._attached = set()
+        self._union_tables = []
+        self._interval_index = None
+        self._duration_columns = {}
+        self._statements = {}
+        self._completions = None
+        self.in_batch = False
+        self.read_only = False
+
+    @staticmethod
+    def _read_only_uri(filepath):
+        """Return an SQLite URI to open the given file read-only."""
+
+        return "file:{}?mode=ro".format(pathname2url(os.path.abspath(filepath)))
+
+    def _db_filepath(self):
+        """Return the path of the file backing the loaded DB."""
+
+        db_path = [row[2] for row in self.cursor.execute(
+            "PRAGMA database_list").fetchall() if row[1] == "main"][0]
+        if not db_path:
+            raise RuntimeError("The loaded database is not backed by a file.")
+        return db_path
+
+    def enable_cache(self, cache_path=None, max_size=32*1024*1024):
+        """
+        @brief Serve repeated filter_rows()/select_all() calls on an unchanged
+            DB from a persistent on-disk result cache.
+
+        Cache entries are keyed by the normalized filter criteria and tagged
+        with a version made of the change counters of the DB file and every
+        attached archive, plus a count of the writes made through this Log
+        (see _cache_version()), so any write to the DB or an archive
+        invalidates them. The cache is off unless enabled.
+
+        @param cache_path Path to the cache file. Defaults to the path of
+            the loaded DB file with "-cache" appended.
+        @param max_size Size cap of the cache in bytes.
+        """
+
+        if self.cursor is None:
+            raise RuntimeError("No database loaded.")
+
+        db_path = self._db_filepath()
+        if cache_path is None:
+            cache_path = db_path + "-cache"
+
+        if self.cache is not None:
+            self.cache.close()
+        self.cache = ResultCache(cache_path, max_size=max_size)
+        self._cache_db_path = db_path
+
+    @classmethod
+    def file_version(cls, filepath):
+        """
+        Return the version of a DB file and all of its archive files (see
+        archive()), as a string of their file change counters, which change
+        with every committed write by any process. All archives are
+        included, attached or not, as a query may attach them a few at a
+        time (see _union_chunks()).
+        """
+
+        archives = cls._find_archives(filepath)
+        counters = [file_change_counter(filepath)]
+        counters.extend(file_change_counter(archives[year])
+                        for year in sorted(archives))
+        return ".".join(str(counter) for counter in counters)
+
+    def _cache_version(self):
+        """
+        Return the version of the loaded DB and its archives used to tag
+        result cache entries: their file version (see file_version()) and
+        this Log's write generation, which changes with every write made
+        through it.
+        """
+
+        return "{}/{}".format(self.file_version(self._cache_db_path),
+                              self._write_generation)
+
+    def _detect_duration_column(self, schema):
+        """
+        Record whether the sessions table in the given schema has the
+        duration_seconds column; until maintain() adds it, durations are
+        computed with duration_expr.
+        """
+
+        columns = [column[1] for column in self.cursor.execute(
+            "PRAGMA {}.table_xinfo('{}')".format(schema, self.table))]
+        self._duration_columns[schema] = "duration_seconds" in columns
+
+    def _add_duration_column(self, schema):
+        """
+        Add the indexed duration_seconds column to the sessions table in the
+        given schema if it lacks the column. Files with the column cannot be
+        opened by SQLite versions before 3.31, so this is only done by
+        maintain().
+        """
+
+        self._detect_duration_column(schema)
+        if self._duration_columns[schema]:
+            return
+        try:
+            self.cursor.execute(
+                    "ALTER TABLE {}.{} ADD COLUMN duration_seconds INTEGER "
+                    "GENERATED ALWAYS AS ({}) VIRTUAL".format(
+                        schema, self.table, self.duration_expr))
+            self.cursor.execute(
+                    "CREATE INDEX IF NOT EXISTS {0}.{1}_duration "
+                    "ON {1} (duration_seconds)".format(schema, self.table))
+            self.conn.commit()
+            self._duration_columns[schema] = True
+        except sqlite3.OperationalError as e:
+            # Generated columns require SQLite 3.31 or later.
+            logging.debug(e)
+            self.conn.rollback()
+
+    def _add_start_index(self, schema):
+        """
+        Index the start column of the sessions table in the given schema, for
+        date range filters (done by maintain()). The index is the one used
+        for sorting by start (see _order_clause()).
+        """
+
+        try:
+            self.cursor.execute(
+                    "CREATE INDEX IF NOT EXISTS {0}.{1}_start ON {1} (start)"
+                    .format(schema, self.table))
+        except sqlite3.OperationalError as e:
+            logging.debug(e)
+
+    @staticmethod
+    def archive_filepath(filepath, year):
+        """
+        Return the path of the archive file for the given year, e.g.,
+        "krono.2019.sqlite" for the DB "krono.sqlite".
+        """
+
+        root, ext = os.path.splitext(filepath)
+        return "{}.{:04d}{}".format(root, int(year), ext)
+
+    @staticmethod
+    def _find_archives(filepath):
+        """Return a dict mapping year to path of existing archive files."""
+
+        root, ext = os.path.splitext(filepath)
+        pattern = re.compile(r"\.(\d{4})" + re.escape(ext) + "$")
+        archives = {}
+        for path in glob.glob(glob.escape(root) + ".[0-9][0-9][0-9][0-9]" + ext):
+            match = pattern.search(path)
+            if match:
+                archives[int(match.group(1))] = path
+        return archives
+
+    def _attach_limit(self):
+        """Return the number of archives that can be attached at once."""
+
+        try:
+            return self.conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+        except AttributeError:
+            # Connection.getlimit() requires Python 3.11; 10 is SQLite's
+            # default limit.
+            return 10
+
+    def _attach_archives(self, years):
+        """
+        Attach the archive files for the given years, first detaching other
+        archives if needed to stay within SQLite's limit on attached DBs (see
+        _attach_limit()).
+        """
+
+        years = set(years)
+        limit = self._attach_limit()
+        if len(years) > limit:
+            raise RuntimeError("Cannot attach more than {:d} archives at once."
+                               .format(limit))
+
+        excess = len(self._attached | years) - limit
+        if excess > 0:
+            for year in sorted(self._attached - years)[:excess]:
+                self._detach_archive(year)
+        for year in sorted(years):
+            self._attach_archive(year)
+
+    def _attach_archive(self, year):
+        """
+        Attach the archive file for the given year, creating it if needed. If
+        as many archives as can be are already attached, the earliest one is
+        detached.
+        """
+
+        if year in self._attached:
+            return
+
+        # ATTACH cannot be run inside a transaction (see begin()).
+        if self.in_batch:
+            raise RuntimeError("Cannot attach the {} archive during a batch; "
+                               "commit or roll back first.".format(year))
+
+        if len(self._attached) >= self._attach_limit():
+            self._detach_archive(min(self._attached))
+
+        filepath = self.archives.get(year)
+        if filepath is None:
+            filepath = self.archive_filepath(self._db_filepath(), year)
+            conn = sqlite3.connect(filepath)
+            conn.execute(self.schema)
+            conn.commit()
+            conn.close()
+            self.archives[year] = filepath
+
+        if self.read_only:
+            filepath = self._read_only_uri(filepath)
+        self.cursor.execute("ATTACH DATABASE ? AS archive_{:04d}".format(year),
+                            (filepath,))
+        self._attached.add(year)
+        self._detect_duration_column("archive_{:04d}".format(year))
+
+    def _detach_archive(self, year):
+        """Detach the archive file for the given year."""
+
+        if self.in_batch:
+            raise RuntimeError("Cannot detach the {} archive during a batch; "
+                               "commit or roll back first.".format(year))
+
+        try:
+            self.cursor.execute("DETACH DATABASE archive_{:04d}".format(year))
+        except sqlite3.OperationalError as e:
+            # E.g., rows of a RowStream are still to be fetched.
+            raise RuntimeError("Cannot detach the {} archive while a query is "
+                               "pending: {}".format(year, e))
+        self._attached.discard(year)
+
+    def attach_archives(self):
+        """
+        Attach all archive files and (re)create the temporary view
+        "all_sessions", the union of the sessions table across the DB and
+        all of its archives. Raises RuntimeError if there are more archives
+        than can be attached at once (see _attach_limit()).
+        """
+
+        if self.cursor is None:
+            raise RuntimeError("No database loaded.")
+
+        self._attach_archives(self.archives)
+
+        self.cursor.execute("DROP VIEW IF EXISTS temp.all_sessions")
+        self.cursor.execute("CREATE TEMP VIEW all_sessions AS {}".format(
+            " UNION ALL ".join("SELECT {} FROM {}.{}".format(
+                self.columns, schema, self.table)
+                for schema in self._partitions())))
+
+    def _partitions(self, years=None, main=True):
+        """
+        Return the schema names of the partitions to query: attached archives
+        (restricted to the given years, if any) in chronological order,
+        followed by the main DB (unless main is False).
+        """
+
+        if years is None:
+            years = self._attached
+        partitions = ["archive_{:04d}".format(year) for year in sorted(years)]
+        if main:
+            partitions.append("main")
+        return partitions
+
+    def _partition_chunks(self):
+        """
+        Yield lists of the schema names of the partitions that may hold a
+        given row: first the main DB and the attached archives (most recent
+        first), then the other archives, attached as many at a time as can
+        be (see _attach_limit()). During a batch, archives cannot be
+        attached, so only the first list is yielded.
+        """
+
+        yield list(reversed(self._partitions()))
+        if self.in_batch:
+            return
+
+        years = sorted(set(self.archives) - self._attached, reverse=True)
+        size = self._attach_limit()
+        for i in range(0, len(years), size):
+            chunk = years[i:i + size]
+            # Outside a batch, writes are committed as they are made anyway;
+            # ATTACH cannot be run inside the transaction they opened.
+            self.conn.commit()
+            self._attach_archives(chunk)
+            yield ["archive_{:04d}".format(year) for year in chunk]
+
+    def _union_chunks(self, years, build):
+        """
+        Return a query selecting the union of the rows selected from the
+        archives for the given years and the main DB, when there are more
+        archives than can be attached at once (see _attach_limit()).
+
+        The archives are attached a chunk at a time, and the rows selected by
+        the query build(chunk, main) returns, along with the values to bind
+        to it, are copied into a temporary table, which the returned query
+        selects from. main is True for the last chunk only. The table is
+        dropped by a later call, once it is no longer being read.
+        """
+
+        table = "{}_union_{:d}".format(self.table, next(self._union_ids))
+        years = sorted(years)
+        size = self._attach_limit()
+        chunks = [years[i:i + size] for i in range(0, len(years), size)]
+
+        # Temporary tables are writable even when the DB files are not.
+        if self.read_only:
+            self.cursor.execute("PRAGMA query_only = OFF")
+        try:
+            for old_table in list(self._union_tables):
+                try:
+                    self.cursor.execute(
+                            "DROP TABLE IF EXISTS temp.{}".format(old_table))
+                    self._union_tables.remove(old_table)
+                except sqlite3.OperationalError as e:
+                    # Still being read, e.g., by a RowStream.
+                    logging.debug(e)
+
+            for i, chunk in enumerate(chunks):
+                self._attach_archives(chunk)
+                query, values = build(chunk, i == len(chunks) - 1)
+                if i == 0:
+                    self.cursor.execute("CREATE TEMP TABLE {} AS {}".format(
+                        table, query), values)
+                else:
+                    self.cursor.execute("INSERT INTO temp.{} {}".format(
+                        table, query), values)
+                # ATTACH cannot be run inside a transaction.
+                self.conn.commit()
+        finally:
+            if self.read_only:
+                self.cursor.execute("PRAGMA query_only = ON")
+        self._union_tables.append(table)
+        return "SELECT * FROM temp.{}".format(table)
 
 
     ### Methods that interact directly with a loaded DB. ###
 
+    def archive(self, cutoff):
+        """
+        @brief Move sessions that started before a cutoff out of the DB and
+            into per-year archive files.
+
+        Archived sessions remain visible to filter_rows(), select_all() and
+        snapshot(), which attach only the archives relevant to a query.
+
+        @param cutoff A datetime string; sessions with an earlier start time
+            are archived.
+        @return The number of sessions moved.
+        """
+
+        if self.cursor is None:
+            raise RuntimeError("No database loaded.")
+
+        if self.in_batch:
+            raise RuntimeError("Cannot archive during a batch.")
+
+        self.cursor.execute(
+                "SELECT DISTINCT CAST(substr(start, 1, 4) AS INTEGER) "
+                "FROM main.{} WHERE start < ?".format(self.table), (cutoff,))
+        years = [row[0] for row in self.cursor.fetchall()]
+        if not years:
+            return 0
+
+        # Moving rows to an archive is not a change to the log's contents, so
+        # drop the deletions it would otherwise record in the change feed.
+        last_seq = self._last_change_seq()
+
+        # ATTACH cannot be run inside a transaction, so the archives of each
+        # chunk of years (as many as can be attached at once) are attached
+        # before moving any rows; each chunk's moves are then committed
+        # atomically.
+        years.sort()
+        size = self._attach_limit()
+        num_moved = 0
+        for i in range(0, len(years), size):
+            chunk = years[i:i + size]
+            self._attach_archives(chunk)
+            for year in chunk:
+                self.cursor.execute(
+                        "INSERT INTO archive_{0:04d}.{1} ({2}) SELECT {2} "
+                        "FROM main.{1} WHERE start < ? "
+                        "AND CAST(substr(start, 1, 4) AS INTEGER) = ?"
+                        .format(year, self.table, self.columns), (cutoff, year))
+            self.cursor.execute(
+                    "DELETE FROM main.{} WHERE start < ? "
+                    "AND CAST(substr(start, 1, 4) AS INTEGER) IN ({})".format(
+                        self.table, ",".join(["?"] * len(chunk))),
+                    [cutoff] + chunk)
+            num_moved += self.cursor.rowcount
+            if last_seq is not None:
+                self.cursor.execute(
+                        "DELETE FROM main.{}_changes WHERE seq > ?".format(
+                            self.table), (last_seq,))
+            self.conn.commit()
+        self._invalidate_rows()
+        return num_moved
+
     def add_row(self, new_row_vals):
         """
         @brief Add a new row to the DB.
 
         @param new_row_vals : A dict containing key/value pairs corresponding
             to the column name and value for each column of the new row.
+        @return The ID of the new row.
         """
 
         if self.cursor is None:
             raise RuntimeError("No database loaded.")
 
-        # Build SQL insert query.
-
         # Get the names of columns in new_row_vals corresponding to actual
         # columns in the table. These column names (and their values) will
         # be supplied to the INSERT INTO query.
-        cols_with_vals = self.get_valid_columns(new_row_vals)
+        cols_with_vals = tuple(self.get_valid_columns(new_row_vals))
+
+        key = ("insert", cols_with_vals)
+        query = self._statements.get(key)
+        if query is None:
+            query = "INSERT INTO {} ({}) VALUES ({})".format(
+                    self.table,
+                    ",".join(cols_with_vals),
+                    ",".join(["?"] * len(cols_with_vals)))
+            self._statements[key] = query
+
+        self.cursor.execute(
+                query, [new_row_vals[column] for column in cols_with_vals])
+        self.last_inserted_row = self.cursor.lastrowid
+        self._add_completions(new_row_vals)
+        if not self.in_batch:
+            self.conn.commit()
+        self._invalidate_rows(selection="filter")
+        return self.last_inserted_row
 
-        query_insert_strings = []
-        value_placeholders = []
-        values = []
+    @staticmethod
+    def backup_manifest(target_filepath):
+        """
+        Return the path of the file recording the versions of the files
+        copied by backup() to target_filepath.
+        """
 
-        for column in cols_with_vals:
-            query_insert_strings.append("{} = ?".format(column))
-            values.append(new_row_vals[column])
-            value_placeholders.append("?")
+        return target_filepath + "-manifest"
 
-        query = "INSERT INTO {} ({}) VALUES ({})".format(
-                self.table,
-                ",".join(cols_with_vals),
-                ",".join(value_placeholders))
+    def backup(self, target_filepath, pages=256, pause=0.005, compress=False):
+        """
+        @brief Back up the DB and its archives with SQLite's online backup API.
+
+        Each file is copied on a separate read-only connection, a few pages
+        at a time, pausing between steps so that writers (e.g., a Session
+        thread tracking a session) are never held up for long; a copy that
+        is interrupted by a write is restarted by SQLite, so it is never
+        torn. Copies are written to temporary files and moved into place
+        once complete.
+
+        Files whose version (file change counter) matches the one recorded
+        in the manifest (see backup_manifest()) at their last backup are
+        skipped, so only changed files are copied again.
+
+        @param target_filepath Path of the backup of the DB; the backups of
+            its archives are named after it (see archive_filepath()).
+        @param pages Number of pages copied per step.
+        @param pause Seconds to sleep between steps.
+        @param compress If True, gzip each backup and add ".gz" to its name.
+        @return The list of backup files written.
+        """
+
+        if self.cursor is None:
+            raise RuntimeError("No database loaded.")
+
+        sources = [(self._db_filepath(), target_filepath)]
+        for year, filepath in sorted(self.archives.items()):
+            sources.append(
+                    (filepath, self.archive_filepath(target_filepath, year)))
+
+        manifest_filepath = self.backup_manifest(target_filepath)
+        try:
+            with open(manifest_filepath) as f:
+                manifest = json.load(f)
+        except (IOError, OSError, ValueError):
+            manifest = {}
+
+        written = []
+        for source, target in sources:
+            if compress:
+                target += ".gz"
+
+            # The version is read before copying, so a write made during the
+            # copy can only cause the file to be copied again next time.
+            version = file_change_counter(source)
+            key = os.path.basename(target)
+            if version is not None and manifest.get(key) == version \
+                    and os.path.isfile(target):
+                continue
+
+            self._backup_file(source, target, pages, pause, compress)
+            manifest[key] = version
+            written.append(target)
+
+        if written:
+            with open(manifest_filepath + ".tmp", "w") as f:
+                json.dump(manifest, f)
+            os.replace(manifest_filepath + ".tmp", manifest_filepath)
+        return written
+
+    def _backup_file(self, source, target, pages, pause, compress):
+        """Copy a DB file to target for backup() (see its parameters)."""
+
+        copy_filepath = target + ".tmp"
+        if os.path.isfile(copy_filepath):
+            os.remove(copy_filepath)
+
+        def progress(status, remaining, total):
+            if pause and remaining:
+                time.sleep(pause)
+
+        source_conn = sqlite3.connect(self._read_only_uri(source), uri=True)
+        try:
+            target_conn = sqlite3.connect(copy_filepath)
+            try:
+                source_conn.backup(target_conn, pages=pages, progress=progress)
+            finally:
+                target_conn.close()
+        finally:
+            source_conn.close()
+
+        if compress:
+            with open(copy_filepath, "rb") as f_in:
+                with gzip.open(copy_filepath + ".gz", "wb") as f_out:
+                    shutil.copyfileobj(f_in, f_out)
+            os.remove(copy_filepath)
+            copy_filepath += ".gz"
+        os.replace(copy_filepath, target)
+
+    def begin(self):
+        """
+        @brief Start a batch: subsequent add_row(), update_row() and delete()
+            calls are queued in a single transaction until commit() or
+            rollback() is called.
+
+        During a batch, updated and deleted rows are patched in the loaded
+        rows instead of re-querying the selection after every write.
+
+        Since archives cannot be attached inside a transaction, they are
+        attached before the batch starts: all of them or, if there are more
+        than can be attached at once (see _attach_limit()), the most recent
+        ones; sessions in the others cannot be modified during the batch.
+        """
+
+        if self.cursor is None:
+            raise RuntimeError("No database loaded.")
+
+        if self.in_batch:
+            raise RuntimeError("A batch is already in progress.")
+
+        self._attach_archives(sorted(self.archives)[-self._attach_limit():])
+        self.cursor.execute("BEGIN")
+        self.in_batch = True
+
+    def build_interval_index(self):
+        """
+        @brief Create (if necessary) an R*Tree index over the time interval
+            of each session, kept up to date by triggers, to support
+            overlap queries in logarithmic time.
+
+        The index is only created explicitly (here, or by maintain()); reads
+        merely use it if it exists (see _detect_interval_index()).
+        Intervals are stored as epoch seconds, from MIN(start, end) to
+        MAX(start, end); an open session (no end time) is indexed as the
+        instant of its start time, and sessions whose start time cannot be
+        parsed are not indexed. If the triggers were missing (see
+        _check_interval_index()), the index is rebuilt.
+
+        @return True if the index is available, False if this SQLite build
+            lacks the R*Tree module (or the index is missing from a DB
+            opened read-only).
+        """
+
+        if self.cursor is None:
+            raise RuntimeError("No database loaded.")
+
+        if self.read_only:
+            return self._detect_interval_index()
+
+        rtree = self.table + "_rtree"
+        start = "CAST(strftime('%s', new.start) AS INTEGER)"
+        end = "COALESCE(CAST(strftime('%s', new.end) AS INTEGER), {})".format(
+                start)
+        interval = "new.id, MIN({0}, {1}), MAX({0}, {1})".format(start, end)
+        indexed = "strftime('%s', new.start) IS NOT NULL"
+        triggers = {
+                rtree + "_insert":
+                    "CREATE TRIGGER {0}_insert AFTER INSERT ON {1} "
+                    "WHEN {3} BEGIN "
+                    "INSERT INTO {0} VALUES ({2}); END",
+                rtree + "_update":
+                    "CREATE TRIGGER {0}_update AFTER UPDATE OF start, end "
+                    "ON {1} BEGIN "
+                    "DELETE FROM {0} WHERE id = old.id; "
+                    "INSERT INTO {0} SELECT {2} WHERE {3}; END",
+                rtree + "_delete":
+                    "CREATE TRIGGER {0}_delete AFTER DELETE ON {1} BEGIN "
+                    "DELETE FROM {0} WHERE id = old.id; END",
+                }
+
+        self.cursor.execute(
+                "SELECT name, sql FROM main.sqlite_master "
+                "WHERE name = ? OR (type = 'trigger' AND tbl_name = ?)",
+                (rtree, self.table))
+        existing = dict(self.cursor.fetchall())
+
+        try:
+            rebuild = rtree not in existing
+            if rebuild:
+                self.cursor.execute(
+                        "CREATE VIRTUAL TABLE main.{} USING rtree"
+                        "(id, min_t, max_t)".format(rtree))
+            else:
+                self.cursor.execute("SELECT 1 FROM main.{} LIMIT 0".format(
+                    rtree))
+
+            # Replace triggers that are missing or differ (e.g., those of
+            # earlier versions, which did not handle end < start).
+            for name, sql in triggers.items():
+                sql = sql.format(rtree, self.table, interval, indexed)
+                if existing.get(name) != sql:
+                    rebuild = rebuild or name not in existing
+                    self.cursor.execute(
+                            "DROP TRIGGER IF EXISTS main.{}".format(name))
+                    self.cursor.execute(sql)
+
+            if rebuild:
+                self.cursor.execute("DELETE FROM main.{}".format(rtree))
+                self.cursor.execute(
+                        "INSERT INTO main.{} SELECT {} FROM main.{} AS new "
+                        "WHERE {}".format(rtree, interval, self.table, indexed))
+        except sqlite3.OperationalError as e:
+            # No R*Tree module in this SQLite build (nothing has been changed
+            # yet).
+            logging.debug(e)
+            self._interval_index = False
+            return False
+
+        if not self.in_batch:
+            self.conn.commit()
+        self._interval_index = True
+        self._statements = {}
+        return True
+
+    def _detect_interval_index(self):
+        """
+        Record and return whether the interval index (see
+        build_interval_index()) exists along with its triggers, without
+        creating it.
+        """
+
+        rtree = self.table + "_rtree"
+        self.cursor.execute(
+                "SELECT COUNT(*) FROM main.sqlite_master WHERE name IN "
+                "(?, ?, ?, ?)", (rtree, rtree + "_insert", rtree + "_update",
+                                 rtree + "_delete"))
+        self._interval_index = self.cursor.fetchone()[0] == 4
+        return self._interval_index
+
+    def _check_interval_index(self):
+        """
+        If the DB has an interval index but this SQLite build lacks the R*Tree
+        module (so that the index's triggers would make every write to the
+        sessions table fail), drop the triggers; the index is then stale
+        and is rebuilt by the next build_interval_index() with the module.
+        """
+
+        if not self._detect_interval_index():
+            return
+
+        try:
+            self.cursor.execute(
+                    "SELECT 1 FROM main.{}_rtree LIMIT 0".format(self.table))
+        except sqlite3.OperationalError as e:
+            self._interval_index = False
+            if self.read_only:
+                return
+            logging.warning("Disabling the interval index: {}".format(e))
+            for suffix in ("insert", "update", "delete"):
+                self.cursor.execute("DROP TRIGGER IF EXISTS main.{}_rtree_{}"
+                                    .format(self.table, suffix))
+            self.conn.commit()
+
+    def enable_change_feed(self):
+        """
+        @brief Create (if necessary) the change feed: a table of changes to
+            the sessions table, each with a monotonically increasing
+            sequence number, populated by insert/update/delete triggers.
+
+        When the feed is first created, every existing session, in the DB
+        and its archives, is recorded as inserted, so the first sync() to
+        another log copies everything. Only changes to the main DB are
+        tracked; archive() does not record the rows it moves, and sessions
+        edited after being archived are not tracked. The feed is compacted
+        by sync() (see _compact_change_feed()).
+
+        @return False if the feed is missing from a DB opened read-only,
+            else True.
+        """
+
+        if self.cursor is None:
+            raise RuntimeError("No database loaded.")
+
+        changes = self.table + "_changes"
+        self.cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = ?", (changes,))
+        if self.cursor.fetchone() is not None:
+            return True
+        if self.read_only:
+            return False
+
+        # Archives are attached (by _select_all_query()) before any writes,
+        # as ATTACH cannot be run inside a transaction.
+        all_ids = self._select_all_query("id")
+        self.cursor.execute(
+                "CREATE TABLE {} (seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "op TEXT, row_id INTEGER)".format(changes))
+        for op, row in (("insert", "new"), ("update", "new"), ("delete", "old")):
+            self.cursor.execute(
+                    "CREATE TRIGGER {0}_{2} AFTER {3} ON {1} BEGIN "
+                    "INSERT INTO {0} (op, row_id) VALUES ('{2}', {4}.id); "
+                    "END".format(changes, self.table, op, op.upper(), row))
+        self.cursor.execute(
+                "INSERT INTO {} (op, row_id) SELECT 'insert', id FROM ({}) "
+                "ORDER BY id".format(changes, all_ids))
+        if not self.in_batch:
+            self.conn.commit()
+        return True
+
+    def _compact_change_feed(self, checkpoint):
+        """
+        Delete the changes up to a sync checkpoint that are superseded by a
+        later change to the same session, so the change feed holds at most
+        one change per session (besides those after the checkpoint) instead
+        of growing with every edit. A sync from any earlier checkpoint still
+        sees every session changed since, as only the latest change to each
+        one matters (see sync()).
+        """
+
+        if self.read_only or self.in_batch:
+            return
+
+        self.cursor.execute(
+                "DELETE FROM main.{0}_changes WHERE seq <= ? AND seq NOT IN "
+                "(SELECT MAX(seq) FROM main.{0}_changes GROUP BY row_id)"
+                .format(self.table), (checkpoint,))
+        self.conn.commit()
+
+    def _last_change_seq(self):
+        """
+        Return the sequence number of the latest change in the change feed
+        (0 if it is empty), or None if there is no change feed.
+        """
+
+        self.cursor.execute(
+                "SELECT 1 FROM main.sqlite_master WHERE name = ?",
+                (self.table + "_changes",))
+        if self.cursor.fetchone() is None:
+            return None
+        self.cursor.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM main.{}_changes".format(
+                    self.table))
+        return self.cursor.fetchone()[0]
+
+    def commit(self):
+        """Commit the writes queued since begin() and end the batch."""
+
+        if not self.in_batch:
+            raise RuntimeError("No batch in progress.")
 
-        self.cursor.execute(query, values)
         self.conn.commit()
-        self.filter_rows()
+        self.in_batch = False
+        self._invalidate_rows()
+
+    def completions(self):
+        """
+        @brief Return prefix indexes (see PrefixIndex) of the distinct
+            projects and tags in the DB and its archives, as a dict with
+            keys "project" and "tags".
+
+        The indexes are built once, with SELECT DISTINCT queries, and then
+        updated as rows are added or modified. Tags are split on commas.
+        """
+
+        if self.cursor is None:
+            raise RuntimeError("No database loaded.")
+
+        if self._completions is None:
+            completions = {}
+            for column in ("project", "tags"):
+                self.cursor.execute(self._select_all_query(
+                    "DISTINCT {}".format(column)))
+                values = [row[0] for row in self.cursor.fetchall() if row[0]]
+                if column == "tags":
+                    values = [tag for tags in values for tag in split_tags(tags)]
+                completions[column] = PrefixIndex(values)
+            self._completions = completions
+        return self._completions
+
+    def _add_completions(self, params):
+        """Add the project and tags in a dict of row values to the indexes."""
+
+        if self._completions is None:
+            return
+        if params.get("project"):
+            self._completions["project"].add(params["project"])
+        for tag in split_tags(params.get("tags") or ""):
+            self._completions["tags"].add(tag)
 
     def delete(self, row_ids_to_delete):
         """
@@ -156,12 +1046,51 @@ class Log:
             raise RuntimeError("No database loaded.")
 
         if row_ids_to_delete:
-            id_placeholders = ["?"] * len(row_ids_to_delete)
-            query = "DELETE FROM {} WHERE id IN ({})".format(
-                    self.table, ",".join(id_placeholders))
-            self.cursor.execute(query, row_ids_to_delete)
-            self.conn.commit()
-            self.filter_rows()
+            # IDs are deleted in chunks of delete_chunk_size; a smaller last
+            # chunk is padded (by repeating its last ID) to a power of two, so
+            # only a few distinct statements are needed for any number of IDs.
+            num_ids = len(row_ids_to_delete)
+            ids = list(row_ids_to_delete)
+            chunks = []
+            for i in range(0, num_ids, self.delete_chunk_size):
+                chunk = ids[i:i + self.delete_chunk_size]
+                num_placeholders = min(1 << (len(chunk) - 1).bit_length(),
+                                       self.delete_chunk_size)
+                chunks.append(chunk + chunk[-1:] * (num_placeholders - len(chunk)))
+
+            # Stop once as many rows as distinct IDs have been deleted.
+            num_to_delete = len(set(ids))
+            num_deleted = 0
+            for schemas in self._partition_chunks():
+                for schema in schemas:
+                    for chunk in chunks:
+                        key = ("delete", schema, len(chunk))
+                        query = self._statements.get(key)
+                        if query is None:
+                            query = "DELETE FROM {}.{} WHERE id IN ({})".format(
+                                    schema, self.table,
+                                    ",".join(["?"] * len(chunk)))
+                            self._statements[key] = query
+                        self.cursor.execute(query, chunk)
+                        num_deleted += self.cursor.rowcount
+                    if num_deleted >= num_to_delete:
+                        break
+                if num_deleted >= num_to_delete:
+                    break
+
+            if self.in_batch:
+                if self._rows is not None:
+                    deleted = set(row_ids_to_delete)
+                    self._rows[:] = [
+                            row for row in self._rows if row[0] not in deleted]
+                self._snapshot = None
+            else:
+                self.conn.commit()
+                self._invalidate_rows(selection="filter")
+
+            if num_deleted < num_to_delete:
+                raise RuntimeError("{:d} of the {:d} IDs were not found.".format(
+                    num_to_delete - num_deleted, num_to_delete))
 
     def filter_rows(self):
         """Select rows from the DB based on the current filter criteria."""
@@ -170,20 +1099,292 @@ class Log:
         if self.cursor is None:
             raise RuntimeError("No database loaded.")
 
+        self._selection = "filter"
         if self.filters:
-            # Build filter select query. Always include date in query.
-            filter_query = "SELECT * FROM {} WHERE ".format(self.table)
-            filter_query += "(start >= ? AND end <= ?"
+            filter_query, filter_values = self._filter_query(self.columns)
+            filter_query += self._order_clause()
+            self.rows = self._cached_select(
+                    filter_query, filter_values, self._filter_key())
 
-            filter_values = [self.filters["start"], self.filters["end"]]
-            for column in ("project", "tags", "notes"):
-                if self.filters[column]:
-                    filter_query += " AND {} LIKE ?".format(column)
-                    filter_values.append("%{}%".format(self.filters[column]))
-            filter_query += ")"
+    def _cached_select(self, query, values, filters):
+        """
+        Execute a select query and return all resulting rows, using the
+        result cache (if enabled) with a key derived from filters.
+        """
+
+        # Uncommitted writes in a batch are not reflected in the DB version.
+        if self.cache is None or self.in_batch:
+            self.cursor.execute(query, values)
+            return self.cursor.fetchall()
+
+        key = ResultCache.normalize_key(
+                self.table, filters, self.filter_mode, self.order_by)
+        version = self._cache_version()
+        rows = self.cache.get(key, version)
+        if rows is None:
+            self.cursor.execute(query, values)
+            rows = self.cursor.fetchall()
+            self.cache.put(key, version, rows)
+        return rows
+
+    def _filter_clause(self, schema="main", bounds=None):
+        """
+        Build the WHERE clause for the current filter criteria, for the
+        sessions table in the given schema, and return it along with the list
+        of values to bind to its placeholders. The date range can be given
+        as an already resolved (start, end) tuple (see _filter_bounds()).
+        """
+
+        query = self._compiled_query()
+        start, end = bounds or self._filter_bounds(query)
+
+        # Always include date in query.
+        if self.filter_mode == "overlap":
+            where_clause = "(start <= ? AND COALESCE(end, start) >= ?"
+            filter_values = [end, start]
+
+            # Narrow candidates with the interval index, if there is one; the
+            # exact comparison above then discards any false positives.
+            if schema == "main" and self._interval_index is not False:
+                if self._interval_index is None:
+                    self._detect_interval_index()
+                if self._interval_index:
+                    where_clause += " AND id IN (SELECT id FROM main.{}_rtree"\
+                        " WHERE min_t <= CAST(strftime('%s', ?) AS INTEGER)"\
+                        " AND max_t >= CAST(strftime('%s', ?) AS INTEGER))"\
+                        .format(self.table)
+                    filter_values += [end, start]
+        else:
+            where_clause = "(start >= ? AND end <= ?"
+            filter_values = [start, end]
+
+        for column in ("project", "tags", "notes"):
+            if self.filters[column]:
+                where_clause += " AND {} LIKE ?".format(column)
+                filter_values.append("%{}%".format(self.filters[column]))
+        if query is not None and query.condition:
+            where_clause += " AND " + query.condition.replace(
+                    "{duration}", self._duration_column(schema))
+            filter_values.extend(query.values)
+        where_clause += ")"
+        return where_clause, filter_values
+
+    def _compiled_query(self):
+        """
+        Return the compiled FilterQuery of self.filters["query"], or None if
+        there is none. Compiled queries are cached by their text.
+        """
+
+        text = self.filters.get("query")
+        if not text:
+            return None
+
+        key = ("query", text)
+        query = self._statements.get(key)
+        if query is None:
+            query = FilterQuery(text)
+            self._statements[key] = query
+        return query
+
+    def _filter_bounds(self, query=None):
+        """
+        Return the (start, end) date range of the current filter criteria,
+        narrowed by the since/until terms of a compiled query.
+        """
+
+        start, end = self.filters["start"], self.filters["end"]
+        if query is not None:
+            query_start, query_end = query.bounds()
+            if query_start is not None:
+                start = max(start, query_start)
+            if query_end is not None:
+                end = min(end, query_end)
+        return start, end
+
+    def filter_bounds(self):
+        """
+        Return the (start, end) date range of the current filter criteria,
+        with any relative dates in the query (e.g., "date:today") resolved.
+        """
+
+        return self._filter_bounds(self._compiled_query())
+
+    def _filter_key(self):
+        """
+        Return the current filter criteria with the date range resolved (see
+        filter_bounds()), for use in cache keys: relative dates in a query
+        (e.g., "date:today") then key different results on different days.
+        """
+
+        start, end = self.filter_bounds()
+        return dict(self.filters, start=start, end=end)
+
+    def _duration_column(self, schema):
+        """
+        Return the SQL for the session duration in seconds in the given
+        schema: the indexed duration column if it exists, else an expression.
+        """
+
+        if self._duration_columns.get(schema):
+            return "duration_seconds"
+        return "({})".format(self.duration_expr)
+
+    def _filter_query(self, columns, min_duration=None, limit=None):
+        """
+        Build a select query for the given columns (a string) of the rows
+        matching the current filter criteria, across the DB and any archives
+        that may contain matching rows, and return it along with the values
+        to bind to its placeholders.
+
+        "{duration}" in columns is replaced by the duration in seconds of
+        each session. Rows can be further restricted to sessions lasting at
+        least min_duration seconds and, if limit is given, to the longest
+        limit sessions of each partition.
+        """
+
+        # Archives are partitioned by start year; since end >= start, only
+        # archives for years within the filter's date range can contain
+        # matching rows. A session overlapping the range may have started
+        # in an earlier year, so in overlap mode only the last year applies.
+        query = self._compiled_query()
+        start, end = self._filter_bounds(query)
+        try:
+            first_year = int(start[:4])
+            last_year = int(end[:4])
+        except (TypeError, ValueError):
+            first_year, last_year = float("-inf"), float("inf")
+        if self.filter_mode == "overlap":
+            first_year = float("-inf")
+        years = sorted(year for year in self.archives
+                       if first_year <= year <= last_year)
+
+        def build(years, main):
+            return self._filter_select(columns, query, (start, end), years,
+                                       main, min_duration, limit)
+
+        if len(years) > self._attach_limit():
+            return self._union_chunks(years, build), []
+        self._attach_archives(years)
+        return build(years, True)
+
+    def _filter_select(self, columns, query, bounds, years, main, min_duration,
+                       limit):
+        """
+        Build the select query of _filter_query() (given the compiled filter
+        query and its resolved date range) over the archives for the given
+        years, which must be attached, and the main DB if main is True.
+        """
+
+        start, end = bounds
+
+        # The query depends only on which filters are set, not their values,
+        # so it is cached by the filter "shape"; on a hit, only the values
+        # to bind are gathered.
+        text_columns = tuple(column for column in ("project", "tags", "notes")
+                             if self.filters[column])
+        condition = query.condition if query is not None else None
+        key = ("filter", columns, self.filter_mode, self._interval_index,
+               text_columns, condition, tuple(years), main,
+               min_duration is not None, limit)
+        cached = self._statements.get(key)
+        if cached is not None:
+            sql, num_selects, uses_index = cached
+            if self.filter_mode == "overlap":
+                values = [end, start]
+            else:
+                values = [start, end]
+            values += ["%{}%".format(self.filters[column])
+                       for column in text_columns]
+            if condition:
+                values += query.values
+            if min_duration is not None:
+                values.append(min_duration)
+
+            filter_values = values * num_selects
+            if uses_index:
+                # The main DB's select comes last; its index bounds come
+                # right after its date bounds.
+                i = len(filter_values) - len(values) + 2
+                filter_values[i:i] = [end, start]
+            return sql, filter_values
+
+        selects = []
+        filter_values = []
+        for schema in self._partitions(years, main):
+            where_clause, values = self._filter_clause(schema, (start, end))
+            duration = self._duration_column(schema)
+
+            select = "SELECT {} FROM {}.{} WHERE {}".format(
+                columns.format(duration=duration), schema, self.table,
+                where_clause)
+            if min_duration is not None:
+                select += " AND {} >= ?".format(duration)
+                values.append(min_duration)
+            if limit is not None:
+                select = "SELECT * FROM ({} ORDER BY {} DESC LIMIT {:d})".format(
+                        select, duration, limit)
+            selects.append(select)
+            filter_values.extend(values)
+
+        sql = " UNION ALL ".join(selects)
+        uses_index = self.filter_mode == "overlap" and main \
+            and bool(self._interval_index)
+        key = key[:3] + (self._interval_index,) + key[4:]
+        self._statements[key] = (sql, len(selects), uses_index)
+        return sql, filter_values
+
+    def set_query(self, text):
+        """
+        @brief Set the filter query (see FilterQuery) used, along with the
+            other filter criteria, by the next filter selection.
+
+        The rows are re-selected when next accessed (see rows).
+
+        @param text The query; raises ValueError if it is malformed. An
+            empty string clears the query.
+        """
+
+        previous = self.filters.get("query")
+        self.filters["query"] = text
+        try:
+            self._compiled_query()
+        except ValueError:
+            self.filters["query"] = previous
+            raise
+        self._invalidate_rows(selection="filter", wrote=False)
+
+    def find_overlaps(self):
+        """
+        @brief Find pairs of sessions, among those matching the current filter
+            criteria, whose time intervals overlap (i.e., double-booked time).
+
+        Uses a sweep over the sessions sorted by start time, keeping a heap
+        of the sessions still open at each start time, so the cost is
+        O(n log n + k) for n sessions and k overlapping pairs.
+
+        @return A list of (row, row) tuples, ordered by the later start time.
+        """
+
+        if self.cursor is None:
+            raise RuntimeError("No database loaded.")
+
+        query, values = self._filter_query(self.columns)
+        self.cursor.execute(
+                "SELECT * FROM ({}) WHERE start IS NOT NULL "
+                "ORDER BY start".format(query), values)
 
-            self.cursor.execute(filter_query, filter_values)
-            self.rows = self.cursor.fetchall()
+        overlaps = []
+        active = []
+        for row in self.cursor:
+            end = row[2] if row[2] is not None else row[1]
+
+            # Drop sessions that ended at or before this one started.
+            while active and active[0][0] <= row[1]:
+                heapq.heappop(active)
+            for _, _, other in sorted(active, key=lambda item: item[1]):
+                overlaps.append((other, row))
+            heapq.heappush(active, (end, row[0], row))
+        return overlaps
 
     def get_last_row_id(self):
         """Get the ID of the last row added to the DB."""
@@ -199,12 +1400,556 @@ class Log:
             logging.error(e)
             return 0
 
+    def longest_sessions(self, limit=10, min_duration=None):
+        """
+        @brief Return the longest sessions matching the current filter
+            criteria, using the index on session duration.
+
+        @param limit Maximum number of sessions to return (None for all).
+        @param min_duration Optional minimum duration in seconds.
+        @return A list of rows, each with the duration in seconds appended,
+            longest first.
+        """
+
+        if self.cursor is None:
+            raise RuntimeError("No database loaded.")
+
+        query, values = self._filter_query(
+                self.columns + ", {duration} AS duration_seconds",
+                min_duration=min_duration, limit=limit)
+        query = "SELECT * FROM ({}) WHERE duration_seconds IS NOT NULL "\
+            "ORDER BY duration_seconds DESC".format(query)
+        if limit is not None:
+            query += " LIMIT {:d}".format(limit)
+        self.cursor.execute(query, values)
+        return self.cursor.fetchall()
+
+    def maintain(self, full_check=False):
+        """
+        @brief Reclaim free pages, refresh the query planner's statistics and
+            check the integrity of the DB and each of its archives.
+
+        DBs are switched to incremental auto-vacuum (with a one-time full
+        VACUUM) on their first maintenance; after that, only the pages on
+        the freelist (left by deletes) are released, with
+        "PRAGMA incremental_vacuum". The sessions table is re-analyzed only
+        if it has no statistics or its row count has changed by more than a
+        tenth since it was last analyzed, after which "PRAGMA optimize"
+        takes care of any other tables. The interval index for overlap
+        queries is created (or repaired) first; see build_interval_index().
+        Indexes that earlier versions created on demand for sorting by end,
+        project, tags or notes are dropped, and the indexed duration column
+        and start index are added where missing (see _add_duration_column()
+        and _add_start_index()).
+
+        @param full_check If True, run "PRAGMA integrity_check" instead of the
+            faster "PRAGMA quick_check".
+        @return A list with a dict for the DB and each archive, with keys
+            "schema", "bytes_reclaimed", "free_pages" (pages released),
+            "analyzed" (bool), and "integrity" (a list of problems found,
+            empty if none).
+        """
+
+        if self.cursor is None:
+            raise RuntimeError("No database loaded.")
+        if self.read_only:
+            raise RuntimeError("Cannot maintain a database opened read-only.")
+        if self.in_batch:
+            raise RuntimeError("Cannot maintain the database during a batch.")
+
+        self.build_interval_index()
+        for column in ("end", "project", "tags", "notes"):
+            self.cursor.execute("DROP INDEX IF EXISTS main.{}_{}".format(
+                self.table, column))
+        self.conn.commit()
+
+        def pragma(schema, name):
+            return self.cursor.execute(
+                    "PRAGMA {}.{}".format(schema, name)).fetchone()[0]
+
+        reports = []
+        for year in sorted(self.archives) + [None]:
+            # Archives are attached one at a time (see _attach_limit()),
+            # leaving room for the DB that VACUUM attaches to rebuild one.
+            for attached in sorted(self._attached):
+                self._detach_archive(attached)
+            if year is None:
+                schema = "main"
+            else:
+                self._attach_archive(year)
+                schema = "archive_{:04d}".format(year)
+
+            self._add_duration_column(schema)
+            self._add_start_index(schema)
+            self.conn.commit()
+
+            page_size = pragma(schema, "page_size")
+            page_count = pragma(schema, "page_count")
+            free_pages = pragma(schema, "freelist_count")
+
+            # VACUUM cannot be run with statements pending or in a
+            # transaction.
+            self.conn.commit()
+            if pragma(schema, "auto_vacuum") != 2:
+                self.cursor.execute(
+                        "PRAGMA {}.auto_vacuum = INCREMENTAL".format(schema))
+                self.cursor.execute("VACUUM {}".format(schema))
+            elif free_pages:
+                # The pragma releases one page per step; unlike execute(),
+                # executescript() steps it to completion.
+                self.conn.executescript(
+                        "PRAGMA {}.incremental_vacuum;".format(schema))
+
+            # Read before ANALYZE adds pages for its statistics. Switching to
+            # incremental auto-vacuum adds a pointer map page, which a small
+            # file may not make up for.
+            bytes_reclaimed = max(
+                    0, (page_count - pragma(schema, "page_count")) * page_size)
+            pages_released = free_pages - pragma(schema, "freelist_count")
+
+            analyzed = self._analyze_if_stale(schema)
+            self.cursor.execute("PRAGMA {}.optimize".format(schema)).fetchall()
+            self.conn.commit()
+
+            check = "integrity_check" if full_check else "quick_check"
+            problems = [row[0] for row in self.cursor.execute(
+                "PRAGMA {}.{}".format(schema, check)).fetchall()
+                if row[0] != "ok"]
+
+            reports.append({
+                "schema": schema,
+                "bytes_reclaimed": bytes_reclaimed,
+                "free_pages": pages_released,
+                "analyzed": analyzed,
+                "integrity": problems,
+                })
+
+        self._invalidate_rows()
+        return reports
+
+    def _analyze_if_stale(self, schema):
+        """
+        Run ANALYZE on the sessions table in the given schema if it has no
+        statistics or its row count has changed by more than a tenth since
+        they were gathered; return whether it was analyzed.
+        """
+
+        num_rows = self.cursor.execute("SELECT COUNT(*) FROM {}.{}".format(
+            schema, self.table)).fetchone()[0]
+
+        analyzed_rows = None
+        has_stats = self.cursor.execute(
+                "SELECT 1 FROM {}.sqlite_master WHERE type = 'table' "
+                "AND name = 'sqlite_stat1'".format(schema)).fetchone()
+        if has_stats:
+            row = self.cursor.execute(
+                    "SELECT stat FROM {}.sqlite_stat1 WHERE tbl = ?".format(
+                        schema), (self.table,)).fetchone()
+            if row is not None:
+                analyzed_rows = int(row[0].split()[0])
+
+        if analyzed_rows is not None and \
+                abs(num_rows - analyzed_rows) <= analyzed_rows // 10:
+            return False
+
+        self.cursor.execute("ANALYZE {}.{}".format(schema, self.table))
+        return True
+
+    def merge(self, source_filepath, batch_size=10000):
+        """
+        @brief Copy the sessions of another log (and its archives) into this
+            log, skipping sessions already present.
+
+        Sessions are deduplicated by a hash of their content (start, end,
+        project, tags, notes); a set of the hashes of this log's sessions
+        is built in one pass and then extended as rows are inserted, so
+        duplicates within the source log are skipped too. New rows are
+        inserted in batches with executemany() and committed in one
+        transaction. Merged sessions get new IDs.
+
+        @param source_filepath Path to the log to merge from (opened
+            read-only).
+        @param batch_size Number of rows fetched/inserted at a time.
+        @return A tuple (number of sessions inserted, number skipped).
+        """
+
+        if self.cursor is None:
+            raise RuntimeError("No database loaded.")
+
+        columns = "start, end, project, tags, notes"
+        hashes = set()
+        cursor = self.conn.cursor()
+        cursor.execute(self._select_all_query(columns))
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            hashes.update(self.content_hash(row) for row in batch)
+
+        source = Log()
+        source.load_db(source_filepath, read_only=True)
+        num_inserted = 0
+        num_skipped = 0
+        insert_query = "INSERT INTO main.{} ({}) VALUES (?, ?, ?, ?, ?)".format(
+                self.table, columns)
+        try:
+            source.cursor.execute(source._select_all_query(columns))
+            while True:
+                batch = source.cursor.fetchmany(batch_size)
+                if not batch:
+                    break
+
+                new_rows = []
+                for row in batch:
+                    row_hash = self.content_hash(row)
+                    if row_hash in hashes:
+                        num_skipped += 1
+                    else:
+                        hashes.add(row_hash)
+                        new_rows.append(row)
+
+                if new_rows:
+                    cursor.executemany(insert_query, new_rows)
+                    num_inserted += len(new_rows)
+        except Exception:
+            if not self.in_batch:
+                self.conn.rollback()
+            raise
+        finally:
+            source.unload_db()
+            cursor.close()
+
+        if not self.in_batch:
+            self.conn.commit()
+        self._completions = None
+        self._invalidate_rows()
+        return num_inserted, num_skipped
+
+    def rollback(self):
+        """Discard the writes queued since begin() and end the batch."""
+
+        if not self.in_batch:
+            raise RuntimeError("No batch in progress.")
+
+        self.conn.rollback()
+        self.in_batch = False
+        self._completions = None
+
+        # Schema changes made during the batch (e.g., by
+        # build_interval_index()) were rolled back too, so forget what is
+        # known about the schema and any SQL built for it.
+        self._interval_index = None
+        self._statements = {}
+        self._duration_columns = {}
+        for schema in self._partitions():
+            self._detect_duration_column(schema)
+        self._invalidate_rows()
+
     def select_all(self):
         """Select all sessions in the DB."""
 
         # TODO: sort rows by datetime
-        self.cursor.execute("SELECT * FROM {}".format(self.table))
-        self.rows = self.cursor.fetchall()
+        self._selection = "all"
+        query = self._select_all_query(self.columns) + self._order_clause()
+        self.rows = self._cached_select(query, [], None)
+
+    def iter_filtered(self, batch_size=1000):
+        """
+        @brief Yield the rows matching the current filter criteria, sorted by
+            start time, in lists of up to batch_size rows.
+
+        The rows are read with a separate cursor, bypassing the result cache
+        and self.rows, so only one batch is held in memory at a time.
+
+        @param batch_size Number of rows fetched at a time.
+        """
+
+        if self.cursor is None:
+            raise RuntimeError("No database loaded.")
+
+        query, values = self._filter_query(self.columns)
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(query + " ORDER BY start", values)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
+
+    def stream_rows(self, batch_size=1000):
+        """
+        @brief Run the current selection (see select_all(), filter_rows())
+            and return its rows as a RowStream, of which only the first
+            batch has been fetched.
+
+        Neither the result cache nor self.rows is used, so the first rows
+        are available without reading the whole selection.
+
+        @param batch_size Number of rows fetched at a time.
+        """
+
+        if self.cursor is None:
+            raise RuntimeError("No database loaded.")
+
+        if self._selection == "all":
+            query, values = self._select_all_query(self.columns), []
+        else:
+            query, values = self._filter_query(self.columns)
+
+        cursor = self.conn.cursor()
+        cursor.execute(query + self._order_clause(), values)
+        return RowStream(cursor, batch_size=batch_size)
+
+    def sync(self, target_filepath, batch_size=500):
+        """
+        @brief Apply the changes made to this log since the last sync to
+            another log.
+
+        Changes are read from the change feed (see enable_change_feed())
+        after the checkpoint stored in the target's "sync_checkpoints"
+        table, so the cost of a sync depends on the number of edits rather
+        than the size of the log. Multiple changes to the same session are
+        collapsed: its current row is copied to the target, or deleted from
+        the target if it no longer exists here. The changes and the new
+        checkpoint are committed to the target in one transaction, after
+        which the change feed is compacted up to the checkpoint.
+
+        Sessions copied to the target get IDs of its own; the target's
+        "sync_ids" table maps the IDs of each source log to them, so the
+        target can hold sessions of its own or of several sources.
+
+        @param target_filepath Path to the log to update (created if it
+            does not exist).
+        @param batch_size Number of sessions read/written at a time.
+        @return The number of sessions copied or deleted.
+        """
+
+        if self.cursor is None:
+            raise RuntimeError("No database loaded.")
+
+        if not self.enable_change_feed():
+            raise RuntimeError("The database has no change feed.")
+
+        source_key = os.path.abspath(self._db_filepath())
+        target = Log()
+        if os.path.isfile(target_filepath):
+            target.load_db(target_filepath)
+        else:
+            target.create_db(target_filepath)
+
+        try:
+            target.begin()
+
+            target.cursor.execute(
+                    "CREATE TABLE IF NOT EXISTS sync_checkpoints "
+                    "(source TEXT PRIMARY KEY, seq INTEGER)")
+            target.cursor.execute(
+                    "CREATE TABLE IF NOT EXISTS sync_ids (source TEXT, "
+                    "source_id INTEGER, target_id INTEGER, "
+                    "PRIMARY KEY (source, source_id))")
+            target.cursor.execute(
+                    "SELECT seq FROM sync_checkpoints WHERE source = ?",
+                    (source_key,))
+            row = target.cursor.fetchone()
+            checkpoint = row[0] if row is not None else 0
+
+            self.cursor.execute(
+                    "SELECT row_id, MAX(seq) FROM main.{}_changes "
+                    "WHERE seq > ? GROUP BY row_id".format(self.table),
+                    (checkpoint,))
+            changed = self.cursor.fetchall()
+            if not changed:
+                target.commit()
+                return 0
+
+            row_ids = [row_id for row_id, _ in changed]
+            last_seq = max(seq for _, seq in changed)
+
+            # Rows are read after the feed, so they may reflect newer changes
+            # than last_seq; reapplying those on the next sync is harmless.
+            query = "SELECT * FROM ({}) WHERE id IN ({{}})".format(
+                    self._select_all_query(self.columns))
+            ids_query = "SELECT source_id, target_id FROM sync_ids "\
+                "WHERE source = ? AND source_id IN ({})"
+            update_query = "UPDATE {{}}.{} SET start = ?, end = ?, "\
+                "project = ?, tags = ?, notes = ? WHERE id = ?".format(
+                    target.table)
+            insert_query = "INSERT INTO main.{} (start, end, project, tags, "\
+                "notes) VALUES (?, ?, ?, ?, ?)".format(target.table)
+            for i in range(0, len(row_ids), batch_size):
+                batch_ids = row_ids[i:i + batch_size]
+                placeholders = ",".join(["?"] * len(batch_ids))
+                self.cursor.execute(query.format(placeholders), batch_ids)
+                current = {row[0]: row for row in self.cursor.fetchall()}
+                target.cursor.execute(ids_query.format(placeholders),
+                                      [source_key] + batch_ids)
+                target_ids = dict(target.cursor.fetchall())
+
+                deleted = [row_id for row_id in batch_ids
+                           if row_id not in current and row_id in target_ids]
+                if deleted:
+                    target.delete([target_ids[row_id] for row_id in deleted])
+                    target.cursor.executemany(
+                            "DELETE FROM sync_ids WHERE source = ? "
+                            "AND source_id = ?",
+                            [(source_key, row_id) for row_id in deleted])
+
+                for row_id in sorted(current):
+                    row = current[row_id]
+                    target_id = target_ids.get(row_id)
+                    if target_id is not None:
+                        values = list(row[1:]) + [target_id]
+                        for schema in reversed(target._partitions()):
+                            target.cursor.execute(
+                                    update_query.format(schema), values)
+                            if target.cursor.rowcount:
+                                break
+                        else:
+                            # Deleted from the target; copy it again.
+                            target_id = None
+
+                    if target_id is None:
+                        target.cursor.execute(insert_query, row[1:])
+                        target.cursor.execute(
+                                "INSERT OR REPLACE INTO sync_ids "
+                                "VALUES (?, ?, ?)", (source_key, row_id,
+                                                     target.cursor.lastrowid))
+
+            target.cursor.execute(
+                    "INSERT OR REPLACE INTO sync_checkpoints VALUES (?, ?)",
+                    (source_key, last_seq))
+            target.commit()
+        except Exception:
+            target.conn.rollback()
+            raise
+        finally:
+            target.unload_db()
+
+        self._compact_change_feed(last_seq)
+        return len(row_ids)
+
+    def _select_all_query(self, columns):
+        """
+        Return a query selecting the given columns (a string) of all rows in
+        the DB and all of its archives.
+        """
+
+        def build(years, main):
+            return " UNION ALL ".join(
+                    "SELECT {} FROM {}.{}".format(columns, schema, self.table)
+                    for schema in self._partitions(years, main)), []
+
+        years = sorted(self.archives)
+        if len(years) > self._attach_limit():
+            return self._union_chunks(years, build)
+        self._attach_archives(years)
+        return build(years, True)[0]
+
+    def _order_clause(self):
+        """
+        Return the ORDER BY clause for self.order_by (by default, by ID, so
+        that rows come in the same order whatever partitions they are in).
+
+        No index is created here: sorting by id or start uses the row IDs or
+        the start index created by maintain() (see _add_start_index()), and
+        SQLite sorts by any other column without an index.
+        """
+
+        if self.order_by is None:
+            return " ORDER BY id"
+
+        column, descending = self.order_by
+        return " ORDER BY {} {}".format(column, "DESC" if descending else "ASC")
+
+    def snapshot(self, batch_size=1000, selection=None, refresh=False):
+        """
+        @brief Return a columnar Snapshot of the rows in the current
+            selection: all rows (see select_all()) or the rows matching the
+            current filter criteria (see filter_rows()).
+
+        The snapshot is built in one pass over the query results and cached
+        until the selection or filters change or the DB is next written to.
+
+        @param batch_size Number of rows to fetch from the DB at a time.
+        @param selection "all" or "filter" to take a snapshot of that
+            selection instead of the current one.
+        @param refresh If True, rebuild the snapshot even if one is cached,
+            e.g., if another process may have written to the DB.
+        """
+
+        if self.cursor is None:
+            raise RuntimeError("No database loaded.")
+
+        if selection is None:
+            selection = self._selection
+        if selection not in ("all", "filter"):
+            raise ValueError("Invalid selection {}.".format(selection))
+
+        columns = "id, CAST(strftime('%s', start) AS INTEGER), "\
+            "CAST(strftime('%s', end) AS INTEGER), project, tags"
+        if selection == "all":
+            key = (selection,)
+        else:
+            key = (selection, self.filter_mode, self._filter_key())
+        if self._snapshot is not None and self._snapshot[0] == key \
+                and not refresh:
+            return self._snapshot[1]
+
+        if selection == "all":
+            query, values = self._select_all_query(columns), []
+        else:
+            query, values = self._filter_query(columns)
+
+        # Use a separate cursor so self.rows/self.cursor are unaffected.
+        cursor = self.conn.cursor()
+        cursor.execute(query, values)
+        snapshot = Snapshot.from_cursor(cursor, batch_size=batch_size)
+        cursor.close()
+
+        self._snapshot = (key, snapshot)
+        return snapshot
+
+    def sort_rows(self, column, descending=False):
+        """
+        @brief Sort the current selection by a column and return its rows.
+
+        Sorting is done by the DB, by re-running the current selection with
+        an ORDER BY clause (see _order_clause()).
+
+        @param column One of the valid columns (see get_valid_columns()).
+        @param descending Whether to sort in descending order.
+        """
+
+        if self.cursor is None:
+            raise RuntimeError("No database loaded.")
+
+        if not self.get_valid_columns({column: None}):
+            raise ValueError("Cannot sort by {}.".format(column))
+
+        self.order_by = (column, descending)
+        if self._selection == "all":
+            self.select_all()
+        else:
+            self.filter_rows()
+        return self.rows
+
+    def total_duration(self):
+        """
+        Return the total duration in seconds of the sessions matching the
+        current filter criteria (ignoring sessions without an end time).
+        """
+
+        if self.cursor is None:
+            raise RuntimeError("No database loaded.")
+
+        query, values = self._filter_query("{duration} AS duration_seconds")
+        self.cursor.execute(
+                "SELECT COALESCE(SUM(duration_seconds), 0) FROM ({})".format(
+                    query), values)
+        return self.cursor.fetchone()[0]
 
     def update_row(self, row_id, updated_params):
         """Update the columns a row in the DB based on its ID number."""
@@ -217,30 +1962,91 @@ class Log:
         if not cols_to_update:
             raise RuntimeError("No valid parameters supplied.")
 
-        # Build SQL update query.
-        query_update_strings = []
-        values = []
-
-        for column in cols_to_update:
-            query_update_strings.append("{} = ?".format(column))
-            values.append(updated_params[column])
+        values = [updated_params[column] for column in cols_to_update]
         values.append(row_id)
 
-        query = "UPDATE {} SET\n{}\nWHERE id = ?".format(
-            self.table, ",\n".join(query_update_strings))
+        # The row may be in the DB or in any archive; the DB is checked
+        # first, since it holds the most recent (i.e., most edited) rows.
+        cols_to_update = tuple(cols_to_update)
+        updated = False
+        for schemas in self._partition_chunks():
+            for schema in schemas:
+                key = ("update", schema, cols_to_update)
+                query = self._statements.get(key)
+                if query is None:
+                    query = "UPDATE {}.{} SET {} WHERE id = ?".format(
+                        schema, self.table,
+                        ", ".join("{} = ?".format(column)
+                                  for column in cols_to_update))
+                    self._statements[key] = query
+                self.cursor.execute(query, values)
+                if self.cursor.rowcount:
+                    updated = True
+                    break
+            if updated:
+                break
+        if not updated:
+            raise RuntimeError("No session with ID {}.".format(row_id))
+        self._add_completions(updated_params)
+
+        if self.in_batch:
+            if self._rows is not None:
+                columns = ["id"] + self.get_valid_columns(self.default_params)
+                for i, row in enumerate(self._rows):
+                    if row[0] == row_id:
+                        row = list(row)
+                        for column in cols_to_update:
+                            row[columns.index(column)] = updated_params[column]
+                        self._rows[i] = tuple(row)
+            self._snapshot = None
+        else:
+            self.conn.commit()
+            self._invalidate_rows(selection="filter")
 
-        self.cursor.execute(query, values)
-        self.conn.commit()
-        self.filter_rows()
+
+    def _invalidate_rows(self, selection=None, wrote=True):
+        """
+        Mark the loaded rows and snapshot as stale after a write (or, if
+        wrote is False, a change of selection), so they are re-queried only
+        if and when they are next accessed.
+        """
+
+        if selection is not None:
+            self._selection = selection
+        if wrote:
+            self._write_generation += 1
+        self._rows = None
+        self._snapshot = None
+
+    @property
+    def rows(self):
+        """Rows in the current selection, queried from the DB on demand."""
+
+        if self._rows is None:
+            if self.cursor is None:
+                return []
+
+            if self._selection == "all":
+                self.select_all()
+            else:
+                self.filter_rows()
+
+            if self._rows is None:
+                self._rows = []
+        return self._rows
+
+    @rows.setter
+    def rows(self, rows):
+        self._rows = rows
 
 
     ### Methods, properties that do not directly interact with a DB. ###
 
     def delete_entries(self):
-        if self.formatted_rows:
-            selections = InteractiveList(
-                    self.formatted_rows,
-                    select_mode="multi").start()
+        if self.rows:
+            selections = TableView(
+                    self.rows, self.get_valid_columns(self.default_params),
+                    select_mode="multi", sort_rows=self.sort_rows).start()
             if selections:
                 self.delete([self.rows[i][0] for i in selections])
         else:
@@ -250,16 +2056,29 @@ class Log:
     def formatted_rows(self):
         """Format the currently selected rows and return a list of strings."""
 
-        format_spec = "{{}} | {{}} | {{:{w}.{w}}} | {{:{w}.{w}}} | {{:{w}.{w}}}"
-        width = 8
-        format_spec = format_spec.format(w=width)
-        return [format_spec.format(*row[1:]) for row in self.rows]
+        return self.format_rows(self.rows)
+
+    @staticmethod
+    def format_rows(rows, sample_size=200, widths=None):
+        """
+        Format the given rows and return a list of strings, with column
+        widths estimated from a sample of the rows unless given (as returned
+        by sample_column_widths()).
+        """
+
+        if widths is None:
+            widths = sample_column_widths(rows, sample_size=sample_size)
+        widths = widths[1:6]
+        return [" | ".join(
+                    "{:<{w}.{w}}".format("" if value is None else value, w=w)
+                    for value, w in zip(row[1:6], widths))
+                for row in rows]
 
     def modify_entry(self):
-        if self.formatted_rows:
-            selection = InteractiveList(
-                    self.formatted_rows,
-                    select_mode="single").start()
+        if self.rows:
+            selection = TableView(
+                    self.rows, self.get_valid_columns(self.default_params),
+                    select_mode="single", sort_rows=self.sort_rows).start()
             if selection is not None:
                 row = self.rows[selection]
                 row_id = row[0]
@@ -270,7 +2089,8 @@ class Log:
                                     "project": row[3],
                                     "tags": row[4],
                                     "notes": row[5]
-                                    }, header_text="Modify Entry").start()
+                                    }, header_text="Modify Entry",
+                                    completions=self.completions()).start()
 
                 if modified_params:
                     self.update_row(row_id, modified_params)
@@ -280,11 +2100,27 @@ class Log:
     def modify_filter(self):
         """Modify the parameters of the current filter."""
 
+        previous_filters = self.filters
         filters = InteractiveParams(
-                    self.filters, header_text="Filter Criteria").start()
+                    dict(self.filters, query=self.filters.get("query", "")),
+                    header_text="Filter Criteria",
+                    completions=self.completions()).start()
         if filters:
             self.filters = filters
-            self.filter_rows()
+            try:
+                self.filter_rows()
+            except ValueError as e:
+                logging.error(e)
+                self.filters = previous_filters
+
+    @staticmethod
+    def content_hash(values):
+        """
+        Return a digest of a sequence of column values (e.g., start, end,
+        project, tags, notes), used to identify duplicate sessions.
+        """
+
+        return hashlib.sha1(json.dumps(list(values)).encode()).digest()
 
     @staticmethod
     def get_valid_columns(params):
@@ -293,10 +2129,18 @@ class Log:
         valid_columns = ("start", "end", "project", "tags", "notes")
         return [column for column in valid_columns if column in params]
 
-    def view(self):
-        """List the rows in the current selection with a curses window."""
+    def view(self, stream=False):
+        """
+        @brief List the rows in the current selection with a curses window.
+
+        @param stream If True, show the first rows as soon as they are read
+            and read the rest while waiting for keypresses (see
+            stream_rows()), instead of reading all rows first.
+        """
 
-        if self.formatted_rows:
-            InteractiveList(self.formatted_rows, select_mode="off").start()
+        rows = self.stream_rows() if stream else self.rows
+        if rows:
+            TableView(rows, self.get_valid_columns(self.default_params),
+                      select_mode="off", sort_rows=self.sort_rows).start()
         else:
             logging.info("No entries matching the current selection.")
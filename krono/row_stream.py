@@ -0,0 +1,43 @@
+class RowStream(list):
+    """
+    List of the rows of an executed query that is filled incrementally:
+    the first batch of rows is fetched on creation and the rest on demand
+    with fetch_more(), so that the first rows can be shown before the query
+    has been read to the end.
+    """
+
+    def __init__(self, cursor, batch_size=1000):
+        """
+        @param cursor A cursor on which a select query has been executed.
+            It is closed once all rows have been fetched.
+        @param batch_size Number of rows fetched at a time.
+        """
+
+        list.__init__(self)
+        self.cursor = cursor
+        self.batch_size = batch_size
+        self.done = False
+        self.fetch_more()
+
+    def fetch_more(self, num_rows=None):
+        """
+        Fetch up to num_rows (default: batch_size) more rows and return the
+        number of rows fetched.
+        """
+
+        if self.done:
+            return 0
+
+        rows = self.cursor.fetchmany(num_rows or self.batch_size)
+        self.extend(rows)
+        if len(rows) < (num_rows or self.batch_size):
+            self.cursor.close()
+            self.cursor = None
+            self.done = True
+        return len(rows)
+
+    def fetch_all(self):
+        """Fetch all remaining rows."""
+
+        while not self.done:
+            self.fetch_more()
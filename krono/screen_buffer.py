@@ -0,0 +1,84 @@
+import curses
+
+class ScreenBuffer:
+    """
+    Wrapper around a curses window that remembers the text and attribute
+    of each line last drawn, so that redrawing a frame only sends the parts
+    of lines that actually changed. Callers should batch updates with
+    noutrefresh() and a single curses.doupdate() per keypress.
+    """
+
+    def __init__(self, win):
+        """@param win A curses window, assumed to be blank."""
+
+        self.win = win
+        self.height, self.width = win.getmaxyx()
+        self.lines = [("", curses.A_NORMAL)] * self.height
+
+    def set_line(self, y, text, attr=curses.A_NORMAL):
+        """
+        @brief Make line y of the window show text with the given attribute.
+
+        If the attribute is unchanged, only the characters from the first
+        difference onward are rewritten, and the line is only cleared past
+        the end of the new text if the old text was longer.
+        """
+
+        # Never write to the last column, which fails on the last line.
+        text = text[:self.width - 1]
+        old_text, old_attr = self.lines[y]
+        if text == old_text and attr == old_attr:
+            return
+
+        x = 0
+        if attr == old_attr:
+            max_x = min(len(text), len(old_text))
+            while x < max_x and text[x] == old_text[x]:
+                x += 1
+
+        if x < len(text):
+            self.win.addnstr(y, x, text[x:], len(text) - x, attr)
+        if len(text) < len(old_text):
+            self.win.move(y, len(text))
+            self.win.clrtoeol()
+        self.lines[y] = (text, attr)
+
+    def draw(self, lines):
+        """
+        Draw a frame, given as a list of (text, attr) tuples for the lines of
+        the window; lines beyond the end of the list are blanked.
+        """
+
+        for y in range(self.height):
+            if y < len(lines):
+                self.set_line(y, *lines[y])
+            else:
+                self.set_line(y, "")
+
+    def scroll(self, num_lines):
+        """
+        Scroll the window contents up (positive) or down (negative) by
+        num_lines with a single scroll operation, so that only the lines
+        exposed by scrolling need to be drawn by the next draw() call.
+        """
+
+        if num_lines == 0:
+            return
+
+        blank = ("", curses.A_NORMAL)
+        if abs(num_lines) >= self.height:
+            # Nothing on screen would survive; just clear it.
+            self.win.erase()
+            self.lines = [blank] * self.height
+            return
+
+        self.win.scrollok(True)
+        self.win.scroll(num_lines)
+        self.win.scrollok(False)
+        if num_lines > 0:
+            self.lines = self.lines[num_lines:] + [blank] * num_lines
+        else:
+            self.lines = [blank] * -num_lines + self.lines[:num_lines]
+
+    def noutrefresh(self):
+        self.win.noutrefresh()
@@ -0,0 +1,310 @@
+import csv
+import io
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from queue import Queue
+    from urllib.parse import parse_qs, urlparse
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from Queue import Queue
+    from urlparse import parse_qs, urlparse
+from log import Log
+
+class QueryCache:
+    """
+    Thread-safe, in-memory LRU cache of encoded responses, each tagged with
+    the version (see Log.file_version()) of the DB it was computed from.
+    """
+
+    def __init__(self, max_entries=64, max_entry_size=1024*1024):
+        self.max_entries = max_entries
+        self.max_entry_size = max_entry_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        """Return the cached (content type, body) for key, or None."""
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1], entry[2]
+
+    def put(self, key, version, content_type, body):
+        if len(body) > self.max_entry_size:
+            return
+
+        with self._lock:
+            self._entries[key] = (version, content_type, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class LogServer(HTTPServer):
+    """
+    HTTP server that answers read-only queries on a Krono log with a fixed
+    pool of worker threads. Each worker lazily opens its own read-only
+    connection to the log (see get_log()) and reuses it for every request
+    it handles.
+    """
+
+    def __init__(self, address, db_filepath, num_workers=4, cache_size=64):
+        """
+        @param address (host, port) tuple; port 0 picks a free port.
+        @param db_filepath Path to the log to serve.
+        @param num_workers Number of worker threads.
+        @param cache_size Maximum number of cached query responses.
+        """
+
+        if not os.path.isfile(db_filepath):
+            raise FileNotFoundError(
+                    "The database {} was not found.".format(db_filepath))
+
+        HTTPServer.__init__(self, address, LogRequestHandler)
+        self.db_filepath = os.path.abspath(db_filepath)
+        self.cache = QueryCache(max_entries=cache_size)
+        self._local = threading.local()
+        self._requests = Queue()
+        self._workers = []
+        for _ in range(num_workers):
+            worker = threading.Thread(target=self._work)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def get_log(self):
+        """Return the calling thread's read-only Log, loading it if needed."""
+
+        log = getattr(self._local, "log", None)
+        if log is None:
+            log = Log()
+            log.load_db(self.db_filepath, read_only=True)
+            self._local.log = log
+        return log
+
+    def db_version(self):
+        """Return the version of the log and its archives (see QueryCache)."""
+
+        return Log.file_version(self.db_filepath)
+
+    def process_request(self, request, client_address):
+        """Queue the request for a worker instead of handling it inline."""
+
+        self._requests.put((request, client_address))
+
+    def _work(self):
+        while True:
+            request, client_address = self._requests.get()
+            if request is None:
+                break
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+        log = getattr(self._local, "log", None)
+        if log is not None:
+            log.unload_db()
+
+    def server_close(self):
+        HTTPServer.server_close(self)
+        for _ in self._workers:
+            self._requests.put((None, None))
+        for worker in self._workers:
+            worker.join()
+
+
+class LogRequestHandler(BaseHTTPRequestHandler):
+    """
+    Handler for the JSON endpoints of LogServer, all of which take the
+    filter criteria as query parameters ("start", "end", "project", "tags",
+    "notes", "query" in the filter query language (see FilterQuery), and
+    "mode", either "contain" or "overlap"):
+
+        /filter              JSON list of matching sessions.
+        /report?by=project   JSON object of total duration (seconds) per
+                             project (or "tags").
+        /export?format=csv   Matching sessions as CSV, or as one JSON
+                             object per line ("jsonl", the default).
+
+    Responses are streamed with chunked transfer encoding, and those small
+    enough are cached (see QueryCache) until the log next changes.
+    """
+
+    protocol_version = "HTTP/1.1"
+    batch_size = 500
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = dict((key, values[-1])
+                      for key, values in parse_qs(url.query).items())
+
+        endpoints = {
+                "/filter": self._filter,
+                "/report": self._report,
+                "/export": self._export,
+                }
+        if url.path not in endpoints:
+            self._send_error(404, "Unknown endpoint {}.".format(url.path))
+            return
+
+        try:
+            log = self.server.get_log()
+            self._set_filters(log, params)
+        except ValueError as e:
+            self._send_error(400, str(e))
+            return
+        except Exception as e:
+            logging.error(e)
+            self._send_error(500, str(e))
+            return
+
+        # The resolved date range is part of the key, as the query may have
+        # relative dates (e.g., "date:today").
+        key = json.dumps([url.path, sorted(params.items()),
+                          log.filter_bounds()])
+        version = self.server.db_version()
+        cached = self.server.cache.get(key, version)
+        if cached is not None:
+            self._send_body(200, *cached)
+            return
+
+        try:
+            content_type, chunks = endpoints[url.path](log, params)
+        except ValueError as e:
+            self._send_error(400, str(e))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        body = []
+        body_size = 0
+        for chunk in chunks:
+            if not chunk:
+                continue
+            self.wfile.write("{:x}\r\n".format(len(chunk)).encode()
+                             + chunk + b"\r\n")
+            if body is not None:
+                body.append(chunk)
+                body_size += len(chunk)
+                if body_size > self.server.cache.max_entry_size:
+                    body = None
+
+        # Cache the body before ending the response, so that a client's next
+        # request can be served from the cache.
+        if body is not None:
+            self.server.cache.put(key, version, content_type, b"".join(body))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+    def _send_body(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message):
+        self._send_body(status, "application/json",
+                        json.dumps({"error": message}).encode())
+
+    @staticmethod
+    def _set_filters(log, params):
+        """Set the filter criteria of log from the query parameters."""
+
+        mode = params.get("mode", "contain")
+        if mode not in ("contain", "overlap"):
+            raise ValueError("Invalid filter mode {}.".format(mode))
+
+        log.filter_mode = mode
+        log.filters = dict(log.default_params)
+        for column in log.default_params:
+            if params.get(column):
+                log.filters[column] = params[column]
+        if params.get("query"):
+            log.set_query(params["query"])
+
+    def _rows(self, log):
+        """Generate lists of rows matching the current filters of log."""
+
+        return log.iter_filtered(batch_size=self.batch_size)
+
+    def _filter(self, log, params):
+        columns = ["id"] + log.get_valid_columns(log.default_params)
+
+        def chunks():
+            separator = b"["
+            for rows in self._rows(log):
+                yield separator + b",".join(
+                        json.dumps(dict(zip(columns, row))).encode()
+                        for row in rows)
+                separator = b","
+            yield b"[]" if separator == b"[" else b"]"
+
+        return "application/json", chunks()
+
+    def _report(self, log, params):
+        by = params.get("by", "project")
+        if by not in ("project", "tags"):
+            raise ValueError("Cannot group by {}.".format(by))
+
+        # The log may have been changed by another process since the
+        # snapshot was taken; the version check is done by the cache.
+        snapshot = log.snapshot(selection="filter", refresh=True)
+        totals = snapshot.total_duration(by=by)
+        return "application/json", iter([json.dumps(totals).encode()])
+
+    def _export(self, log, params):
+        columns = ["id"] + log.get_valid_columns(log.default_params)
+        export_format = params.get("format", "jsonl")
+
+        if export_format == "jsonl":
+            def chunks():
+                for rows in self._rows(log):
+                    yield b"".join(
+                            json.dumps(dict(zip(columns, row))).encode()
+                            + b"\n" for row in rows)
+            return "application/x-ndjson", chunks()
+        elif export_format == "csv":
+            def chunks():
+                buf = io.StringIO()
+                writer = csv.writer(buf)
+                writer.writerow(columns)
+                for rows in self._rows(log):
+                    writer.writerows(rows)
+                    yield buf.getvalue().encode()
+                    buf.seek(0)
+                    buf.truncate()
+                if buf.tell():
+                    yield buf.getvalue().encode()
+            return "text/csv", chunks()
+        else:
+            raise ValueError("Invalid export format {}.".format(export_format))
+
+def serve(db_filepath, host="127.0.0.1", port=8000, num_workers=4):
+    """Serve a log over HTTP until interrupted."""
+
+    server = LogServer((host, port), db_filepath, num_workers=num_workers)
+    logging.info("Serving {} on http://{}:{}/".format(
+        db_filepath, *server.server_address[:2]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
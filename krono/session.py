@@ -1,16 +1,226 @@
 import datetime
 import logging
+import os
+import subprocess
 import sys
 import threading
 import time
+try:
+    import termios
+except ImportError:
+    termios = None
 from helpers import datetime_to_string
 
+class TerminalIdleSource:
+    """
+    Idle source that reports the time since the last keypress on a terminal.
+
+    While started (see start(), or use it as a context manager), the
+    terminal is switched to non-canonical mode, so that wait_for_enter()
+    sees each keypress as it is typed instead of only whole lines once
+    Enter is pressed. Any object with an idle_seconds() method can be used
+    as an idle source instead (see LogindIdleSource).
+    """
+
+    def __init__(self, stream=None):
+        """@param stream The terminal's input stream; defaults to stdin."""
+
+        self.stream = sys.stdin if stream is None else stream
+        self._saved_attrs = None
+        self._last_input = time.time()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.restore()
+
+    def start(self):
+        """
+        Switch the terminal to non-canonical mode; does nothing if the
+        stream is not a terminal.
+        """
+
+        if termios is None:
+            return
+        try:
+            fd = self.stream.fileno()
+            if not os.isatty(fd):
+                return
+            attrs = termios.tcgetattr(fd)
+            self._saved_attrs = termios.tcgetattr(fd)
+            attrs[3] &= ~termios.ICANON
+            attrs[6][termios.VMIN] = 1
+            attrs[6][termios.VTIME] = 0
+            termios.tcsetattr(fd, termios.TCSANOW, attrs)
+        except (AttributeError, OSError, ValueError, termios.error) as e:
+            logging.debug(e)
+            self._saved_attrs = None
+        self._last_input = time.time()
+
+    def restore(self):
+        """Restore the terminal's original settings."""
+
+        if self._saved_attrs is not None:
+            termios.tcsetattr(self.stream.fileno(), termios.TCSADRAIN,
+                              self._saved_attrs)
+            self._saved_attrs = None
+
+    def idle_seconds(self):
+        """
+        Return the seconds since the last keypress, or 0 if the terminal is
+        not being read in non-canonical mode.
+        """
+
+        if self._saved_attrs is None:
+            return 0
+        return max(0, time.time() - self._last_input)
+
+    def wait_for_enter(self):
+        """
+        Read the terminal until Enter is pressed (or the input ends),
+        recording the time of each keypress.
+        """
+
+        if self._saved_attrs is None:
+            self.stream.readline()
+            return
+
+        fd = self.stream.fileno()
+        while True:
+            data = os.read(fd, 1024)
+            self._last_input = time.time()
+            if not data or b"\n" in data or b"\r" in data:
+                return
+
+
+class LogindIdleSource:
+    """
+    Idle source that reports the idle time of the user's login session, as
+    tracked by systemd-logind (from the desktop environment's idle hint, or
+    from terminal input on a text console), queried with loginctl.
+    """
+
+    def __init__(self, session_id=None):
+        """@param session_id Login session ID; defaults to $XDG_SESSION_ID."""
+
+        self.session_id = session_id or os.environ.get("XDG_SESSION_ID")
+
+    @classmethod
+    def detect(cls):
+        """
+        Return a LogindIdleSource for the current login session, or None if
+        there is none or logind does not report its idle state.
+        """
+
+        source = cls()
+        if not source.session_id or source._show_session() is None:
+            return None
+        return source
+
+    def _show_session(self):
+        try:
+            with open(os.devnull, "w") as devnull:
+                return subprocess.check_output(
+                        ["loginctl", "show-session", self.session_id,
+                         "-p", "IdleHint", "-p", "IdleSinceHint"],
+                        stderr=devnull).decode()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def idle_seconds(self):
+        """Return the seconds the session has been idle, or 0 if active."""
+
+        output = self._show_session()
+        if output is None:
+            return 0
+        return self.parse(output)
+
+    @staticmethod
+    def parse(output, now=None):
+        """
+        @brief Return the idle seconds reported by "loginctl show-session".
+
+        @param output The command's output, with the IdleHint and
+            IdleSinceHint (microseconds since the epoch) properties.
+        @param now The current time, in seconds since the epoch.
+        """
+
+        properties = dict(line.partition("=")[::2]
+                          for line in output.splitlines())
+        since = int(properties.get("IdleSinceHint") or 0)
+        if properties.get("IdleHint") != "yes" or not since:
+            return 0
+        if now is None:
+            now = time.time()
+        return max(0, now - since / 1e6)
+
+
 class Session(threading.Thread):
-    def __init__(self, log, last_row_id, autosave_interval=60, lock=None):
+    """
+    Thread that keeps the end time of the current session's row up to date.
+
+    Autosaves start every autosave_interval seconds and back off (doubling
+    after each save) up to max_autosave_interval, which bounds the time
+    that can be lost if the process dies without calling stop(). A failed
+    write is retried after the same kind of backoff. Waits are done on an
+    Event, so stop() wakes the thread immediately, and last at least
+    min_timeout seconds.
+
+    With an idle source, idle time is sampled every sample_interval seconds
+    without touching the DB. When it reaches idle_threshold, the current row
+    is closed at the time of the last activity; when there is activity again
+    (even a single keypress between samples), a new row (with the same
+    project, tags and notes) is started at the time of that activity. Each
+    of these state changes is a single write, and no autosaves are made
+    while idle.
+    """
+
+    min_timeout = 0.1
+
+    def __init__(self, log, last_row_id, autosave_interval=60, lock=None,
+                 idle_source=None, idle_threshold=600, sample_interval=5,
+                 row_params=None, max_autosave_interval=None):
+        """
+        @param log Log (or Journal) holding the session.
+        @param last_row_id ID of the session's row.
+        @param autosave_interval Initial seconds between updates of the end
+            time.
+        @param lock Lock guarding access to log.
+        @param idle_source Optional object with an idle_seconds() method.
+        @param idle_threshold Seconds of idle time after which the session
+            is split.
+        @param sample_interval Seconds between samples of the idle source.
+        @param row_params Dict of the project, tags and notes used for rows
+            started after an idle period.
+        @param max_autosave_interval Maximum seconds between updates of the
+            end time; defaults to 10 times autosave_interval.
+        """
+
         self.lock = lock
         self.log = log
         self.last_row_id = last_row_id
         self.autosave_interval = autosave_interval
+        if max_autosave_interval is None:
+            max_autosave_interval = 10 * autosave_interval
+        self.max_autosave_interval = max(max_autosave_interval,
+                                         autosave_interval)
+        self.idle_source = idle_source
+        self.idle_threshold = idle_threshold
+        self.sample_interval = sample_interval
+        self.row_params = dict(row_params) if row_params else {}
+
+        self.idle = False
+        self._idle_since = None
+        self._last_save = datetime.datetime.now()
+        self._interval = autosave_interval
+        self._retry_interval = None
+        self._stop_event = threading.Event()
+
+        # Guards the session state (idle, last_row_id) shared by step(), run
+        # in the thread, and stop(), called from another thread.
+        self._state_lock = threading.Lock()
 
         py_version = sys.version_info
         if py_version.major >= 3 and py_version.minor >= 3:
@@ -20,13 +230,108 @@ class Session(threading.Thread):
             self.daemon = True
 
     def run(self):
-        while True:
-            time.sleep(self.autosave_interval)
-            current_datetime = datetime_to_string(datetime.datetime.now())
+        timeout = self._timeout(datetime.datetime.now())
+        while not self._stop_event.wait(timeout):
             try:
-                self.lock.acquire()
-                self.log.update_row(self.last_row_id, {"end": current_datetime})
+                self.step(datetime.datetime.now())
             except Exception as e:
                 logging.error(e)
-            finally:
-                self.lock.release()
+                timeout = self._retry_timeout()
+            else:
+                self._retry_interval = None
+                timeout = self._timeout(datetime.datetime.now())
+
+    def _timeout(self, now):
+        """Return the seconds to wait before the next step."""
+
+        if self.idle:
+            # Nothing is saved while idle; only the idle source is sampled.
+            timeout = self.sample_interval
+        else:
+            timeout = self._interval - (now - self._last_save).total_seconds()
+            if self.idle_source is not None:
+                timeout = min(timeout, self.sample_interval)
+        return max(timeout, self.min_timeout)
+
+    def _retry_timeout(self):
+        """
+        Return the seconds to wait before retrying a failed step, starting at
+        autosave_interval and doubling with each consecutive failure up to
+        max_autosave_interval.
+        """
+
+        if self._retry_interval is None:
+            self._retry_interval = self.autosave_interval
+        else:
+            self._retry_interval = min(2 * self._retry_interval,
+                                       self.max_autosave_interval)
+        return max(self._retry_interval, self.min_timeout)
+
+    def step(self, now):
+        """
+        @brief Sample the idle source (if any) and write to the log if the
+            session has gone idle, resumed, or is due to be autosaved.
+
+        @param now The current time, as a datetime.
+        """
+
+        idle_seconds = None
+        if self.idle_source is not None:
+            idle_seconds = self.idle_source.idle_seconds()
+
+        with self._state_lock:
+            if idle_seconds is not None:
+                last_active = now - datetime.timedelta(seconds=idle_seconds)
+
+                if not self.idle and idle_seconds >= self.idle_threshold:
+                    self._write_end(last_active)
+                    self.idle = True
+                    self._idle_since = last_active
+                    return
+                elif self.idle and (idle_seconds < self.idle_threshold or
+                                    last_active - self._idle_since >
+                                    datetime.timedelta(seconds=1)):
+                    # Any activity since going idle resumes the session,
+                    # even if it was followed by another idle period
+                    # between samples.
+                    new_row = dict(self.row_params)
+                    new_row["start"] = datetime_to_string(last_active)
+                    self.last_row_id = self._locked(self.log.add_row, new_row)
+                    self.idle = False
+                    self._last_save = now
+                    self._interval = self.autosave_interval
+                    return
+
+            if not self.idle and \
+                    (now - self._last_save).total_seconds() >= self._interval:
+                self._write_end(now)
+                self._interval = min(2 * self._interval,
+                                     self.max_autosave_interval)
+
+    def stop(self, now=None):
+        """
+        Stop the thread (waiting for any write in progress) and write the
+        final end time of the session, unless it was already closed because
+        the session is idle.
+        """
+
+        self._stop_event.set()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join()
+        with self._state_lock:
+            if not self.idle:
+                self._write_end(
+                        now if now is not None else datetime.datetime.now())
+
+    def _locked(self, func, *args):
+        """Call func with the lock (if any) held."""
+
+        if self.lock is None:
+            return func(*args)
+        with self.lock:
+            return func(*args)
+
+    def _write_end(self, end):
+        self._locked(self.log.update_row, self.last_row_id,
+                     {"end": datetime_to_string(end)})
+        self._last_save = end
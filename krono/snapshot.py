@@ -0,0 +1,122 @@
+import array
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+class Snapshot:
+    """
+    Columnar, in-memory copy of a selection of sessions for analysis.
+
+    Start/end times are stored as epoch seconds and durations in seconds
+    (NaN where a session has no end time). The project and tags columns are
+    dictionary-encoded: each row stores an integer code that indexes into
+    the "projects" and "tags" lists of distinct values. Columns are NumPy
+    arrays if NumPy is installed, else array.array objects from the
+    standard library.
+    """
+
+    def __init__(self):
+        self.ids = self._new_column("q")
+        self.start = self._new_column("d")
+        self.end = self._new_column("d")
+        self.duration = self._new_column("d")
+        self.project_codes = self._new_column("l")
+        self.tag_codes = self._new_column("l")
+
+        self.projects = []
+        self.tags = []
+
+    @staticmethod
+    def _new_column(typecode):
+        return array.array(typecode)
+
+    @classmethod
+    def from_cursor(cls, cursor, batch_size=1000):
+        """
+        @brief Build a snapshot in a single pass over an executed cursor.
+
+        @param cursor A cursor whose query yields rows of the form
+            (id, start_epoch, end_epoch, project, tags).
+        @param batch_size Number of rows to pull per fetchmany() call.
+        """
+
+        snapshot = cls()
+        project_lookup = {}
+        tag_lookup = {}
+        nan = float("nan")
+
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+
+            for row_id, start, end, project, tags in batch:
+                start = nan if start is None else float(start)
+                end = nan if end is None else float(end)
+
+                project_code = project_lookup.get(project)
+                if project_code is None:
+                    project_code = len(snapshot.projects)
+                    project_lookup[project] = project_code
+                    snapshot.projects.append(project)
+
+                tag_code = tag_lookup.get(tags)
+                if tag_code is None:
+                    tag_code = len(snapshot.tags)
+                    tag_lookup[tags] = tag_code
+                    snapshot.tags.append(tags)
+
+                snapshot.ids.append(row_id)
+                snapshot.start.append(start)
+                snapshot.end.append(end)
+                snapshot.duration.append(end - start)
+                snapshot.project_codes.append(project_code)
+                snapshot.tag_codes.append(tag_code)
+
+        if np is not None:
+            snapshot.ids = np.frombuffer(snapshot.ids, dtype=np.int64)
+            snapshot.start = np.frombuffer(snapshot.start, dtype=np.float64)
+            snapshot.end = np.frombuffer(snapshot.end, dtype=np.float64)
+            snapshot.duration = np.frombuffer(
+                    snapshot.duration, dtype=np.float64)
+            snapshot.project_codes = np.frombuffer(
+                    snapshot.project_codes, dtype=np.dtype("l"))
+            snapshot.tag_codes = np.frombuffer(
+                    snapshot.tag_codes, dtype=np.dtype("l"))
+
+        return snapshot
+
+    def __len__(self):
+        return len(self.ids)
+
+    def total_duration(self, by="project"):
+        """
+        @brief Sum session durations (in seconds), grouped by project or tags.
+
+        Sessions without an end time are ignored.
+
+        @param by Either "project" or "tags".
+        @return A dict mapping each distinct project/tags value to its total.
+        """
+
+        if by == "project":
+            codes, labels = self.project_codes, self.projects
+        elif by == "tags":
+            codes, labels = self.tag_codes, self.tags
+        else:
+            raise ValueError("Cannot group by {}.".format(by))
+
+        if np is not None:
+            valid = ~np.isnan(self.duration)
+            totals = np.bincount(codes[valid], weights=self.duration[valid],
+                                 minlength=len(labels))
+            return dict(zip(labels, totals.tolist()))
+
+        totals = [0.0] * len(labels)
+        for code, duration in zip(codes, self.duration):
+            if not math.isnan(duration):
+                totals[code] += duration
+        return dict(zip(labels, totals))
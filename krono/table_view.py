@@ -0,0 +1,182 @@
+import curses
+from helpers import sample_column_widths
+from interactive_list import InteractiveList
+
+class TableView(InteractiveList):
+    """
+    InteractiveList that presents rows (tuples) as a table with a header
+    line. Column widths are estimated from a sample of the rows and fitted to
+    the terminal width, and are recomputed when the terminal is resized.
+    Rows are only formatted when drawn, and can be re-sorted by column via a
+    callback (e.g., one that re-queries the DB with an ORDER BY clause). The
+    rows may be a RowStream, which is read to the end while waiting for keys.
+    """
+
+    separator = " | "
+
+    def __init__(self, rows, columns, select_mode="off", sort_rows=None,
+                 sample_size=200):
+        """
+        @param rows List of tuples. The first element of each tuple (an ID) is
+            not shown; the remaining elements are shown as the table columns.
+        @param columns List of column names, one per displayed column.
+        @param select_mode See InteractiveList.
+        @param sort_rows Optional function taking a column name and a
+            "descending" flag and returning the rows sorted accordingly.
+        @param sample_size Maximum number of rows used to estimate widths.
+        """
+
+        self.rows = rows
+        self.columns = list(columns)
+        self.sort_rows = sort_rows
+        self.sort_column = None
+        self.sort_descending = False
+        self._marked = set()
+
+        self.sample_size = sample_size
+        self._sampled_widths = None
+        self.widths = None
+
+        InteractiveList.__init__(self, [], select_mode)
+        if self.sort_rows is not None:
+            self.instructions += ", Sort [1-{}]".format(len(self.columns))
+
+    def _fit_columns(self, width):
+        """
+        @brief Set self.widths so that a formatted row fits within width.
+
+        The widths estimated from the sampled rows are only computed once;
+        if they do not fit, the last column is narrowed to its header width,
+        then the widest columns are narrowed.
+        """
+
+        if self._sampled_widths is None:
+            # Skip the width of the (hidden) ID column.
+            sampled = sample_column_widths(
+                    self.rows, sample_size=self.sample_size)[1:]
+            if not sampled:
+                sampled = [0] * len(self.columns)
+            self._sampled_widths = [
+                    max(sampled_width, len(column) + 1)
+                    for sampled_width, column in zip(sampled, self.columns)]
+
+        widths = list(self._sampled_widths)
+        prefix_len = 4 if self.select_mode in ("multi", "single_box") else 0
+        available = width - 1 - prefix_len \
+            - len(self.separator) * (len(widths) - 1)
+        excess = sum(widths) - available
+        if excess > 0:
+            min_last = min(widths[-1], len(self.columns[-1]) + 1)
+            widths[-1] = max(min_last, widths[-1] - excess)
+        while sum(widths) > available and max(widths) > 4:
+            widths[widths.index(max(widths))] -= 1
+        self.widths = widths
+
+    def _format(self, values):
+        return self.separator.join(
+                "{:<{w}.{w}}".format("" if value is None else str(value), w=w)
+                for value, w in zip(values, self.widths))
+
+    def _handle_key(self, key):
+        """Sort by column N when the number key N is pressed."""
+
+        if self.sort_rows is None or \
+                not ord("1") <= key < ord("1") + len(self.columns):
+            return False
+
+        column = self.columns[key - ord("1")]
+        if column == self.sort_column:
+            self.sort_descending = not self.sort_descending
+        else:
+            self.sort_column = column
+            self.sort_descending = False
+
+        # Sorting reorders the rows; carry selections over by row.
+        marked = [self.rows[i] for i in self._marked]
+        if self.select_mode == "multi":
+            selected = [self.rows[i] for i in self.selected]
+        elif self.select_mode == "single_box" and self.selected is not None:
+            selected = self.rows[self.selected]
+
+        self.rows = self.sort_rows(column, self.sort_descending)
+
+        positions = {row: i for i, row in enumerate(self.rows)}
+        self._marked = set(positions[row] for row in marked if row in positions)
+        if self.select_mode == "multi":
+            self.selected = [positions[row] for row in selected
+                             if row in positions]
+        elif self.select_mode == "single_box" and self.selected is not None:
+            self.selected = positions.get(selected)
+
+        self._lower = self._search_index()
+        self._set_query(None)
+        self._print_header()
+        self._print_instructions(self.instructions)
+        return True
+
+    def _item_text(self, index):
+        text = self._format(self.rows[index][1:])
+        if self.select_mode in ("multi", "single_box"):
+            prefix = "[*] " if index in self._marked else "[ ] "
+            text = prefix + text
+        return text
+
+    def _layout(self):
+        """
+        Fit the columns to the current terminal width, draw the header and
+        instructions, and return a new window for the rows.
+        """
+
+        base_height, base_width = self.base.getmaxyx()
+        self.base.erase()
+        self._fit_columns(base_width)
+        self._print_header()
+        if self.query is None:
+            self._print_instructions(self.instructions)
+        else:
+            self._print_instructions("/" + self.query)
+
+        scr = curses.newwin(base_height - 3, base_width, 1, 0)
+        scr.keypad(True)
+        scr.idlok(True)
+        self.height, self.width = scr.getmaxyx()
+        return scr
+
+    def _load_more(self):
+        return self.rows.fetch_more()
+
+    def _loading(self):
+        # Rows may be a RowStream that is still being read from the DB.
+        return not getattr(self.rows, "done", True)
+
+    def _num_items(self):
+        return len(self.rows)
+
+    def _print_header(self):
+        """Draw the column names, marking the sort column, on the first line."""
+
+        headers = []
+        for column in self.columns:
+            if column == self.sort_column:
+                column += "v" if self.sort_descending else "^"
+            headers.append(column)
+
+        base_height, base_width = self.base.getmaxyx()
+        header = self._format(headers)
+        if self.select_mode in ("multi", "single_box"):
+            header = "    " + header
+        self.base.move(0, 0)
+        self.base.clrtoeol()
+        self.base.addnstr(0, 0, header, base_width - 1, curses.A_BOLD)
+        self.base.noutrefresh()
+
+    def _search_index(self, start=0):
+        return [self.separator.join(
+                    "" if value is None else str(value) for value in row[1:]
+                ).lower() for row in self.rows[start:]]
+
+    def _toggle_string(self, line, select):
+        if select:
+            self._marked.add(line)
+        else:
+            self._marked.discard(line)
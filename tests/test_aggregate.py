@@ -0,0 +1,70 @@
+import os
+import sqlite3
+import pytest
+from krono.aggregate import aggregate, find_logs
+from krono.log import Log
+
+class TestAggregate:
+    """Test querying and merging multiple logs."""
+
+    def test_find_logs(self, database, tmpdir):
+        """Test expansion of directories into log files."""
+
+        _, _, filepath = database(tmpdir.strpath)
+        log = Log()
+        log.load_db(filepath)
+        log.archive("2019-01-01 00:00:00")
+        log.unload_db()
+
+        other = str(tmpdir.join("other.sqlite"))
+        Log().create_db(other)
+
+        assert find_logs([tmpdir.strpath]) == sorted([filepath, other])
+        assert find_logs([filepath, filepath]) == [filepath]
+
+    def test_aggregate(self, database, tmpdir):
+        """Test that rows from several logs are merged by start time."""
+
+        _, _, first = database(tmpdir.strpath)
+        conn, cursor, second = database(tmpdir.strpath)
+        cursor.execute("UPDATE sessions SET start = '2019-06-01 00:00:00', "
+                       "end = '2019-06-01 01:00:00' WHERE id = 3")
+        conn.commit()
+
+        results = [(os.path.basename(filepath), row[0], row[1])
+                   for filepath, row in aggregate([tmpdir.strpath])]
+        assert results == [
+                ("test0.db", 1, "2018-09-29 23:00:00"),
+                ("test1.db", 1, "2018-09-29 23:00:00"),
+                ("test0.db", 2, "2018-10-29 23:00:00"),
+                ("test1.db", 2, "2018-10-29 23:00:00"),
+                ("test1.db", 3, "2019-06-01 00:00:00"),
+                ("test0.db", 3, "2020-01-01 12:00:00")]
+
+        # Filters should be applied to every log.
+        filters = dict(Log().default_params)
+        filters["start"] = "2019-01-01 00:00:00"
+        results = [(os.path.basename(filepath), row[0])
+                   for filepath, row in aggregate([first, second], filters)]
+        assert results == [("test1.db", 3), ("test0.db", 3)]
+
+        # Logs should be opened read-only, so no indexes are created.
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+        assert cursor.fetchall() == []
+
+    def test_aggregate_batches(self, database, tmpdir):
+        """Test merging rows sent by workers in batches."""
+
+        filepaths = [database(tmpdir.strpath)[2] for _ in range(3)]
+        expected = list(aggregate(filepaths, processes=1))
+        assert len(expected) == 9
+
+        results = aggregate(filepaths, processes=2, batch_size=1)
+        assert next(results) == expected[0]
+        assert [(filepath, row) for filepath, row in results] == expected[1:]
+
+        # Errors in a worker should be raised by the merge.
+        with open(str(tmpdir.join("broken.db")), "w") as f:
+            f.write("not a database")
+        with pytest.raises(sqlite3.DatabaseError):
+            list(aggregate([tmpdir.strpath], processes=2))
@@ -0,0 +1,100 @@
+import os
+import sqlite3
+import pytest
+from krono.cache import ResultCache
+
+class TestResultCache:
+    """Test methods for ResultCache and Log result caching."""
+
+    def test_get_put(self, tmpdir):
+        """Test cache hits, version mismatches, and LRU eviction."""
+
+        cache = ResultCache(str(tmpdir.join("cache")))
+        rows = [(1, "2018-09-29 23:00:00", None, "project", "", "notes")]
+
+        assert cache.get("key", 1) is None
+        cache.put("key", 1, rows)
+        assert cache.get("key", 1) == rows
+
+        # Entry from an older DB version should be discarded.
+        assert cache.get("key", 2) is None
+        assert cache.get("key", 1) is None
+
+        # Entries exceeding the size cap should evict the least recently used.
+        cache.put("a", 1, rows)
+        entry_size = cache.conn.execute(
+                "SELECT size FROM results").fetchone()[0]
+        cache.max_size = 2 * entry_size
+        cache.put("b", 1, rows)
+        cache.get("a", 1)
+        cache.put("c", 1, rows)
+        assert cache.get("a", 1) == rows
+        assert cache.get("b", 1) is None
+        assert cache.get("c", 1) == rows
+        cache.close()
+
+    def test_normalize_key(self):
+        """Test that equivalent filters produce the same key."""
+
+        key = ResultCache.normalize_key("sessions", {
+            "start": "0000-01-01 00:00:00", "end": "9999-12-31 23:59:59",
+            "project": "", "tags": "", "notes": ""})
+        assert key == ResultCache.normalize_key("sessions", {
+            "end": "9999-12-31 23:59:59", "start": "0000-01-01 00:00:00",
+            "not_real_column": "dummy value"})
+        assert key != ResultCache.normalize_key("sessions", None)
+
+    def test_log_cache(self, log, database, tmpdir):
+        """Test that Log serves unchanged queries from the cache."""
+
+        # Caching requires a loaded DB.
+        with pytest.raises(RuntimeError):
+            log.enable_cache()
+
+        _, _, filepath = database(tmpdir.strpath)
+        log.load_db(filepath)
+        log.enable_cache()
+        assert os.path.isfile(filepath + "-cache")
+
+        log.filter_rows()
+        assert len(log.rows) == 3
+        num_entries = log.cache.conn.execute(
+                "SELECT COUNT(*) FROM results").fetchone()[0]
+        assert num_entries == 1
+
+        # A cached result should be returned without querying the DB.
+        log.cursor.execute("DELETE FROM sessions WHERE id = 1")
+        log.filter_rows()
+        assert len(log.rows) == 3
+
+        # A committed write should invalidate the cached result.
+        log.conn.commit()
+        log.filter_rows()
+        assert len(log.rows) == 2
+
+        log.unload_db()
+        assert log.cache is None
+
+    def test_archive_writes(self, log, database, tmpdir):
+        """Test that writes to archived rows invalidate cached results."""
+
+        _, _, filepath = database(tmpdir.strpath)
+        log.load_db(filepath)
+        log.update_row(1, {"project": "old"})
+        log.archive("2019-01-01 00:00:00")
+        log.enable_cache()
+
+        log.filter_rows()
+        assert log.rows[0][3] == "old"
+        log.update_row(1, {"project": "old edited"})
+        log.filter_rows()
+        assert log.rows[0][3] == "old edited"
+
+        # Writes on another connection are seen through the change counters.
+        conn = sqlite3.connect(log.archives[2018])
+        conn.execute("UPDATE sessions SET project = 'other' WHERE id = 1")
+        conn.commit()
+        conn.close()
+        log.filter_rows()
+        assert log.rows[0][3] == "other"
+        log.unload_db()
@@ -1,5 +1,9 @@
+import io
+import json
 import os
 import sqlite3
+import subprocess
+import sys
 import pytest
 from krono.cli import CLI
 
@@ -46,6 +50,84 @@ class TestCLI:
         assert cli.log
         assert cli.log.conn != previous_conn
 
+    def test_batch(self, cli, caplog, database, tmpdir):
+        """Test do_begin(), do_commit() and do_rollback()."""
+
+        _, _, filepath = database(tmpdir.strpath)
+        cli.do_load(filepath)
+
+        cli.do_commit("")
+        assert "No batch in progress." in caplog.messages
+
+        cli.do_begin("")
+        assert cli.log.in_batch
+        assert cli.prompt == "(krono*) "
+        cli.log.delete([1])
+        cli.do_rollback("")
+        assert not cli.log.in_batch
+        assert cli.prompt == "(krono) "
+        assert len(cli.log.rows) == 3
+
+        cli.do_begin("")
+        cli.log.delete([1])
+        cli.do_commit("")
+        assert len(cli.log.rows) == 2
+
+        # Exiting should discard an uncommitted batch.
+        cli.do_begin("")
+        cli.log.delete([2])
+        assert cli.do_exit("")
+        assert "Discarding uncommitted batch of edits." in caplog.messages
+        assert len(cli.log.rows) == 2
+
+    def test_batch_mode(self, capfd, caplog, database, tmpdir):
+        """Test running commands non-interactively from a file."""
+
+        _, _, filepath = database(tmpdir.strpath)
+        commands = io.StringIO(
+                "load {}\n"
+                "filter project=\"dummy project 2\"\n"
+                "view json\n"
+                "filter reset\n"
+                "modify 1 notes=\"new notes\" tags=\n"
+                "delete 3\n"
+                "view\n"
+                "modify 1 bad_column=value\n"
+                "delete\n".format(filepath))
+        cli = CLI(stdin=commands, batch=True)
+        cli.cmdloop()
+
+        out = capfd.readouterr().out.splitlines()
+        assert json.loads(out[0]) == {
+                "id": 2,
+                "start": "2018-10-29 23:00:00",
+                "end": "2018-10-29 23:30:00",
+                "project": "dummy project 2",
+                "tags": "dummy tag 2",
+                "notes": "dummy notes 2"}
+        assert out[1:] == [
+            "1 | 2018-09-29 23:00:00 | 2018-09-29 23:30:00 | dummy project 1 |"
+            "             | new notes",
+            "2 | 2018-10-29 23:00:00 | 2018-10-29 23:30:00 | dummy project 2 |"
+            " dummy tag 2 | dummy notes 2"]
+        assert "Invalid parameter bad_column=value." in caplog.messages
+        assert "No IDs entered." in caplog.messages
+        assert cli.num_failed == 2
+
+    def test_batch_exit_status(self, database, tmpdir):
+        """Test that a batch run exits with 1 if any command failed."""
+
+        _, _, filepath = database(tmpdir.strpath)
+        main = os.path.join(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))), "krono", "__main__.py")
+        for commands, status in (("view\n", 0),
+                                 ("view\nbogus\nview\n", 1),
+                                 ("delete\nview\n", 1)):
+            result = subprocess.run(
+                    [sys.executable, main, "-f", filepath, "--batch", "-"],
+                    input=commands, capture_output=True, text=True)
+            assert result.returncode == status
+
     def test_log_loaded(self, cli):
         """Test log_loaded attribute."""
         assert not cli.log_loaded
@@ -89,3 +171,23 @@ class TestCLI:
         cli.do_setcwd(None)
         assert cli.path == os.getcwd()
         assert capfd.readouterr().out.rstrip() == os.getcwd()
+
+    def test_filter_query(self, capfd, caplog, database, tmpdir):
+        """Test filtering with query terms mixed with COLUMN=VALUE criteria."""
+
+        _, _, filepath = database(tmpdir.strpath)
+        commands = io.StringIO(
+                "load {}\n"
+                "filter project=dummy \"notes:dummy notes\" -tag:3 dur<1h\n"
+                "view\n"
+                "filter dur>>1h\n"
+                "filter reset notes 3\n"
+                "view\n".format(filepath))
+        cli = CLI(stdin=commands, batch=True)
+        cli.cmdloop()
+
+        # Bare words that name a column are query terms, not criteria.
+        out = capfd.readouterr().out.splitlines()
+        assert [line.split(" | ")[0] for line in out] == ["1", "2", "3"]
+        assert "Invalid duration >1h." in caplog.messages
+        assert cli.num_failed == 1
@@ -0,0 +1,61 @@
+import pytest
+from krono.completion import PrefixIndex
+from krono.interactive_params import InteractiveParams
+
+class TestPrefixIndex:
+    """Test prefix lookups on a PrefixIndex."""
+
+    def test_complete(self):
+        index = PrefixIndex(["krono", "kernel", "", "krono", "book"])
+        assert len(index) == 3
+        assert index.complete("k") == ["kernel", "krono"]
+        assert index.complete("kr") == ["krono"]
+        assert index.complete("x") == []
+        assert index.longest_completion("kr") == "krono"
+        assert index.longest_completion("k") == "k"
+
+        index.add("kernels")
+        index.add("kernel")
+        assert index.complete("ker") == ["kernel", "kernels"]
+        assert index.longest_completion("ke") == "kernel"
+
+
+class TestCompletion:
+    """Test completing the project and tags fields of a log."""
+
+    def test_log_completions(self, log, database, tmpdir):
+        _, _, db_filepath = database(tmpdir.strpath)
+        log.load_db(db_filepath)
+        completions = log.completions()
+        assert completions["project"].complete("dummy project") == [
+                "dummy project 1", "dummy project 2", "dummy project 3"]
+
+        # New values are added to the index without rebuilding it.
+        log.add_row({"start": "2021-01-01 09:00:00", "project": "krono",
+                     "tags": "code, review"})
+        assert log.completions() is completions
+        assert completions["project"].complete("kr") == ["krono"]
+        assert completions["tags"].complete("rev") == ["review"]
+
+    def test_complete_fields(self):
+        completions = {
+                "project": PrefixIndex(["krono", "kernel"]),
+                "tags": PrefixIndex(["code", "coffee", "review"]),
+                }
+        params = InteractiveParams({"project": "kr", "tags": "review, co"},
+                                   completions=completions)
+
+        assert params.complete("project") == ["krono"]
+        assert "".join(params.params["project"]) == "krono"
+        assert params.complete("project") == []
+
+        # Only the last tag is completed; repeated calls cycle through the
+        # candidates once the common prefix has been reached.
+        assert params.complete("tags") == ["code", "coffee"]
+        assert "".join(params.params["tags"]) == "review, code"
+        params.complete("tags")
+        assert "".join(params.params["tags"]) == "review, coffee"
+        params.complete("tags")
+        assert "".join(params.params["tags"]) == "review, code"
+
+        assert params.complete("notes") == []
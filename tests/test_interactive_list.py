@@ -0,0 +1,107 @@
+import pytest
+from krono.interactive_list import InteractiveList
+from krono.table_view import TableView
+
+class TestSearch:
+    """Test incremental search in InteractiveList."""
+
+    def test_set_query(self):
+        """Test narrowing and widening the visible items with a query."""
+
+        strings = ["Alpha project", "beta project", "Alphabet", "gamma"]
+        ilist = InteractiveList(strings, select_mode="multi")
+        assert ilist.visible == [0, 1, 2, 3]
+
+        # Matching should be case-insensitive and ignore select boxes.
+        ilist._set_query("a")
+        assert ilist.visible == [0, 1, 2, 3]
+        ilist._set_query("al")
+        assert ilist.visible == [0, 2]
+        ilist._set_query("alphab")
+        assert ilist.visible == [2]
+        ilist._set_query("[")
+        assert ilist.visible == []
+
+        # Shortening the query should restore the saved, wider match sets.
+        ilist._set_query("al")
+        assert ilist.visible == [0, 2]
+        ilist._set_query("")
+        assert ilist.visible == [0, 1, 2, 3]
+        ilist._set_query("project")
+        assert ilist.visible == [0, 1]
+
+        # Ending the search should show all items.
+        ilist._set_query(None)
+        assert ilist.query is None
+        assert ilist.visible == [0, 1, 2, 3]
+
+class TestTableView:
+    """Test layout and formatting of TableView."""
+
+    rows = [(i, "2018-09-29 23:00:00", "2018-09-29 23:30:00",
+             "project {}".format(i), None, "notes " * i) for i in range(50)]
+    columns = ("start", "end", "project", "tags", "notes")
+
+    def test_fit_columns(self):
+        """Test column widths estimated from a sample and fit to width."""
+
+        view = TableView(self.rows, self.columns, sample_size=10)
+        view._fit_columns(200)
+        assert view.widths[:4] == [19, 19, 10, 5]
+        assert view.widths[4] <= 40
+
+        # Narrower terminal should shrink the last column first.
+        view._fit_columns(80)
+        assert len(view._item_text(49)) <= 79
+        assert view.widths[:4] == [19, 19, 10, 5]
+
+        # Then the widest columns.
+        view._fit_columns(60)
+        assert len(view._item_text(49)) <= 59
+        assert view.widths[4] == 6
+        assert view.widths[0] < 19
+
+    def test_item_text(self):
+        """Test row formatting and select boxes."""
+
+        view = TableView(self.rows[:2], self.columns, select_mode="multi")
+        view._fit_columns(200)
+        assert view._item_text(1).startswith(
+                "[ ] 2018-09-29 23:00:00 | 2018-09-29 23:30:00 | project 1")
+        view._toggle_string(1, True)
+        assert view._item_text(1).startswith("[*] ")
+
+        view._set_query("PROJECT 1")
+        assert view.visible == [1]
+
+
+class TestStreaming:
+    """Test TableView over rows that are still being loaded."""
+
+    def test_load_more(self, log, database, tmpdir):
+        conn, cursor, db_filepath = database(tmpdir.strpath)
+        cursor.executemany(
+                "INSERT INTO sessions (start, end, project, tags, notes) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [("2021-01-01 09:00:00", "2021-01-01 10:00:00",
+                  "project {}".format(i), "", "") for i in range(100)])
+        conn.commit()
+
+        log.load_db(db_filepath, read_only=True)
+        rows = log.stream_rows(batch_size=40)
+        assert len(rows) == 40 and not rows.done
+
+        view = TableView(rows, TestTableView.columns)
+        view._set_query("project 5")
+        assert view._loading()
+        assert view.visible == [8]
+
+        # Loaded rows are searched and added to the matches of the query.
+        while view._loading():
+            start = view._num_items()
+            if view._load_more():
+                view._extend(start)
+        assert len(view.rows) == 103
+        assert view.visible == [8] + list(range(53, 63))
+        view._set_query(None)
+        assert view.visible == list(range(103))
@@ -0,0 +1,91 @@
+import os
+import threading
+import pytest
+from krono import journal
+from krono.journal import Journal
+
+class TestJournal:
+    """Test recording sessions in a journal and compacting it into a log."""
+
+    def test_compact(self, log, database, tmpdir):
+        _, _, db_filepath = database(tmpdir.strpath)
+        journal_filepath = Journal.journal_filepath(db_filepath)
+
+        # A finished session with several updates, and one still running.
+        journal = Journal(journal_filepath)
+        key = journal.add_row({"start": "2021-01-01 09:00:00",
+                               "project": "journaled"})
+        assert journal.get_last_row_id() == key
+        journal.update_row(key, {"end": "2021-01-01 09:30:00"})
+        journal.update_row(key, {"end": "2021-01-01 10:00:00"})
+        journal.unload_db()
+
+        running = Journal(journal_filepath)
+        running_key = running.add_row({"start": "2021-01-02 09:00:00"})
+
+        # Simulate a tracker killed in the middle of a write.
+        with open(journal_filepath, "a") as f:
+            f.write('{"key": "abc", "upd')
+
+        log.load_db(db_filepath)
+        assert Journal(journal_filepath).compact(log) == 1
+        log.select_all()
+        assert len(log.rows) == 4
+        assert log.rows[-1][1:4] == (
+                "2021-01-01 09:00:00", "2021-01-01 10:00:00", "journaled")
+
+        # The running session is carried over and added once finished.
+        running.update_row(running_key, {"end": "2021-01-02 10:00:00"})
+        running.unload_db()
+        assert Journal(journal_filepath).compact(log) == 1
+        log.select_all()
+        assert log.rows[-1][1:3] == ("2021-01-02 09:00:00", "2021-01-02 10:00:00")
+        assert not os.path.exists(journal_filepath)
+        assert Journal(journal_filepath).compact(log) == 0
+
+        # Logs without a journal get no lock file.
+        other_filepath = os.path.join(tmpdir.strpath, "other.db-pending")
+        assert Journal(other_filepath).compact(log) == 0
+        assert not os.path.exists(other_filepath + ".lock")
+
+    def test_stale_session(self, log, database, tmpdir):
+        """Test that abandoned sessions are not carried over forever."""
+
+        _, _, db_filepath = database(tmpdir.strpath)
+        journal_filepath = Journal.journal_filepath(db_filepath)
+
+        # A tracker killed before it could mark its session as finished.
+        killed = Journal(journal_filepath)
+        killed._append({"key": "killed", "add": {
+            "start": "2021-01-01 09:00:00", "project": "abandoned"},
+            "time": 1000.0})
+        running = Journal(journal_filepath)
+        running.add_row({"start": "2021-01-02 09:00:00"})
+
+        log.load_db(db_filepath)
+        assert Journal(journal_filepath).compact(log, stale_after=3600) == 1
+        log.select_all()
+        assert log.rows[-1][3] == "abandoned"
+        assert log.rows[-1][2] is not None
+
+        with open(journal_filepath) as f:
+            assert len(f.readlines()) == 1
+
+    @pytest.mark.skipif(journal.fcntl is None, reason="requires fcntl")
+    def test_lock(self, tmpdir):
+        """Test that trackers wait for a compaction to finish."""
+
+        journal_filepath = os.path.join(tmpdir.strpath, "krono.sqlite-pending")
+        tracker = Journal(journal_filepath)
+        compactor = Journal(journal_filepath)
+
+        with compactor._locked(exclusive=True):
+            thread = threading.Thread(
+                    target=tracker.add_row,
+                    args=({"start": "2021-01-01 09:00:00"},))
+            thread.start()
+            thread.join(0.2)
+            assert thread.is_alive()
+            assert not os.path.exists(journal_filepath)
+        thread.join()
+        assert os.path.exists(journal_filepath)
@@ -1,6 +1,11 @@
+import datetime
+import gzip
 import os
 import sqlite3
+import threading
+import time
 import pytest
+from krono.filter_query import FilterQuery
 from krono.log import Log
 
 class TestLogObject:
@@ -21,6 +26,7 @@ class TestLogObject:
 
         assert log.rows == []
         assert log.last_inserted_row == None
+        assert log.cache == None
 
         assert log.default_params == {
             "start": "0000-01-01 00:00:00",
@@ -80,6 +86,25 @@ class TestCreateLoadUnload:
         assert log.conn
         assert log.cursor
 
+    def test_lazy_rows(self, log, database, tmpdir):
+        """Test that rows are only queried from a loaded DB on access."""
+
+        _, _, filepath = database(tmpdir.strpath)
+        log.load_db(filepath)
+        assert log._rows is None
+
+        # Default selection after loading is all rows.
+        assert len(log.rows) == 3
+        assert log._rows is not None
+
+        # Writes should mark rows as stale rather than re-querying them.
+        log.add_row({"start": "2018-10-01 00:00:00"})
+        assert log._rows is None
+        assert len(log.rows) == 3   # new row has no end time, is filtered out
+
+        log.select_all()
+        assert len(log.rows) == 4
+
     def test_verify_db(self, database, tmpdir):
         """Test verification of DB table and schema."""
 
@@ -372,3 +397,700 @@ class TestDatabaseOperations:
 
         log.select_all()
         assert len(log.rows) == 3
+
+class TestArchive:
+    """Test archiving sessions into per-year archive files."""
+
+    def test_archive(self, log, database, tmpdir):
+        """Test Log.archive() and querying archived sessions."""
+
+        _, _, filepath = database(tmpdir.strpath)
+        log.load_db(filepath)
+
+        # Archive the two 2018 sessions.
+        assert log.archive("2019-01-01 00:00:00") == 2
+        archive_path = Log.archive_filepath(filepath, 2018)
+        assert os.path.isfile(archive_path)
+        assert log.archives == {2018: archive_path}
+        log.cursor.execute("SELECT id FROM main.sessions")
+        assert log.cursor.fetchall() == [(3,)]
+
+        # Archived sessions should remain visible.
+        log.select_all()
+        assert [row[0] for row in log.rows] == [1, 2, 3]
+
+        # Filters outside the archive's year should not attach it.
+        log.unload_db()
+        log.load_db(filepath)
+        assert log.archives == {2018: archive_path}
+        log.filters["start"] = "2020-01-01 00:00:00"
+        log.filter_rows()
+        assert [row[0] for row in log.rows] == [3]
+        assert not log._attached
+
+        log.filters["start"] = "2018-10-01 00:00:00"
+        log.filter_rows()
+        assert [row[0] for row in log.rows] == [2, 3]
+        assert log._attached == {2018}
+
+        # Archived rows can be updated and deleted.
+        log.update_row(2, {"project": "archived project"})
+        assert log.rows[0][3] == "archived project"
+        log.delete([2])
+        assert [row[0] for row in log.rows] == [3]
+
+        # Union view across all partitions.
+        log.attach_archives()
+        log.cursor.execute("SELECT id FROM all_sessions")
+        assert log.cursor.fetchall() == [(1,), (3,)]
+
+        # Nothing left to archive.
+        assert log.archive("2019-01-01 00:00:00") == 0
+
+    def test_edit_archived(self, log, database, tmpdir):
+        """Test editing archived sessions whose archive is not attached."""
+
+        _, _, filepath = database(tmpdir.strpath)
+        log.load_db(filepath)
+        log.add_row({"start": "2017-06-01 09:00:00",
+                     "end": "2017-06-01 10:00:00"})
+        log.archive("2019-01-01 00:00:00")
+        log.unload_db()
+
+        log.load_db(filepath)
+        log.conn.setlimit(sqlite3.SQLITE_LIMIT_ATTACHED, 1)
+        assert not log._attached
+        log.update_row(1, {"project": "edited"})
+        log.delete([2, 4])
+        log.select_all()
+        assert [row[0] for row in log.rows] == [1, 3]
+        assert log.rows[0][3] == "edited"
+
+        with pytest.raises(RuntimeError):
+            log.update_row(2, {"project": "edited"})
+        with pytest.raises(RuntimeError):
+            log.delete([3, 4])
+        log.select_all()
+        assert [row[0] for row in log.rows] == [1]
+
+    def test_attach_limit(self, log, database, tmpdir):
+        """Test queries over more archives than can be attached at once."""
+
+        _, _, filepath = database(tmpdir.strpath)
+        log.load_db(filepath)
+        for year in range(2010, 2016):
+            log.add_row({"start": "{}-06-01 09:00:00".format(year),
+                         "end": "{}-06-01 10:00:00".format(year),
+                         "project": "project {}".format(year)})
+        log.conn.setlimit(sqlite3.SQLITE_LIMIT_ATTACHED, 2)
+
+        assert log.archive("2019-01-01 00:00:00") == 8
+        assert len(log.archives) == 7
+        assert len(log._attached) <= 2
+
+        log.select_all()
+        assert [row[0] for row in log.rows] == list(range(1, 10))
+        assert len(log._attached) <= 2
+
+        log.filters["start"] = "2011-01-01 00:00:00"
+        log.filters["end"] = "2014-12-31 23:59:59"
+        log.filter_rows()
+        assert [row[0] for row in log.rows] == [5, 6, 7, 8]
+        assert len(log._attached) <= 2
+
+        assert "project 2010" in log.completions()["project"].complete("proj")
+        assert len(log.maintain()) == 8
+
+        # Sessions in the most recent archives can be modified in a batch.
+        log.begin()
+        log.update_row(2, {"project": "archived project"})
+        log.commit()
+        log.select_all()
+        assert log.rows[1][3] == "archived project"
+
+class TestOverlap:
+    """Test overlap filter mode and overlapping session detection."""
+
+    def test_overlap_filter(self, log_db):
+        """Test Log.filter_rows() in overlap mode."""
+
+        log = log_db
+
+        # Row 3 (2020-01-01 12:00 to 2020-01-03 10:00) straddles this range.
+        log.filters["start"] = "2020-01-02 00:00:00"
+        log.filters["end"] = "2020-01-02 01:00:00"
+        log.filter_rows()
+        assert log.rows == []
+
+        # Reads use the interval index but never create it.
+        log.filter_mode = "overlap"
+        log.filter_rows()
+        assert [row[0] for row in log.rows] == [3]
+        assert not log._interval_index
+        log.cursor.execute(
+                "SELECT name FROM sqlite_master WHERE name LIKE '%rtree%'")
+        assert log.cursor.fetchall() == []
+
+        assert log.build_interval_index()
+        log.filter_rows()
+        assert [row[0] for row in log.rows] == [3]
+        assert log._interval_index
+
+        # Interval index should be kept up to date by triggers.
+        log.update_row(1, {"start": "2020-01-01 23:00:00",
+                           "end": "2020-01-02 00:30:00"})
+        assert [row[0] for row in log.rows] == [1, 3]
+        log.delete([3])
+        assert [row[0] for row in log.rows] == [1]
+        log.add_row({"start": "2020-01-02 00:45:00"})
+        assert [row[0] for row in log.rows] == [1, 4]
+
+        log.cursor.execute("SELECT id FROM sessions_rtree ORDER BY id")
+        assert log.cursor.fetchall() == [(1,), (2,), (4,)]
+
+    def test_interval_index_reversed(self, log_db):
+        """Test the interval index with sessions that end before they start."""
+
+        log = log_db
+        log.build_interval_index()
+        log.update_row(1, {"start": "2020-01-02 00:30:00",
+                           "end": "2020-01-01 23:00:00"})
+        log.add_row({"start": "not a date"})
+
+        log.filters["start"] = "2020-01-02 00:00:00"
+        log.filters["end"] = "2020-01-02 01:00:00"
+        log.filter_mode = "overlap"
+        log.filter_rows()
+        assert [row[0] for row in log.rows] == [3]
+
+        log.cursor.execute("SELECT * FROM sessions_rtree WHERE id = 1")
+        _, min_t, max_t = log.cursor.fetchone()
+        assert min_t < max_t
+        log.cursor.execute("SELECT id FROM sessions_rtree ORDER BY id")
+        assert log.cursor.fetchall() == [(1,), (2,), (3,)]
+
+        # Triggers of an earlier version are replaced.
+        log.cursor.execute("DROP TRIGGER sessions_rtree_update")
+        log.cursor.execute(
+                "CREATE TRIGGER sessions_rtree_update AFTER UPDATE ON sessions "
+                "BEGIN SELECT 1; END")
+        log.conn.commit()
+        assert log.build_interval_index()
+        log.cursor.execute("SELECT sql FROM sqlite_master "
+                           "WHERE name = 'sessions_rtree_update'")
+        assert "MIN(" in log.cursor.fetchone()[0]
+
+    def test_find_overlaps(self, log_db):
+        """Test Log.find_overlaps()."""
+
+        log = log_db
+        assert log.find_overlaps() == []
+
+        log.add_row({"start": "2018-09-29 23:15:00",
+                     "end": "2018-09-29 23:45:00"})
+        log.add_row({"start": "2020-01-02 00:00:00",
+                     "end": "2020-01-02 01:00:00"})
+
+        # Sessions that only touch end-to-start do not overlap.
+        log.add_row({"start": "2018-09-29 23:45:00",
+                     "end": "2018-09-29 23:50:00"})
+
+        overlaps = [(a[0], b[0]) for a, b in log.find_overlaps()]
+        assert overlaps == [(1, 4), (3, 5)]
+
+class TestSortFormat:
+    """Test sorting and formatting of selected rows."""
+
+    def test_sort_rows(self, log_db):
+        """Test Log.sort_rows()."""
+
+        log = log_db
+        index_query = "SELECT name FROM sqlite_master WHERE type = 'index'"
+        indexes = log.cursor.execute(index_query).fetchall()
+        rows = log.sort_rows("start", descending=True)
+        assert [row[0] for row in rows] == [3, 2, 1]
+
+        # Sort order should persist across selections.
+        log.filters["project"] = "dummy project"
+        log.filter_rows()
+        assert [row[0] for row in log.rows] == [3, 2, 1]
+        log.sort_rows("project")
+        assert [row[0] for row in log.rows] == [1, 2, 3]
+
+        # Sorting does not create indexes.
+        log.sort_rows("notes")
+        assert log.cursor.execute(index_query).fetchall() == indexes
+
+        with pytest.raises(ValueError):
+            log.sort_rows("id; DROP TABLE sessions")
+
+    def test_format_rows(self):
+        """Test that Log.format_rows() sizes columns to fit their values."""
+
+        rows = [(1, "2018-09-29 23:00:00", None, "a long project name",
+                 "tag", "notes")]
+        assert Log.format_rows(rows) == [
+                "2018-09-29 23:00:00 |  | a long project name | tag | notes"]
+
+class TestBatch:
+    """Test batching writes with begin(), commit() and rollback()."""
+
+    def test_commit_rollback(self, log, database, tmpdir):
+        """Test that batched writes are committed or discarded together."""
+
+        with pytest.raises(RuntimeError) as e:
+            log.begin()
+        assert str(e.value) == "No database loaded."
+
+        _, _, filepath = database(tmpdir.strpath)
+        log.load_db(filepath)
+        with pytest.raises(RuntimeError) as e:
+            log.commit()
+        assert str(e.value) == "No batch in progress."
+
+        log.begin()
+        with pytest.raises(RuntimeError) as e:
+            log.begin()
+        assert str(e.value) == "A batch is already in progress."
+
+        # Loaded rows should be patched rather than re-queried.
+        rows = log.rows
+        log.update_row(1, {"project": "batched project"})
+        log.delete([2])
+        assert log.rows is rows
+        assert [row[0] for row in log.rows] == [1, 3]
+        assert log.rows[0][3] == "batched project"
+
+        # Changes should not be visible to other connections until commit.
+        other = Log()
+        other.load_db(filepath)
+        assert len(other.rows) == 3
+
+        log.rollback()
+        assert not log.in_batch
+        assert len(log.rows) == 3
+        assert log.rows[0][3] == "dummy project 1"
+
+        log.begin()
+        log.delete([2, 3])
+        log.commit()
+        other.select_all()
+        assert [row[0] for row in other.rows] == [1]
+
+    def test_rollback_schema(self, log, database, tmpdir):
+        """Test that a batch's schema changes are forgotten on rollback."""
+
+        _, _, db_filepath = database(tmpdir.strpath)
+        log.load_db(db_filepath)
+        log.archive("2019-01-01 00:00:00")
+        log.maintain()
+        log.unload_db()
+        log.load_db(db_filepath)
+
+        # Archives are attached before the batch starts.
+        log.begin()
+        assert log._attached == set([2018])
+        log.build_interval_index()
+        log.filter_mode = "overlap"
+        log.filter_rows()
+        with pytest.raises(RuntimeError):
+            log._attach_archive(2017)
+        log.rollback()
+
+        assert log._interval_index is None
+        assert log._duration_columns == {"archive_2018": True, "main": True}
+        log.filter_rows()
+        assert [row[0] for row in log.rows] == [1, 2, 3]
+
+
+class TestMerge:
+    """Test merging logs with deduplication."""
+
+    def test_merge(self, log, database, tmpdir):
+        """Test Log.merge()."""
+
+        _, _, target = database(tmpdir.strpath)
+        conn, cursor, source = database(tmpdir.strpath)
+
+        # Source has the same three sessions plus one new session, which
+        # appears twice, and one session archived.
+        new_row = ("2021-01-01 09:00:00", "2021-01-01 10:00:00",
+                   "new project", "", "")
+        cursor.executemany(
+                "INSERT INTO sessions (start, end, project, tags, notes) "
+                "VALUES (?, ?, ?, ?, ?)", [new_row, new_row])
+        conn.commit()
+        source_log = Log()
+        source_log.load_db(source)
+        source_log.archive("2018-10-01 00:00:00")
+        source_log.unload_db()
+
+        log.load_db(target)
+        assert log.merge(source, batch_size=2) == (1, 4)
+        log.select_all()
+        assert len(log.rows) == 4
+        assert log.rows[-1][0] == 4
+        assert log.rows[-1][1:] == new_row
+
+        # Merging again should not insert anything.
+        assert log.merge(source) == (0, 5)
+
+
+class TestSync:
+    """Test the change feed and incremental sync."""
+
+    def test_sync(self, log, database, tmpdir):
+        """Test Log.enable_change_feed() and Log.sync()."""
+
+        _, _, source = database(tmpdir.strpath)
+        target = os.path.join(tmpdir.strpath, "replica.db")
+        log.load_db(source)
+
+        # The first sync copies every session.
+        assert log.enable_change_feed()
+        assert log.sync(target) == 3
+
+        replica = Log()
+        replica.load_db(target)
+        replica.select_all()
+        log.select_all()
+        assert replica.rows == log.rows
+        replica.unload_db()
+
+        # Only changed sessions are synced, and each only once.
+        log.update_row(1, {"project": "edited"})
+        log.update_row(1, {"tags": "edited"})
+        log.delete([2])
+        log.add_row({"start": "2021-01-01 09:00:00",
+                     "end": "2021-01-01 10:00:00", "project": "new"})
+        assert log.sync(target) == 3
+        assert log.sync(target) == 0
+
+        # Archiving does not record any changes.
+        log.archive("2020-06-01 00:00:00")
+        assert log.sync(target) == 0
+
+        replica.load_db(target)
+        replica.select_all()
+        log.select_all()
+        assert sorted(replica.rows) == sorted(log.rows)
+        assert replica.rows[0][3:5] == ("edited", "edited")
+
+    def test_sync_ids(self, log, database, tmpdir):
+        """Test syncing archived sessions into a log with rows of its own."""
+
+        _, _, source = database(tmpdir.strpath)
+        _, _, target = database(tmpdir.strpath)
+        log.load_db(source)
+
+        # Archived sessions are part of the initial feed.
+        log.archive("2019-01-01 00:00:00")
+        assert log.enable_change_feed()
+        assert log.sync(target) == 3
+
+        # The target's own sessions are kept; the synced ones get new IDs.
+        replica = Log()
+        replica.load_db(target)
+        replica.select_all()
+        log.select_all()
+        assert len(replica.rows) == 6
+        assert sorted(row[1:] for row in replica.rows[3:]) == \
+            sorted(row[1:] for row in log.rows)
+        own_rows = replica.rows[:3]
+        replica.unload_db()
+
+        # Repeated edits are compacted to one change per session.
+        for i in range(10):
+            log.update_row(3, {"notes": "edit {}".format(i)})
+        log.delete([3])
+        assert log.sync(target) == 1
+        log.cursor.execute("SELECT COUNT(*) FROM sessions_changes "
+                           "WHERE row_id = 3")
+        assert log.cursor.fetchone()[0] == 1
+
+        replica.load_db(target)
+        replica.select_all()
+        assert replica.rows[:3] == own_rows
+        assert len(replica.rows) == 5
+
+
+class TestDuration:
+    """Test the indexed duration column."""
+
+    def test_duration(self, log, database, tmpdir):
+        _, _, db_filepath = database(tmpdir.strpath)
+        log.load_db(db_filepath)
+
+        # Loading a log leaves its schema alone, computing durations
+        # instead.
+        assert log._duration_columns == {"main": False}
+        assert log.total_duration() == 1800 + 1800 + 165600
+        assert "duration_seconds" not in log.cursor.execute(
+                "SELECT sql FROM sqlite_master WHERE name = 'sessions'"
+                ).fetchone()[0]
+
+        # Logs are migrated by maintain(); selected rows are unchanged.
+        log.maintain()
+        log.select_all()
+        assert len(log.rows[0]) == 6
+        assert log.cursor.execute(
+                "SELECT duration_seconds FROM sessions ORDER BY id"
+                ).fetchall() == [(1800,), (1800,), (165600,)]
+
+        # The column follows writes, including to archives.
+        log.update_row(1, {"end": "2018-09-30 01:00:00"})
+        log.add_row({"start": "2021-01-01 09:00:00"})
+        log.archive("2019-01-01 00:00:00")
+        log.maintain()
+        assert log._duration_columns == {"archive_2018": True, "main": True}
+        assert [row[-1] for row in log.longest_sessions()] == [165600, 7200, 1800]
+        assert log.longest_sessions(limit=1)[0][:6] == log.rows[2]
+        assert [row[0] for row in log.longest_sessions(
+            limit=None, min_duration=3600)] == [3, 1]
+        assert log.total_duration() == 165600 + 7200 + 1800
+
+        # Queries on the duration can use its index.
+        for schema in ("main", "archive_2018"):
+            assert log.cursor.execute(
+                    "SELECT id FROM {0}.sessions INDEXED BY sessions_duration "
+                    "WHERE duration_seconds > 3600".format(schema)).fetchall()
+
+
+class TestStatementCache:
+    """Test the cache of built SQL statements."""
+
+    def test_statements(self, log_db):
+        log = log_db
+        log.archive("2019-01-01 00:00:00")
+
+        # Statements are shared by writes to the same subset of columns.
+        log.add_row({"start": "2021-01-01 09:00:00", "project": "a"})
+        log.add_row({"project": "b", "start": "2021-01-02 09:00:00"})
+        log.update_row(4, {"end": "2021-01-01 10:00:00"})
+        log.update_row(5, {"end": "2021-01-02 10:00:00"})
+        # Deletes of 3 and 4 IDs are both padded to 4 placeholders.
+        log.delete([4, 5, 5])
+        log.delete([1, 2, 2, 2])
+        assert sorted(key[:2] for key in log._statements
+                      if key[0] in ("insert", "update", "delete")) == [
+                ("delete", "archive_2018"), ("delete", "main"),
+                ("insert", ("start", "project")), ("update", "main")]
+
+        # Cached filter queries bind the values of the current filters.
+        log.add_row({"start": "2018-06-01 09:00:00",
+                     "end": "2018-06-01 10:00:00", "project": "dummy x"})
+        log.filter_mode = "overlap"
+        log.filters["project"] = "dummy"
+        for start, end, ids in (
+                ("2018-01-01 00:00:00", "2020-12-31 00:00:00", [6, 3]),
+                ("2018-06-01 09:30:00", "2020-01-01 00:00:00", [6]),
+                ("2020-01-02 00:00:00", "2020-01-02 01:00:00", [3])):
+            log.filters["start"], log.filters["end"] = start, end
+            log._statements.clear()
+            log.filter_rows()
+            assert sorted(row[0] for row in log.rows) == sorted(ids)
+            log.filter_rows()
+            assert sorted(row[0] for row in log.rows) == sorted(ids)
+
+    def test_delete_chunks(self, log_db):
+        """Test deleting more IDs than SQLite can bind in one statement."""
+
+        log = log_db
+        log.begin()
+        for i in range(40000):
+            log.add_row({"start": "2021-01-01 09:00:00"})
+        log.commit()
+
+        log._statements.clear()
+        log.delete(list(range(4, 40004)))
+        assert log.cursor.execute(
+                "SELECT COUNT(*) FROM sessions").fetchone()[0] == 3
+
+        # Full chunks share one statement; the last chunk (40000 % 512 = 64
+        # IDs) is padded to a power of two.
+        assert sorted(key[2] for key in log._statements
+                      if key[0] == "delete") == [64, 512]
+
+
+class TestFilterQuery:
+    """Test filtering rows with the filter query language."""
+
+    def test_filter_query(self, log, database, tmpdir):
+        _, _, db_filepath = database(tmpdir.strpath)
+        log.load_db(db_filepath)
+        log.add_row({"start": "2021-03-01 09:00:00", "end": "2021-03-01 11:00:00",
+                     "project": "krono", "tags": "code, review"})
+
+        for text, ids in (
+                ("project:dummy", [1, 2, 3]),
+                ("tag:\"tag 2\"", [2]),
+                ("dummy -project:2 -notes:3", [1]),
+                ("since:2018-10 until:2020", [2, 3]),
+                ("until:2018-09", [1]),
+                ("dur>1h", [3, 4]),
+                ("dur>=1h30m dur<2d -tag:review", [3]),
+                ("tags:code dur<=2h", [4])):
+            log.set_query(text)
+            assert sorted(row[0] for row in log.rows) == ids, text
+
+        # Plans are cached by query text; the SQL built from them depends
+        # only on the query's shape.
+        log.set_query("project:krono")
+        assert [row[0] for row in log.rows] == [4]
+        log.set_query("project:dummy")
+        assert len(log.rows) == 3
+        assert ("query", "project:krono") in log._statements
+        assert len([key for key in log._statements if key[0] == "filter"]) == 7
+
+        # Query terms narrow the start/end criteria.
+        log.filters["start"] = "2018-10-01 00:00:00"
+        log.set_query("since:2018-01-01")
+        assert [row[0] for row in log.rows] == [2, 3, 4]
+
+        for text in ("since:yesterday-ish", "dur>1x", "color:red",
+                     "-since:2020", "project:", "tag:\"unclosed"):
+            with pytest.raises(ValueError):
+                log.set_query(text)
+        assert log.filters["query"] == "since:2018-01-01"
+
+    def test_relative_dates(self, log, database, tmpdir):
+        now = datetime.datetime(2026, 3, 4, 15, 0)
+        for value, bounds in (
+                ("today", ("2026-03-04 00:00:00", "2026-03-04 23:59:59")),
+                ("yesterday", ("2026-03-03 00:00:00", "2026-03-03 23:59:59")),
+                ("this-week", ("2026-03-02 00:00:00", "2026-03-08 23:59:59")),
+                ("last-week", ("2026-02-23 00:00:00", "2026-03-01 23:59:59")),
+                ("last-7d", ("2026-02-26 00:00:00", "2026-03-04 23:59:59")),
+                ("last-month", ("2026-02-01 00:00:00", "2026-02-28 23:59:59")),
+                ("2024-02", ("2024-02-01 00:00:00", "2024-02-29 23:59:59"))):
+            assert FilterQuery.parse_range(value, now) == bounds, value
+        assert FilterQuery("date:this-week since:yesterday").bounds(now) == (
+                "2026-03-03 00:00:00", "2026-03-08 23:59:59")
+
+        # Relative dates are resolved when the rows are selected.
+        _, _, db_filepath = database(tmpdir.strpath)
+        log.load_db(db_filepath)
+        today = datetime.date.today().strftime("%Y-%m-%d")
+        log.add_row({"start": today + " 00:00:01", "end": today + " 00:00:02"})
+        log.set_query("date:today")
+        assert [row[0] for row in log.rows] == [4]
+        assert log.filter_bounds() == (today + " 00:00:00",
+                                       today + " 23:59:59")
+        log.set_query("date:2018-10")
+        assert [row[0] for row in log.rows] == [2]
+        assert [[row[0] for row in rows]
+                for rows in log.iter_filtered(batch_size=1)] == [[2]]
+        with pytest.raises(ValueError):
+            log.set_query("date:last-0d")
+
+        # The date range is narrowed with the start index (added by
+        # maintain(), which also gathers statistics that favour a scan of
+        # so few rows).
+        log._add_start_index("main")
+        query, values = log._filter_query(log.columns)
+        plan = log.cursor.execute("EXPLAIN QUERY PLAN " + query, values).fetchall()
+        assert "sessions_start" in str(plan)
+
+
+class TestMaintain:
+    """Test vacuuming, analyzing and checking a log and its archives."""
+
+    def test_maintain(self, log, database, tmpdir):
+        _, _, db_filepath = database(tmpdir.strpath)
+        log.load_db(db_filepath)
+        log.begin()
+        for i in range(2000):
+            log.add_row({"start": "2021-01-01 09:00:00",
+                         "end": "2021-01-01 10:00:00", "notes": "x" * 200})
+        log.commit()
+        log.archive("2019-01-01 00:00:00")
+        log.cursor.execute("CREATE INDEX sessions_notes ON sessions (notes)")
+
+        # The first run switches to incremental vacuum and analyzes.
+        reports = log.maintain()
+        assert log.cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'sessions_notes'"
+                ).fetchone() is None
+        assert [report["schema"] for report in reports] == [
+                "archive_2018", "main"]
+        assert all(report["analyzed"] for report in reports)
+        assert all(report["bytes_reclaimed"] >= 0 for report in reports)
+        assert all(not report["integrity"] for report in reports)
+        assert log.cursor.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+        # Only the pages freed by deletes are released, and statistics are
+        # only refreshed for tables that changed significantly.
+        log.delete(list(range(4, 1504)))
+        free_pages = log.cursor.execute("PRAGMA freelist_count").fetchone()[0]
+        assert free_pages > 0
+        main = log.maintain(full_check=True)[-1]
+        assert main["free_pages"] == free_pages
+        assert main["bytes_reclaimed"] >= free_pages * 4096
+        assert main["analyzed"]
+        assert log.cursor.execute("PRAGMA freelist_count").fetchone()[0] == 0
+
+        reports = log.maintain()
+        assert [(report["free_pages"], report["analyzed"])
+                for report in reports] == [(0, False), (0, False)]
+        assert len(log.rows) == 503
+
+        log.unload_db()
+        log.load_db(db_filepath, read_only=True)
+        with pytest.raises(RuntimeError):
+            log.maintain()
+
+
+class TestBackup:
+    """Test online backups of a log and its archives."""
+
+    def test_backup(self, log, database, tmpdir):
+        _, _, db_filepath = database(tmpdir.strpath)
+        log.load_db(db_filepath)
+        log.archive("2019-01-01 00:00:00")
+        target = os.path.join(tmpdir.strpath, "backup.db")
+        archive_target = os.path.join(tmpdir.strpath, "backup.2018.db")
+
+        assert log.backup(target, pages=1) == [target, archive_target]
+        backup = Log()
+        backup.load_db(target)
+        backup.attach_archives()
+        log.attach_archives()
+        assert backup.cursor.execute(
+                "SELECT * FROM all_sessions").fetchall() == log.cursor.execute(
+                "SELECT * FROM all_sessions").fetchall()
+        backup.unload_db()
+
+        # Only changed files are copied again.
+        assert log.backup(target) == []
+        log.add_row({"start": "2021-01-01 09:00:00"})
+        assert log.backup(target) == [target]
+
+        # Writes on another connection during a backup are not held up
+        # (the writer does not wait on locks), and the copy includes them.
+        log.begin()
+        for i in range(200):
+            log.add_row({"start": "2021-01-01 09:00:00", "notes": "x" * 500})
+        log.commit()
+        copier = threading.Thread(target=log._backup_file,
+                                  args=(db_filepath, target, 1, 0.002, False))
+        writer = sqlite3.connect(db_filepath, timeout=0)
+        copier.start()
+        for i in range(3):
+            time.sleep(0.02)
+            writer.execute("INSERT INTO sessions (start) VALUES (?)",
+                           ("2021-01-02 09:00:00",))
+            writer.commit()
+        assert copier.is_alive()
+        copier.join()
+        writer.close()
+        conn = sqlite3.connect(target)
+        assert conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] \
+            == log.cursor.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        conn.close()
+
+        # Compressed backups are tracked separately.
+        written = log.backup(target, compress=True)
+        assert written == [target + ".gz", archive_target + ".gz"]
+        with gzip.open(target + ".gz") as f:
+            assert f.read(16) == b"SQLite format 3\x00"
+
@@ -0,0 +1,137 @@
+import curses
+import pytest
+from krono.screen_buffer import ScreenBuffer
+
+class FakeWindow:
+    """
+    Stand-in for a curses window that keeps a grid of characters and counts
+    the approximate number of bytes that would be sent to the terminal:
+    one per character written plus a few per cursor move, clear or scroll.
+    """
+
+    CONTROL_BYTES = 4
+
+    def __init__(self, height, width):
+        self.height = height
+        self.width = width
+        self.grid = [[" "] * width for _ in range(height)]
+        self.attrs = [[curses.A_NORMAL] * width for _ in range(height)]
+        self.y = 0
+        self.x = 0
+        self.bytes_sent = 0
+
+    def getmaxyx(self):
+        return self.height, self.width
+
+    def move(self, y, x):
+        self.y, self.x = y, x
+        self.bytes_sent += self.CONTROL_BYTES
+
+    def addnstr(self, y, x, text, n, attr=curses.A_NORMAL):
+        self.move(y, x)
+        for c in text[:n]:
+            self.grid[y][self.x] = c
+            self.attrs[y][self.x] = attr
+            self.x += 1
+        self.bytes_sent += len(text[:n])
+
+    def clrtoeol(self):
+        for x in range(self.x, self.width):
+            self.grid[self.y][x] = " "
+            self.attrs[self.y][x] = curses.A_NORMAL
+        self.bytes_sent += self.CONTROL_BYTES
+
+    def erase(self):
+        self.__init__(self.height, self.width)
+
+    def scrollok(self, flag):
+        pass
+
+    def scroll(self, num_lines):
+        blank = lambda: [" "] * self.width
+        normal = lambda: [curses.A_NORMAL] * self.width
+        if num_lines > 0:
+            self.grid = self.grid[num_lines:] + [blank() for _ in range(num_lines)]
+            self.attrs = self.attrs[num_lines:] + [normal() for _ in range(num_lines)]
+        else:
+            self.grid = [blank() for _ in range(-num_lines)] + self.grid[:num_lines]
+            self.attrs = [normal() for _ in range(-num_lines)] + self.attrs[:num_lines]
+        self.bytes_sent += self.CONTROL_BYTES
+
+    def noutrefresh(self):
+        pass
+
+    def text(self):
+        return ["".join(row).rstrip() for row in self.grid]
+
+
+def frame(strings, highlighted):
+    return [(string, curses.A_REVERSE if i == highlighted else curses.A_NORMAL)
+            for i, string in enumerate(strings)]
+
+
+class TestScreenBuffer:
+    """Test differential drawing with ScreenBuffer against a fake window."""
+
+    items = ["item {:03d} | some project | some tags".format(i)
+             for i in range(100)]
+
+    def test_draw(self):
+        """Test that redrawing only sends the changed parts of lines."""
+
+        win = FakeWindow(10, 60)
+        screen = ScreenBuffer(win)
+        screen.draw(frame(self.items[:10], 0))
+        assert win.text() == self.items[:10]
+
+        # Redrawing an identical frame should send nothing.
+        win.bytes_sent = 0
+        screen.draw(frame(self.items[:10], 0))
+        assert win.bytes_sent == 0
+
+        # Moving the highlight should only redraw the two affected lines.
+        win.bytes_sent = 0
+        screen.draw(frame(self.items[:10], 1))
+        assert win.bytes_sent <= 2 * (len(self.items[0]) + FakeWindow.CONTROL_BYTES)
+        assert win.attrs[0][0] == curses.A_NORMAL
+        assert win.attrs[1][0] == curses.A_REVERSE
+
+        # Editing a line should only rewrite it from the first change.
+        win.bytes_sent = 0
+        lines = frame(self.items[:10], 1)
+        lines[5] = (self.items[5] + "x", curses.A_NORMAL)
+        screen.draw(lines)
+        assert win.bytes_sent == 1 + FakeWindow.CONTROL_BYTES
+        assert win.text()[5] == self.items[5] + "x"
+
+        # Shortening a line should clear the remainder.
+        lines[5] = ("item", curses.A_NORMAL)
+        screen.draw(lines)
+        assert win.text()[5] == "item"
+
+        # Lines missing from the frame should be blanked.
+        screen.draw(lines[:3])
+        assert win.text()[3:] == [""] * 7
+
+    def test_scroll(self):
+        """Test that scrolling only draws the newly exposed lines."""
+
+        win = FakeWindow(10, 60)
+        screen = ScreenBuffer(win)
+        screen.draw(frame(self.items[:10], 9))
+
+        win.bytes_sent = 0
+        screen.scroll(1)
+        screen.draw(frame(self.items[1:11], 9))
+        assert win.text() == self.items[1:11]
+        full_redraw = 10 * len(self.items[0])
+        assert win.bytes_sent < full_redraw / 4
+
+        screen.scroll(-3)
+        screen.draw(frame(self.items[0:10], 0))
+        assert win.text() == self.items[0:10]
+
+        # Scrolling by a whole screen or more should just clear it.
+        screen.scroll(20)
+        screen.draw(frame(self.items[20:30], 0))
+        assert win.text() == self.items[20:30]
@@ -0,0 +1,96 @@
+import csv
+import io
+import json
+import threading
+import pytest
+try:
+    from http.client import HTTPConnection
+except ImportError:
+    from httplib import HTTPConnection
+from krono.log import Log
+from krono.server import LogServer
+
+@pytest.fixture
+def server(database, tmpdir):
+    """Serve a test log on a free local port."""
+
+    conn, cursor, db_filepath = database(tmpdir.strpath)
+    conn.close()
+    log_server = LogServer(("127.0.0.1", 0), db_filepath, num_workers=2)
+    thread = threading.Thread(target=log_server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield log_server
+    log_server.shutdown()
+    log_server.server_close()
+
+
+def get(server, path):
+    client = HTTPConnection(*server.server_address[:2])
+    client.request("GET", path)
+    response = client.getresponse()
+    body = response.read()
+    client.close()
+    return response, body
+
+
+class TestServer:
+    """Test the read-only HTTP query service."""
+
+    def test_filter(self, server):
+        response, body = get(server, "/filter?project=%25project%202%25")
+        assert response.status == 200
+        assert response.getheader("Transfer-Encoding") == "chunked"
+        rows = json.loads(body.decode())
+        assert len(rows) == 1
+        assert rows[0]["project"] == "dummy project 2"
+
+        # A repeated query is served from the cache.
+        response, cached_body = get(server, "/filter?project=%25project%202%25")
+        assert response.getheader("Content-Length") == str(len(body))
+        assert cached_body == body
+
+        # Writes to the log invalidate the cache.
+        log = Log()
+        log.load_db(server.db_filepath)
+        log.delete([2])
+        log.unload_db()
+        response, body = get(server, "/filter?project=%25project%202%25")
+        assert json.loads(body.decode()) == []
+
+    def test_report_export(self, server):
+        response, body = get(server, "/report?by=project")
+        assert json.loads(body.decode())["dummy project 1"] == 1800
+
+        response, body = get(server, "/export")
+        lines = body.decode().splitlines()
+        assert [json.loads(line)["id"] for line in lines] == [1, 2, 3]
+
+        response, body = get(server, "/export?format=csv")
+        rows = list(csv.reader(io.StringIO(body.decode())))
+        assert rows[0] == ["id", "start", "end", "project", "tags", "notes"]
+        assert len(rows) == 4
+
+    def test_errors(self, server):
+        assert get(server, "/nothing")[0].status == 404
+        assert get(server, "/filter?mode=bad")[0].status == 400
+        assert get(server, "/report?by=notes")[0].status == 400
+        assert get(server, "/export?format=xml")[0].status == 400
+
+    def test_archive_writes(self, server):
+        """Test that writes to archived sessions invalidate the cache."""
+
+        log = Log()
+        log.load_db(server.db_filepath)
+        log.archive("2019-01-01 00:00:00")
+        log.unload_db()
+
+        path = "/filter?project=%25project%201%25"
+        response, body = get(server, path)
+        assert json.loads(body.decode())[0]["notes"] == "dummy notes 1"
+
+        log.load_db(server.db_filepath)
+        log.update_row(1, {"notes": "edited"})
+        log.unload_db()
+        response, body = get(server, path)
+        assert json.loads(body.decode())[0]["notes"] == "edited"
@@ -1,8 +1,10 @@
+import datetime
 import os
 import sqlite3
 import threading
+import time
 import pytest
-from krono.session import Session
+from krono.session import LogindIdleSource, Session, TerminalIdleSource
 
 class TestSessionObject:
     """Test methods for Session."""
@@ -15,3 +17,193 @@ class TestSessionObject:
 
         sess = Session(log, 1, lock=threading.Lock())
         assert sess.lock
+
+
+class FakeIdleSource:
+    """Idle source reporting a settable number of idle seconds."""
+
+    def __init__(self):
+        self.idle = 0
+
+    def idle_seconds(self):
+        return self.idle
+
+
+class TestIdle:
+    """Test idle detection and session splitting."""
+
+    def test_idle_split(self, log, database, tmpdir):
+        _, _, db_filepath = database(tmpdir.strpath)
+        log.load_db(db_filepath)
+
+        writes = []
+        add_row, update_row = log.add_row, log.update_row
+        log.add_row = lambda *args: writes.append("add") or add_row(*args)
+        log.update_row = lambda *args: writes.append("update") or update_row(*args)
+
+        t0 = datetime.datetime(2021, 1, 1, 9, 0, 0)
+        row_id = log.add_row({"start": "2021-01-01 09:00:00", "project": "p"})
+        del writes[:]
+        source = FakeIdleSource()
+        sess = Session(log, row_id, autosave_interval=60, idle_source=source,
+                       idle_threshold=300, sample_interval=5,
+                       row_params={"project": "p"})
+        sess._last_save = t0
+
+        # Sampling while active only writes on autosaves.
+        for seconds in range(5, 185, 5):
+            sess.step(t0 + datetime.timedelta(seconds=seconds))
+        assert writes == ["update", "update"]
+
+        # Going idle closes the row at the last activity; no writes while idle.
+        del writes[:]
+        for seconds in range(480, 3600, 5):
+            source.idle = seconds - 180
+            sess.step(t0 + datetime.timedelta(seconds=seconds))
+        assert writes == ["update"]
+        assert sess.idle
+
+        # Resuming starts a new row.
+        source.idle = 10
+        sess.step(t0 + datetime.timedelta(seconds=3610))
+        assert writes == ["update", "add"]
+        assert sess.last_row_id != row_id
+        sess.stop(t0 + datetime.timedelta(seconds=3700))
+
+        log.select_all()
+        assert log.rows[-2][1:4] == ("2021-01-01 09:00:00",
+                                     "2021-01-01 09:03:00", "p")
+        assert log.rows[-1][1:4] == ("2021-01-01 10:00:00",
+                                     "2021-01-01 10:01:40", "p")
+
+        # Stopping while idle keeps the end time of the last activity.
+        source.idle = 600
+        sess.step(t0 + datetime.timedelta(seconds=4300))
+        del writes[:]
+        sess.stop()
+        assert writes == []
+
+    def test_resume_between_samples(self, log):
+        """Test that activity between two samples resumes the session."""
+
+        log.update_row = lambda row_id, params: None
+        log.add_row = lambda params: 2
+        t0 = datetime.datetime(2021, 1, 1, 9, 0, 0)
+        source = FakeIdleSource()
+        sess = Session(log, 1, idle_source=source, idle_threshold=60)
+        sess._last_save = t0
+
+        source.idle = 60
+        sess.step(t0 + datetime.timedelta(seconds=60))
+        assert sess.idle
+
+        # A keypress 2 s after the previous sample, idle again by the next.
+        source.idle = 63
+        sess.step(t0 + datetime.timedelta(seconds=125))
+        assert not sess.idle
+        assert sess.last_row_id == 2
+
+
+class TestAutosave:
+    """Test the adaptive autosave interval."""
+
+    def test_backoff(self, log):
+        saves = []
+        log.update_row = lambda row_id, params: saves.append(params["end"])
+        t0 = datetime.datetime(2021, 1, 1, 9, 0, 0)
+        sess = Session(log, 1, autosave_interval=60, max_autosave_interval=600)
+        sess._last_save = t0
+
+        for minutes in range(1, 8 * 60 + 1):
+            sess.step(t0 + datetime.timedelta(minutes=minutes))
+
+        # Saves after 1, 3, 7, 15 minutes, then every 10 minutes.
+        assert saves[:5] == ["2021-01-01 09:01:00", "2021-01-01 09:03:00",
+                             "2021-01-01 09:07:00", "2021-01-01 09:15:00",
+                             "2021-01-01 09:25:00"]
+        assert len(saves) == 4 + (8 * 60 - 15) // 10
+
+        # About a tenth of the saves made at a fixed 60 s interval.
+        assert len(saves) < 8 * 60 / 9
+
+    def test_stop(self, log):
+        """Test that stop() wakes the thread and writes the end time."""
+
+        saves = []
+        log.update_row = lambda row_id, params: saves.append(params["end"])
+        sess = Session(log, 1, autosave_interval=3600)
+        sess.start()
+        sess.stop()
+        assert not sess.is_alive()
+        assert len(saves) == 1
+
+    def test_no_busy_wait(self, log):
+        """Test that the thread waits between steps when idle or failing."""
+
+        def count_steps(sess, seconds):
+            steps = []
+            step = sess.step
+            sess.step = lambda now: steps.append(now) or step(now)
+            sess.start()
+            threading.Event().wait(seconds)
+            sess._stop_event.set()
+            sess.join()
+            return len(steps)
+
+        # Idle: only the idle source is sampled, every sample_interval.
+        log.update_row = lambda row_id, params: None
+        source = FakeIdleSource()
+        source.idle = 3600
+        sess = Session(log, 1, autosave_interval=0.05, idle_source=source,
+                       idle_threshold=1, sample_interval=0.2)
+        assert count_steps(sess, 1) <= 6
+        assert sess.idle
+
+        # Failed writes are retried with backoff (0.05, 0.1, 0.2, 0.2, ...).
+        def fail(row_id, params):
+            raise sqlite3.OperationalError("database is locked")
+        log.update_row = fail
+        sess = Session(log, 1, autosave_interval=0.05,
+                       max_autosave_interval=0.2)
+        assert count_steps(sess, 1) <= 7
+
+
+class TestIdleSources:
+    """Test the terminal and logind idle sources."""
+
+    def test_terminal(self):
+        termios = pytest.importorskip("termios")
+        master, slave = os.openpty()
+        stream = os.fdopen(slave)
+        source = TerminalIdleSource(stream)
+        try:
+            with source:
+                assert not termios.tcgetattr(slave)[3] & termios.ICANON
+                source._last_input -= 100
+                assert source.idle_seconds() >= 100
+
+                # Keypresses count as activity before Enter is pressed.
+                reader = threading.Thread(target=source.wait_for_enter)
+                reader.start()
+                os.write(master, b"a")
+                for _ in range(100):
+                    if source.idle_seconds() < 100:
+                        break
+                    time.sleep(0.01)
+                assert source.idle_seconds() < 1
+                assert reader.is_alive()
+
+                os.write(master, b"\n")
+                reader.join(1)
+                assert not reader.is_alive()
+            assert termios.tcgetattr(slave)[3] & termios.ICANON
+            assert source.idle_seconds() == 0
+        finally:
+            stream.close()
+            os.close(master)
+
+    def test_logind(self):
+        output = "IdleHint=yes\nIdleSinceHint=1600000000000000\n"
+        assert LogindIdleSource.parse(output, now=1600000600) == 600
+        assert LogindIdleSource.parse(
+                "IdleHint=no\nIdleSinceHint=0\n", now=1600000600) == 0
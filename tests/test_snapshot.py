@@ -0,0 +1,64 @@
+import math
+import pytest
+
+class TestSnapshot:
+    """Test methods for building and querying a Snapshot."""
+
+    def test_snapshot(self, log_db):
+        """Test Log.snapshot() and Snapshot.from_cursor()."""
+
+        log = log_db
+        snapshot = log.snapshot(batch_size=2)
+        assert len(snapshot) == 3
+        assert list(snapshot.ids) == [1, 2, 3]
+        assert list(snapshot.duration) == [1800.0, 1800.0, 165600.0]
+        assert snapshot.projects == [
+                "dummy project 1", "dummy project 2", "dummy project 3"]
+        assert list(snapshot.project_codes) == [0, 1, 2]
+
+        # Snapshot should be cached until the selection or filters change.
+        assert log.snapshot() is snapshot
+        log.filters["project"] = "dummy project 3"
+        assert log.snapshot() is snapshot
+        log.filter_rows()
+        filtered = log.snapshot()
+        assert filtered is not snapshot
+        assert list(filtered.ids) == [3]
+        assert log.snapshot(selection="filter") is filtered
+        log.filters["project"] = "dummy project 2"
+        assert list(log.snapshot().ids) == [2]
+        assert list(log.snapshot(selection="all").ids) == [1, 2, 3]
+        with pytest.raises(ValueError):
+            log.snapshot(selection="rows")
+
+        # Snapshot should be invalidated by writes, or rebuilt on request.
+        log.update_row(3, {"project": "dummy project 1"})
+        assert log.snapshot() is not filtered
+        snapshot = log.snapshot()
+        assert log.snapshot(refresh=True) is not snapshot
+
+    def test_total_duration(self, log_db):
+        """Test Snapshot.total_duration()."""
+
+        log = log_db
+        log.add_row({"start": "2018-10-01 00:00:00", "project": "open"})
+        log.update_row(2, {"project": "dummy project 1"})
+
+        # The default filters exclude sessions without an end time, unlike
+        # a snapshot of all rows.
+        log.select_all()
+        snapshot = log.snapshot()
+        assert list(snapshot.ids) == [1, 2, 3, 4]
+        assert math.isnan(snapshot.duration[-1])
+
+        totals = snapshot.total_duration(by="project")
+        assert totals == {
+                "dummy project 1": 3600.0,
+                "dummy project 3": 165600.0,
+                "open": 0.0}
+
+        totals = snapshot.total_duration(by="tags")
+        assert totals["dummy tag 3"] == 165600.0
+
+        with pytest.raises(ValueError):
+            snapshot.total_duration(by="notes")